@@ -0,0 +1,88 @@
+import os
+import shutil
+import subprocess
+import tarfile
+import zipfile
+
+RAR_MAGIC = b"Rar!\x1a\x07"
+
+
+def is_rar(path):
+    with open(path, "rb") as file:
+        return file.read(len(RAR_MAGIC)) == RAR_MAGIC
+
+
+def iter_zip(path, suffix):
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            if not info.is_dir() and info.filename.endswith(suffix):
+                with archive.open(info) as member:
+                    yield info.filename, member
+
+
+def iter_tar_stream(fileobj, suffix, mode="r|*"):
+    """Yield the members of a tar stream; in stream mode tarfile never seeks or keeps old members."""
+    with tarfile.open(fileobj=fileobj, mode=mode) as archive:
+        for info in archive:
+            if info.isfile() and info.name.endswith(suffix):
+                yield info.name, archive.extractfile(info)
+
+
+def iter_tar(path, suffix):
+    with open(path, "rb") as file:
+        yield from iter_tar_stream(file, suffix)
+
+
+def iter_rar(path, suffix):
+    """Read a RAR archive through bsdtar (libarchive), or the rarfile package when bsdtar is missing.
+
+    bsdtar rewrites the archive as a tar stream on its stdout, so the members are decompressed
+    in one pass and read straight from the pipe.
+    """
+    bsdtar = shutil.which("bsdtar")
+    if bsdtar:
+        process = subprocess.Popen([bsdtar, "-cf", "-", "@" + os.path.abspath(path)],
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            yield from iter_tar_stream(process.stdout, suffix, mode="r|")
+        finally:
+            process.stdout.close()
+            _, error = process.communicate()
+        if process.returncode:
+            raise RuntimeError(f"bsdtar failed to read {path}: {error.decode('utf-8', 'replace').strip()}")
+        return
+
+    try:
+        import rarfile
+    except ImportError:
+        raise RuntimeError(f"Reading {path} needs bsdtar (libarchive) on the PATH or the rarfile package "
+                           "(pip install rarfile) with unrar installed.")
+    with rarfile.RarFile(path) as archive:
+        for info in archive.infolist():
+            if not info.is_dir() and info.filename.endswith(suffix):
+                with archive.open(info) as member:
+                    yield info.filename, member
+
+
+def iter_archive_members(path, suffix=".xml"):
+    """Iterate over the files of a RAR, zip or tar archive without extracting it to disk.
+
+    Only one member is open at a time and each one is read from the archive as it is consumed,
+    so memory stays bounded by the largest member whatever the size of the archive. A member's
+    file object is only valid until the next one is requested.
+
+    Args:
+        path: .rar, .zip, .tar, .tar.gz, .tar.bz2 or .tar.xz archive
+        suffix: only yield the members whose name ends with it
+
+    Yields:
+        name, fileobj: member name inside the archive and a binary file object reading it
+    """
+    if is_rar(path):
+        yield from iter_rar(path, suffix)
+    elif zipfile.is_zipfile(path):
+        yield from iter_zip(path, suffix)
+    elif tarfile.is_tarfile(path):
+        yield from iter_tar(path, suffix)
+    else:
+        raise ValueError(f"{path} is not a RAR, zip or tar archive")
@@ -0,0 +1,160 @@
+"""FinBERT throughput, one text per forward pass against batched inference.
+
+Collects the texts the sentiment stage scores in the sample transcripts (every presentation
+sentence and every Q&A turn), repeated --scale times, and scores them the way the stage did
+before finbert.FinBert, one tokenizer call and one forward pass per text with autograd on (kept
+below), with FinBert at every --batch-size and no token budget, and with FinBert at every
+--max-tokens budget. It reports sentences per second and the share of the padded tokens that
+are padding, and checks that every text gets the same label and the same scores up to float
+rounding. Texts longer than the 512 tokens FinBERT reads are left out of that check, since the
+former path truncated them and FinBert scores them over overlapping windows. How many of them
+change label is printed after the table. Then it runs the configured budget through an empty sentiment cache in a temporary
+folder, and again once the cache holds every text, as a rerun of the corpus would. The padding,
+batch latency and throughput of every length bucket are printed for each budget, to choose
+max_tokens for the cores of the machine.
+
+--onnx adds the int8 quantized model run by ONNX Runtime (finbert.OnnxFinBert) at every
+budget, exported to --onnx-path first if the file is missing, and ends with its parity against the
+PyTorch FinBert: the share of texts that get the same label, the mean and largest score
+difference, and the texts whose label changed. onnx and onnxruntime must be installed.
+
+The real FinBERT is used, so torch and transformers must be installed and the model downloaded
+on first run. --fake replaces it with the recorded scores of stubs.py, which only shows the
+overhead around the model.
+
+Example:
+python benchmarks/bench_finbert.py
+python benchmarks/bench_finbert.py --batch-size 8 --batch-size 32 --batch-size 64 --scale 2
+python benchmarks/bench_finbert.py --fake
+python benchmarks/bench_finbert.py --max-tokens 2048 --max-tokens 8192 --max-tokens 32768
+python benchmarks/bench_finbert.py --onnx --batch-size 32
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PIPELINE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PIPELINE_DIR))
+
+import stubs
+import synthetic
+
+
+# SentimentAnalysisProcessor.get_presentation_sentiment_scores before it used FinBert
+def legacy_scores(tokenizer, model, texts):
+    import torch
+    scores = []
+    for text in texts:
+        inputs = tokenizer(text, padding=True, truncation=True, return_tensors='pt')
+        outputs = model(**inputs)
+        scores.append(tuple(torch.nn.functional.softmax(outputs.logits, dim=-1)[0].tolist()))
+    return scores
+
+
+def sample_texts(scale):
+    """Presentation sentences and Q&A turns of the sample transcripts, as the sentiment stage sends them."""
+    from sentiment_analysis_processor import SentimentAnalysisProcessor
+    processor = SentimentAnalysisProcessor()
+    texts = []
+    for root in synthetic.load_samples().values():
+        synthetic.strip_enrichment(root)
+        for text in processor.extract_presentation_statements(root)["Statement"]:
+            texts += processor.split_sentences(text)
+        texts += list(processor.extract_qa_text(root)["Text"])
+    return texts * scale
+
+
+def compare(expected, scores, skip=()):
+    """Labels that differ and the largest score difference, leaving out the texts at the indices in skip."""
+    from finbert import label
+    pairs = [(a, b) for i, (a, b) in enumerate(zip(expected, scores)) if i not in skip]
+    changed = sum(label(a) != label(b) for a, b in pairs)
+    difference = max(abs(x - y) for a, b in pairs for x, y in zip(a, b))
+    return changed, difference
+
+
+def parity(texts, expected, scores):
+    """Print how far the scores of another backend are from the PyTorch ones."""
+    from finbert import label
+    changed = [i for i, (a, b) in enumerate(zip(expected, scores)) if label(a) != label(b)]
+    differences = [abs(x - y) for a, b in zip(expected, scores) for x, y in zip(a, b)]
+    print(f"onnx int8 against PyTorch: same label for {1 - len(changed) / len(texts):.2%} of {len(texts)} texts, "
+          f"score difference mean {sum(differences) / len(differences):.2e} max {max(differences):.2e}")
+    for i in changed:
+        rounded = [tuple(round(x, 4) for x in row) for row in (expected[i], scores[i])]
+        print(f"  {label(expected[i])} {rounded[0]} -> {label(scores[i])} {rounded[1]}: {texts[i][:80]!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-text and batched FinBERT inference.")
+    parser.add_argument("--batch-size", type=int, action="append", help="FinBert batch size, can be repeated. Defaults to 1, 8, 32 and 64.")
+    parser.add_argument("--max-tokens", type=int, action="append", help="Padded tokens per forward pass, can be repeated. Defaults to 2048, 8192 and 16384.")
+    parser.add_argument("--scale", type=int, default=1, help="Times the sample texts are repeated.")
+    parser.add_argument("--fake", action="store_true", help="Use the recorded scores of stubs.py instead of the real model.")
+    parser.add_argument("--onnx", action="store_true", help="Also run the int8 quantized model with ONNX Runtime and check its parity.")
+    parser.add_argument("--onnx-path", type=str, default=None, help="Quantized model file, exported if missing. Defaults to onnx_path of config.ini.")
+    args = parser.parse_args()
+
+    if args.fake:
+        stubs.install()
+    from finbert import MAX_TOKENS, ONNX_PATH, FinBert, OnnxFinBert
+    from sentiment_cache import SentimentCache
+    engine = FinBert()
+    engine.warm_up()
+    texts = sample_texts(args.scale)
+
+    start = time.perf_counter()
+    expected = legacy_scores(engine.tokenizer, engine.model, texts)
+    legacy = time.perf_counter() - start
+    windows = engine.windows(texts)
+    windowed = {i for i, text in enumerate(texts) if text in windows}
+    print(f"{len(texts)} texts, {sum(len(text) for text in texts)} characters")
+    print(f"{'mode':<18}{'seconds':>10}{'sentences/s':>14}{'speedup':>10}{'padding':>9}{'labels changed':>16}{'max score diff':>16}")
+    print(f"{'one per pass':<18}{legacy:>10.2f}{len(texts) / legacy:>14.1f}{1:>10.2f}{0:>9.1%}{0:>16}{0:>16.2e}")
+    batch_sizes = args.batch_size if args.batch_size else [1, 8, 32, 64]
+    budgets = args.max_tokens if args.max_tokens else [2048, 8192, 16384]
+    # (name, engine, batch size, max tokens, cache), the models are loaded once whatever the number of engines
+    runs = [("batch " + str(batch_size), engine, batch_size, None, None) for batch_size in batch_sizes]
+    budget_engines = {budget: FinBert() for budget in budgets}
+    runs += [("budget " + str(budget), budget_engines[budget], engine.batch_size, budget, None) for budget in budgets]
+    cache = SentimentCache(os.path.join(tempfile.mkdtemp(), "sentiment_cache.db"))
+    runs += [("cold cache", engine, engine.batch_size, MAX_TOKENS, cache), ("warm cache", engine, engine.batch_size, MAX_TOKENS, cache)]
+    if args.onnx:
+        onnx = OnnxFinBert(path=args.onnx_path if args.onnx_path else ONNX_PATH)
+        onnx.session
+        runs += [("onnx budget " + str(budget), onnx, onnx.batch_size, budget, None) for budget in budgets]
+    for name, run_engine, batch_size, max_tokens, run_cache in runs:
+        run_engine.batch_size = batch_size
+        run_engine.max_tokens = max_tokens
+        run_engine.cache = run_cache
+        run_engine.reset_stats()
+        start = time.perf_counter()
+        scores = run_engine.score(texts)
+        seconds = time.perf_counter() - start
+        changed, difference = compare(expected, scores, windowed)
+        rows = run_engine.bucket_stats()
+        padded = sum(row["padded"] for row in rows)
+        padding = 1 - sum(row["tokens"] for row in rows) / padded if padded else 0.0
+        print(f"{name:<18}{seconds:>10.2f}{len(texts) / seconds:>14.1f}{legacy / seconds:>10.2f}{padding:>9.1%}"
+              f"{changed:>16}{difference:>16.2e}")
+        if name == "cold cache":
+            # PyTorch scores with the long texts windowed, the reference of the ONNX parity
+            reference = scores
+    if windowed:
+        changed, difference = compare([expected[i] for i in windowed], [reference[i] for i in windowed])
+        print(f"\n{len(windowed)} texts over 512 tokens, scored over {sum(len(windows[texts[i]]) for i in windowed)} windows "
+              f"({engine.aggregation}) instead of truncated: {changed} labels changed, max score diff {difference:.2e}")
+    for budget, budget_engine in budget_engines.items():
+        print(f"\nmax_tokens {budget}, batch size {budget_engine.batch_size}")
+        budget_engine.report()
+    stats = cache.stats()
+    print(f"\ncache: {sum(stats['entries'].values())} texts stored, hit rate {stats['hit_rate']:.1%}")
+    if args.onnx:
+        parity(texts, reference, scores)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Transcript reading time: native reader against the aspose.words -> .docx -> python-docx path.
+
+For every transcript in the folder (sample_data by default) it times document_reader.read_document()
+and the conversion the parser used before: aspose.words loads the file and saves it as .docx,
+which python-docx opens again. The old path runs in a temporary folder, as the parser ran it
+in the working directory. It also checks that both readers give the parser the same
+structure: the text of the paragraphs outside tables, leaving out the watermark an unlicensed
+aspose.words adds, and the text of every table cell.
+
+aspose-words and python-docx are only needed for the comparison; without them only the native
+reader is timed.
+
+Example:
+python benchmarks/bench_reader.py
+python benchmarks/bench_reader.py --file-dir "transcripts/BK" --repeat 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PIPELINE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PIPELINE_DIR))
+
+from document_reader import read_document
+
+ASPOSE_WATERMARKS = ("Evaluation Only. Created with Aspose.Words", "Created with an evaluation copy of Aspose.Words")
+
+
+def read_with_aspose(path, work_dir):
+    import aspose.words as aw
+    import docx
+    docx_path = os.path.join(work_dir, Path(path).stem + ".docx")
+    aw.Document(path).save(docx_path)
+    doc = docx.Document(docx_path)
+    os.remove(docx_path)
+    return doc
+
+
+def structure(doc):
+    paragraphs = [p.text for p in doc.paragraphs if not p.text.startswith(ASPOSE_WATERMARKS)]
+    tables = [[[cell.text.strip() for cell in row.cells] for row in table.rows] for table in doc.tables]
+    return paragraphs, tables
+
+
+def compare(native, legacy):
+    """Describe the first difference between the two structures, or return None."""
+    native_paragraphs, native_tables = structure(native)
+    legacy_paragraphs, legacy_tables = structure(legacy)
+    if native_paragraphs != legacy_paragraphs:
+        for i, (a, b) in enumerate(zip(native_paragraphs, legacy_paragraphs)):
+            if a != b:
+                return f"paragraph {i}: {a[:40]!r} != {b[:40]!r}"
+        return f"{len(native_paragraphs)} paragraphs != {len(legacy_paragraphs)}"
+    if native_tables != legacy_tables:
+        for i, (a, b) in enumerate(zip(native_tables, legacy_tables)):
+            if a != b:
+                return f"table {i} differs"
+        return f"{len(native_tables)} tables != {len(legacy_tables)}"
+    return None
+
+
+def timed(fn, repeat):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        seconds.append(time.perf_counter() - start)
+    return result, statistics.median(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the native transcript reader with the aspose.words conversion.")
+    parser.add_argument("--file-dir", type=str, default=str(PIPELINE_DIR / "sample_data"), help="Directory containing the .rtf transcripts.")
+    parser.add_argument("--repeat", type=int, default=3, help="Reads per file and reader; the median is reported.")
+    args = parser.parse_args()
+
+    try:
+        import aspose.words  # noqa: F401
+        import docx  # noqa: F401
+        legacy = True
+    except ImportError as e:
+        print(f"Skipping the aspose.words path: {e}")
+        legacy = False
+
+    files = sorted(f for f in os.listdir(args.file_dir) if f.endswith(".rtf"))
+    work_dir = tempfile.mkdtemp()
+    print(f"{'file':<60}{'native ms':>11}{'aspose ms':>11}{'speedup':>9}  structure")
+    native_total = legacy_total = 0.0
+    for filename in files:
+        path = os.path.join(args.file_dir, filename)
+        native, native_seconds = timed(lambda: read_document(path), args.repeat)
+        native_total += native_seconds
+        line = f"{filename[:58]:<60}{native_seconds * 1000:>11.1f}"
+        if legacy:
+            old, legacy_seconds = timed(lambda: read_with_aspose(path, work_dir), args.repeat)
+            legacy_total += legacy_seconds
+            difference = compare(native, old)
+            line += f"{legacy_seconds * 1000:>11.1f}{legacy_seconds / native_seconds:>8.1f}x  {difference or 'same'}"
+        print(line)
+    os.rmdir(work_dir)
+
+    line = f"{'total':<60}{native_total * 1000:>11.1f}"
+    if legacy and native_total:
+        line += f"{legacy_total * 1000:>11.1f}{legacy_total / native_total:>8.1f}x"
+    print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Speaker resolution time against the size of the speaker registry.
+
+Builds synthetic registries (names and companies drawn from global_speaker.json, numbered so
+every person is distinct) and resolves call participants against them, half of them known
+people with a few characters changed and half new people from known companies. It reports the
+time per participant of SpeakerIndex, first with an empty company cache (the first call
+from a company) and then warm, and of the linear fuzz.ratio scan on the smaller registries,
+checking both find the same people.
+
+Example:
+python benchmarks/bench_speakers.py
+python benchmarks/bench_speakers.py --size 1000 --size 100000 --linear-max 10000
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+PIPELINE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PIPELINE_DIR))
+
+from fuzzywuzzy import fuzz
+from speaker_index import SpeakerIndex
+
+
+def linear_match(registry, person):
+    for node in registry.values():
+        if fuzz.ratio(node["name"], person["name"]) * fuzz.ratio(node["company"], person["company"]) / 10000 > 0.65:
+            return node
+    return None
+
+
+def build_registry(known, size, rng):
+    companies = sorted({person["company"] for person in known})
+    # About 20 people per company, like the banks and brokers covering a sector
+    companies += [f"{rng.choice(companies)} {i}" for i in range(size // 20)]
+    registry = {}
+    for i in range(size):
+        person = rng.choice(known)
+        registry[str(i + 1)] = {"name": f"{person['name']} {i}", "company": rng.choice(companies), "id": str(i + 1)}
+    return registry
+
+
+def participants(registry, count, rng):
+    people = list(registry.values())
+    result = []
+    for i in range(count):
+        person = rng.choice(people)
+        if i % 2:
+            result.append({"name": "New " + person["name"][::-1], "company": person["company"]})
+        else:
+            name = list(person["name"])
+            name[rng.randrange(len(name))] = rng.choice("aeiou")
+            result.append({"name": "".join(name), "company": person["company"]})
+    return result
+
+
+def per_query(fn, queries):
+    start = time.perf_counter()
+    results = [fn(query) for query in queries]
+    return results, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time speaker resolution against registries of growing size.")
+    parser.add_argument("--size", type=int, action="append", help="Registry size, can be repeated. Defaults to 1k, 10k and 100k.")
+    parser.add_argument("--queries", type=int, default=40, help="Participants resolved per registry.")
+    parser.add_argument("--linear-max", type=int, default=10000, help="Largest registry the linear scan is run on.")
+    args = parser.parse_args()
+
+    with open(PIPELINE_DIR / "global_speaker.json", "r", encoding="utf-8") as file:
+        known = list(json.load(file).values())
+    rng = random.Random(0)
+
+    print(f"{'registry':>10}{'index cold ms':>15}{'index warm ms':>15}{'linear ms':>12}{'speedup':>10}  same matches")
+    for size in args.size if args.size else [1000, 10000, 100000]:
+        registry = build_registry(known, size, rng)
+        queries = participants(registry, args.queries, rng)
+        index = SpeakerIndex(registry)
+        found, cold = per_query(index.match, queries)
+        _, warm = per_query(index.match, queries)
+        line = f"{size:>10}{cold:>15.2f}{warm:>15.2f}"
+        if size <= args.linear_max:
+            expected, linear = per_query(lambda person: linear_match(registry, person), queries)
+            same = all(a is b for a, b in zip(found, expected))
+            line += f"{linear:>12.2f}{linear / warm:>9.0f}x  {same}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""Offline per-stage throughput of the pipeline.
+
+Runs the stage processors on the sample transcripts (sample_data for parsing, sample_output with
+the enrichment tags stripped for the other stages), scaled up by the synthetic generator, with
+FinBERT, OpenAI, Yahoo Finance and Whisper replaced by the fakes in stubs.py. No network access,
+API key or model weights are needed, so the numbers only move when the pipeline code changes.
+NLTK's punkt and stopwords data must be installed for the emotion stage.
+
+For every scale and stage it reports the median wall time over the repeats, the throughput in
+speaker turns and characters per second, and the counters recorded while the stage ran
+(FinBERT forward passes and model loads, OpenAI calls and tokens, yfinance requests). Save a run
+with --json and pass it as --baseline to a later run to see the speedup of every stage.
+
+The stock stage (Whisper time stamps and minute prices) is quadratic in the length of the call,
+so it is only run when asked for.
+
+Example:
+python benchmarks/bench_stages.py
+python benchmarks/bench_stages.py --scale 1 --scale 10 --scale 100 --json bench.json
+python benchmarks/bench_stages.py --stage sentiment --stage emotion --baseline bench.json
+python benchmarks/bench_stages.py --stage stock --scale 1 --finbert-latency 0.02 --openai-latency 0.5
+"""
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+PIPELINE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PIPELINE_DIR))
+
+import stubs
+import synthetic
+from metrics import METRICS
+
+SAMPLE_DATA = PIPELINE_DIR / "sample_data"
+
+STAGE_ORDER = ["parse", "sentiment", "emotion", "summary", "prices", "index", "stock"]
+# Stages whose tags another stage reads
+DEPS = {"emotion": ["sentiment"]}
+DEFAULT_STAGES = ["parse", "sentiment", "emotion", "summary", "prices", "index"]
+
+
+class StockStage:
+    """process_root adapter for TimeStampStockProcessor, which otherwise works on files."""
+
+    def __init__(self):
+        from timeStamp_stock_processor import TimeStampStockProcessor
+        self.processor = TimeStampStockProcessor()
+
+    def process_root(self, root, file_name="transcript"):
+        sp = self.processor
+        sp.global_time, sp.global_price = [], []
+        sp.model.script = root
+        result = sp.model.transcribe(file_name + ".mp3")
+        time, ticker = sp.timeAndTicker(root)
+        time_et = sp.convert_gmt_to_et(time)
+        # Scaled calls run for days
+        end = time_et + timedelta(days=7)
+        stock_data, sp500_data, kbw_data = [sp.load_daily_stock_data(symbol, time_et, end) for symbol in (ticker, "^GSPC", "^BKX")]
+        root = sp.add_presentation_stockprice_to_xml(root, time, stock_data, sp500_data, kbw_data, result)
+        return sp.add_QA_stockprice_to_xml(root, time, stock_data, sp500_data, kbw_data, result)
+
+
+def build_processors(stages):
+    processors = {}
+    if "sentiment" in stages:
+        from sentiment_analysis_processor import SentimentAnalysisProcessor
+        # The fake FinBERT of stubs.py stands in for the PyTorch model only. Without the sentiment
+        # cache every repeat, and every copy of a transcript at a larger scale, is scored again
+        processors["sentiment"] = SentimentAnalysisProcessor(backend="torch", cache=None)
+    if "emotion" in stages:
+        from emotion_classification_processor import EmotionClassificationProcessor
+        processors["emotion"] = EmotionClassificationProcessor()
+    if "summary" in stages:
+        from summary_processor import SummaryProcessor
+        processors["summary"] = SummaryProcessor()
+    if "prices" in stages:
+        from header_price_processor import HeaderPriceProcessor
+        processors["prices"] = HeaderPriceProcessor()
+    if "index" in stages:
+        from indexInfo_processor import IndexProcessor
+        processors["index"] = IndexProcessor()
+    if "stock" in stages:
+        processors["stock"] = StockStage()
+    return processors
+
+
+def stage_counters(record, calls_before):
+    counters = dict(record["counters"])
+    for name, value in stubs.CALLS.items():
+        if name.endswith("_loads") and value > calls_before.get(name, 0):
+            counters[name] = value - calls_before.get(name, 0)
+    return counters
+
+
+def timed(stage, label, fn, quiet):
+    """Run fn inside a metrics stage, returning its result, wall time and counters."""
+    calls_before = dict(stubs.CALLS)
+    with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+        with METRICS.stage(stage, label) as record:
+            output = fn()
+    return output, record["wall_seconds"], stage_counters(record, calls_before)
+
+
+def add_counters(total, counters):
+    for name, value in counters.items():
+        total[name] = total.get(name, 0) + value
+
+
+def bench_parse(repeat, quiet):
+    from financial_tables import FinancialTableStore
+    from transcript_parser import TranscriptParser
+    parser = TranscriptParser(table_store=FinancialTableStore(os.path.join(tempfile.mkdtemp(), "financial_tables")))
+    files = sorted(f for f in os.listdir(SAMPLE_DATA) if f.endswith(".rtf"))
+    seconds = [0.0] * repeat
+    counters = {}
+    turns = chars = 0
+    for filename in files:
+        for r in range(repeat):
+            (root, _), wall, stage_counts = timed("parse", filename, lambda: parser.parse_file(str(SAMPLE_DATA), filename), quiet)
+            seconds[r] += wall
+        add_counters(counters, stage_counts)
+        turns += synthetic.turn_count(root)
+        chars += synthetic.char_count(root)
+    return [result_row("sample_data", "parse", seconds, turns, chars, counters)]
+
+
+def bench_scale(samples, factor, stages, processors, repeat, quiet):
+    run_order = [s for s in STAGE_ORDER if s in processors]
+    seconds = {stage: [0.0] * repeat for stage in run_order}
+    counters = {stage: {} for stage in run_order}
+    turns = chars = 0
+    for name, base in samples.items():
+        scaled = synthetic.scale_transcript(base, factor)
+        turns += synthetic.turn_count(scaled)
+        chars += synthetic.char_count(scaled)
+        label = f"{name}-x{factor}"
+        for r in range(repeat):
+            tree = copy.deepcopy(scaled)
+            for stage in run_order:
+                stage_input = tree
+                tree, wall, stage_counts = timed(stage, label, lambda: processors[stage].process_root(stage_input, label), quiet)
+                seconds[stage][r] += wall
+                if r == 0:
+                    add_counters(counters[stage], stage_counts)
+    return [result_row(f"x{factor}", stage, seconds[stage], turns, chars, counters[stage])
+            for stage in run_order if stage in stages]
+
+
+def result_row(inputs, stage, seconds, turns, chars, counters):
+    median = statistics.median(seconds)
+    return {
+        "input": inputs,
+        "stage": stage,
+        "turns": turns,
+        "chars": chars,
+        "seconds": round(median, 6),
+        "turns_per_second": round(turns / median, 2) if median else None,
+        "kchars_per_second": round(chars / median / 1000, 2) if median else None,
+        "counters": counters,
+    }
+
+
+def print_results(results, baseline=None):
+    previous = {(row["input"], row["stage"]): row for row in baseline} if baseline else {}
+    header = f"{'input':<12}{'stage':<11}{'turns':>7}{'median s':>10}{'turns/s':>10}{'kchar/s':>10}"
+    print(header + (f"{'speedup':>9}" if baseline else "") + "  counters")
+    for row in results:
+        line = (f"{row['input']:<12}{row['stage']:<11}{row['turns']:>7}{row['seconds']:>10.3f}"
+                f"{row['turns_per_second'] or 0:>10.1f}{row['kchars_per_second'] or 0:>10.1f}")
+        if baseline:
+            before = previous.get((row["input"], row["stage"]))
+            speedup = before["seconds"] / row["seconds"] if before and row["seconds"] else None
+            line += f"{speedup:>8.2f}x" if speedup else f"{'-':>9}"
+        counters = ", ".join(f"{name}={value}" for name, value in sorted(row["counters"].items()))
+        print(f"{line}  {counters}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline per-stage throughput benchmark with stubbed models.")
+    parser.add_argument("--stage", action="append", choices=STAGE_ORDER, help="Stage to benchmark, can be repeated. Defaults to every stage but stock.")
+    parser.add_argument("--scale", type=int, action="append", help="Transcript scale factor, can be repeated. Defaults to 1 and 10.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; the median is reported.")
+    parser.add_argument("--json", type=str, help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", type=str, help="JSON results of an earlier run to compare against.")
+    parser.add_argument("--finbert-latency", type=float, default=0.0, help="Seconds added to every FinBERT forward pass.")
+    parser.add_argument("--openai-latency", type=float, default=0.0, help="Seconds added to every OpenAI request.")
+    parser.add_argument("--yfinance-latency", type=float, default=0.0, help="Seconds added to every Yahoo Finance request.")
+    parser.add_argument("--verbose", action="store_true", help="Show the progress output of the stages.")
+    args = parser.parse_args()
+
+    stages = args.stage if args.stage else DEFAULT_STAGES
+    scales = args.scale if args.scale else [1, 10]
+    latency = stubs.Latency(finbert=args.finbert_latency, openai=args.openai_latency, yfinance=args.yfinance_latency)
+    stubs.install(latency=latency)
+    os.chdir(PIPELINE_DIR)
+    # Start from an empty price store, so every run asks the fake Yahoo Finance for the same days
+    from market_data import MARKET_DATA
+    MARKET_DATA.set_path(os.path.join(tempfile.mkdtemp(), "market_data.db"))
+
+    results = []
+    if "parse" in stages:
+        try:
+            results += bench_parse(args.repeat, not args.verbose)
+        except ImportError as e:
+            print(f"Skipping parse: {e}")
+
+    enrich = [s for s in stages if s != "parse"]
+    if enrich:
+        needed = set(enrich) | {dep for stage in enrich for dep in DEPS.get(stage, [])}
+        processors = build_processors(needed)
+        samples = synthetic.load_samples()
+        for factor in scales:
+            results += bench_scale(samples, factor, enrich, processors, args.repeat, not args.verbose)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+    print_results(results, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=4)
+        print(f"Results saved in: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Startup time of each upstream_pipeline.py CLI path.
+
+Every scenario runs in a fresh interpreter (run from the pipeline folder) and measures the time from
+process start until the path is ready to touch its first file: imports, processor construction
+and whatever models the path loads up front. The "eager" scenario loads every model and
+library before starting, which is what every CLI path used to do.
+
+Example:
+python benchmarks/bench_startup.py --repeat 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+PIPELINE_DIR = Path(__file__).resolve().parent.parent
+
+HEAVY_MODULES = ["torch", "transformers", "openai", "whisper", "sklearn", "aspose", "matplotlib", "yfinance"]
+
+SCENARIOS = {
+    "generate-from-rar": """
+import upstream_pipeline
+""",
+    "single file / folder": """
+import upstream_pipeline
+from file_processor import FileProcessor
+FileProcessor(file_dir=".", save_dir=SAVE_DIR, use_cache=False)
+""",
+    "single file --add-stock": """
+import upstream_pipeline
+from file_processor import FileProcessor
+from timeStamp_stock_processor import TimeStampStockProcessor
+FileProcessor(file_dir=".", save_dir=SAVE_DIR, use_cache=False)
+TimeStampStockProcessor()
+""",
+    "eager (previous startup of every path)": """
+import upstream_pipeline
+from file_processor import FileProcessor
+from timeStamp_stock_processor import TimeStampStockProcessor
+from resources import ensure_nltk_data
+import aspose.words, docx, yfinance, whisper, sklearn.feature_extraction.text, matplotlib.pyplot
+FileProcessor(file_dir=".", save_dir=SAVE_DIR, use_cache=False).warm_up()
+ensure_nltk_data("punkt")
+""",
+}
+
+RUNNER = """
+import time
+_start = time.perf_counter()
+import json, sys
+SAVE_DIR = {save_dir!r}
+{body}
+print(json.dumps({{"seconds": time.perf_counter() - _start,
+                  "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def run_scenario(body, save_dir):
+    code = RUNNER.format(save_dir=save_dir, body=body, heavy=HEAVY_MODULES)
+    completed = subprocess.run([sys.executable, "-c", code], cwd=PIPELINE_DIR,
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure startup time of each upstream_pipeline CLI path.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario; the median is reported.")
+    args = parser.parse_args()
+
+    save_dir = tempfile.mkdtemp()
+    print(f"{'scenario':<42}{'median s':>10}{'min s':>10}  heavy modules loaded")
+    for name, body in SCENARIOS.items():
+        try:
+            runs = [run_scenario(body, save_dir) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"{name:<42}{'failed':>10}{'':>10}  {e}")
+            continue
+        seconds = [run["seconds"] for run in runs]
+        loaded = ", ".join(runs[-1]["loaded"]) or "-"
+        print(f"{name:<42}{statistics.median(seconds):>10.2f}{min(seconds):>10.2f}  {loaded}")
+
+
+if __name__ == "__main__":
+    main()
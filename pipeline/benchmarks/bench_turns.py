@@ -0,0 +1,248 @@
+"""Speaker turn segmentation time on Presentation and Q&A sections of growing length.
+
+Reads the sample transcripts, repeats the exchanges of their Q&A section (10x by default, the
+closing remarks stay at the end) and builds the Presentation and Q&A sections with
+TranscriptParser and with the line-by-line loops it used before speaker_turns.iter_turns, which
+are kept below. It reports the median time of both and checks they build the same XML.
+
+The participants are resolved against a copy of the speaker registry in a temporary folder.
+
+Example:
+python benchmarks/bench_turns.py
+python benchmarks/bench_turns.py --scale 1 --scale 10 --scale 100 --repeat 5
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PIPELINE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PIPELINE_DIR))
+
+from document_reader import read_document
+from speaker_registry import SpeakerRegistry
+from transcript_parser import TranscriptParser
+from xml_io import ET
+
+
+# TranscriptParser.process_presentation and process_dialog before they used iter_turns
+def legacy_presentation(dialog, speaker_list, name):
+    paragraph = dialog.split('\n')
+
+    conversation = ET.Element("section", attrib={"name": name})
+    i = 0
+    while i < len(paragraph):
+        speaker_name = re.sub(r'\s+', ' ', paragraph[i].strip())
+        if speaker_name  in speaker_list:
+            id = speaker_list[speaker_name]["id"]
+            title = paragraph[i+1].strip()
+
+            if title != speaker_list[speaker_name]["origin position"]:
+                origin_position = speaker_list[speaker_name]["origin position"]
+                parts = title.split(origin_position)
+                other_part = parts[1] if len(parts) > 1 else ""
+
+                text = other_part.strip() + "\n" if other_part!="" else ""
+            else:
+                text = ""
+
+            statement = ET.SubElement(conversation, "statement")
+            speaker_element = ET.SubElement(statement, "speaker", id=id, position=speaker_list[speaker_name]["origin position"])
+            speaker_element.text = re.sub(r'\s+', ' ', paragraph[i].strip())
+            para = ET.SubElement(speaker_element, "text")
+            i += 2
+            while i < len(paragraph) and re.sub(r'\s+', ' ', paragraph[i].strip()) not in speaker_list and paragraph[i].strip()!= "Operator":
+                if len(paragraph[i].strip()) != 0:
+                    text += paragraph[i] + "\n"
+                i += 1
+
+            para.text = text.strip()
+
+        elif "Operator" in paragraph[i]:
+            id = "0"
+            position = "Operator"
+            statement = ET.SubElement(conversation, "statement")
+            speaker_element = ET.SubElement(statement, "speaker", id=id, position=position)
+            speaker_element.text = "Operator"
+            text = ""
+            para = ET.SubElement(speaker_element, "text")
+            i += 1
+            while i < len(paragraph) and re.sub(r'\s+', ' ', paragraph[i].strip()) not in speaker_list:
+                if len(paragraph[i].strip()) != 0:
+                    text += paragraph[i] + "\n"
+                i += 1
+            para.text = text.strip()
+
+        else:
+            i += 1
+    return conversation
+
+
+def legacy_dialog(dialog, speaker_list, name):
+    question_id = -1
+    followup_id = -1
+    end = False
+    paragraph = dialog.split('\n')
+    cur_question = None
+    conversation = ET.Element("section", attrib={"name": name})
+    i = 0
+    hasSub = False
+    last_question_element = None
+    last_question_answered = True
+    while i < len(paragraph):
+        speaker_name = re.sub(r'\s+', ' ', paragraph[i].strip())
+        if speaker_name in speaker_list:
+            id = speaker_list[speaker_name]["id"]
+            title = paragraph[i+1].strip()
+            if title != speaker_list[speaker_name]["origin position"]:
+                origin_position = speaker_list[speaker_name]["origin position"]
+                parts = title.split(origin_position)
+                other_part = parts[1] if len(parts) > 1 else ""
+
+                text = other_part.strip() + "\n" if other_part!="" else ""
+            else:
+                text = ""
+            if end:
+                context = ET.SubElement(conversation, "ending", id = str(question_id))
+
+            elif cur_question == None:
+                if last_question_element is not None and not last_question_answered:
+                    if last_question_element.tag =="question":
+                        question_id-=1
+                    last_question_element.tag = "other"
+                followup_id = -1
+                context = ET.SubElement(conversation, "question", id = str(question_id))
+                cur_question = paragraph[i].strip()
+                last_question_element = context
+                last_question_answered = False
+            elif paragraph[i].strip() == cur_question :
+                if last_question_element is not None and not last_question_answered:
+                    if last_question_element.tag =="question":
+                        question_id-=1
+                    elif last_question_element.tag =="followQuestion":
+                        followup_id -=1
+                    last_question_element.tag = "other"
+
+                followup_id += 1
+                context = ET.SubElement(conversation, "followQuestion", id=str(followup_id),  question_id = str(question_id))
+                hasSub = True
+                last_question_element = context
+                last_question_answered = False
+            elif hasSub and paragraph[i].strip()!= cur_question:
+                context = ET.SubElement(conversation, "followAnswer", id=str(followup_id),  question_id = str(question_id))
+                hasSub = False
+                last_question_answered = True
+            else:
+                context = ET.SubElement(conversation, "answer", id = str(question_id))
+                last_question_answered = True
+            speaker_element = ET.SubElement(context, "speaker", id=id, position=speaker_list[speaker_name]["origin position"])
+            speaker_element.text = re.sub(r'\s+', ' ', paragraph[i].strip())
+
+            para = ET.SubElement(speaker_element, "text")
+            i += 2
+            while i < len(paragraph) and re.sub(r'\s+', ' ', paragraph[i].strip()) not in speaker_list and paragraph[i].strip()!= "Operator":
+                if len(paragraph[i].strip()) != 0:
+                    text += paragraph[i] + "\n"
+                i += 1
+            para.text = text.strip()
+
+        elif "Operator" in paragraph[i]:
+            if last_question_element is not None and not last_question_answered:
+                if last_question_element.tag =="question":
+                    question_id-=1
+                last_question_element.tag = "other"
+            last_question_element = None
+            last_question_answered = False
+            id = "0"
+            position = "Operator"
+            cur_question = None
+            hasSub = False
+            question_id += 1
+            followup_id = -1
+            context =ET.SubElement(conversation, "transition")
+            speaker_element = ET.SubElement(context, "speaker", id=id, position=position)
+            speaker_element.text = "Operator"
+            text = ""
+            para = ET.SubElement(speaker_element, "text")
+            paragraph[i] = paragraph[i].replace("Operator", "")
+            while i < len(paragraph) and re.sub(r'\s+', ' ', paragraph[i].strip())  not in speaker_list:
+                if len(paragraph[i].strip()) != 0:
+                    text += paragraph[i] + "\n"
+                i += 1
+            para.text = text.strip()
+            if para.text =="":
+                conversation.remove(context)
+            if "conclude" in para.text:
+                context.tag = "ending"
+                end = True
+
+
+        else:
+            i += 1
+
+    return conversation
+
+
+def sections(parser, path):
+    """Presentation and Q&A paragraph texts of a transcript and its speaker_list."""
+    doc = read_document(path)
+    _, _, speaker_list = parser.build_table(doc)
+    presentation = qa = ""
+    for paragraph in doc.paragraphs:
+        if paragraph.text.strip().startswith("Question and Answer"):
+            qa = paragraph.text
+        elif paragraph.text.strip().startswith("Presentation"):
+            presentation = paragraph.text
+    return presentation, qa, speaker_list
+
+
+def scale_section(text, factor):
+    """Repeat the lines between the section title and the last Operator turn factor times."""
+    lines = text.split("\n")
+    closing = max((i for i, line in enumerate(lines) if "Operator" in line), default=len(lines))
+    return "\n".join(lines[:1] + lines[1:closing] * factor + lines[closing:])
+
+
+def timed(fn, repeat):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        seconds.append(time.perf_counter() - start)
+    return result, statistics.median(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the one-pass speaker turn segmenter with the former loops.")
+    parser.add_argument("--file-dir", type=str, default=str(PIPELINE_DIR / "sample_data"), help="Directory containing the .rtf transcripts.")
+    parser.add_argument("--scale", type=int, action="append", help="Length factor of the Q&A section, can be repeated. Defaults to 10.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per section and implementation; the median is reported.")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    registry = SpeakerRegistry(os.path.join(work_dir, "global_speaker.db"), str(PIPELINE_DIR / "global_speaker.json"))
+    transcript_parser = TranscriptParser(registry)
+    files = sorted(f for f in os.listdir(args.file_dir) if f.endswith(".rtf"))
+
+    print(f"{'section':<40}{'scale':>6}{'lines':>8}{'turns ms':>10}{'legacy ms':>11}{'speedup':>9}  same xml")
+    for filename in files:
+        presentation, qa, speaker_list = sections(transcript_parser, os.path.join(args.file_dir, filename))
+        for factor in args.scale if args.scale else [10]:
+            cases = [("Presentation", scale_section(presentation, factor), transcript_parser.process_presentation, legacy_presentation),
+                     ("Question and Answer", scale_section(qa, factor), transcript_parser.process_dialog, legacy_dialog)]
+            for name, text, build, legacy in cases:
+                new, new_seconds = timed(lambda: build(text, speaker_list, name), args.repeat)
+                old, old_seconds = timed(lambda: legacy(text, speaker_list, name), args.repeat)
+                same = ET.tostring(new) == ET.tostring(old)
+                label = f"{filename[:26]} {'Q&A' if name == 'Question and Answer' else name}"
+                print(f"{label:<40}{factor:>6}{text.count(chr(10)) + 1:>8}{new_seconds * 1000:>10.2f}"
+                      f"{old_seconds * 1000:>11.2f}{old_seconds / new_seconds:>8.1f}x  {same}")
+    registry.close()
+
+
+if __name__ == "__main__":
+    main()
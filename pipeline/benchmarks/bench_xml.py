@@ -0,0 +1,144 @@
+"""XML parse, pretty print and serialization time with ElementTree and lxml.
+
+Reads the transcripts in sample_output, scaled up by the synthetic generator (1x and 10x by
+default), and times with every XML engine installed: parsing the full tree, streaming the
+header and sections with xml_io.iter_sections (what the Neo4j import does), pretty printing
+with xml_io.indent and serializing with xml_io.to_bytes. TranscriptParser.prettify, the
+recursive pretty printer indent replaced, is kept below and timed on the same trees.
+
+It also reports the peak Python heap of a full parse and of the streaming read with
+ElementTree. lxml allocates its trees outside the Python heap, tracemalloc does not see them.
+
+Example:
+python benchmarks/bench_xml.py
+python benchmarks/bench_xml.py --scale 1 --scale 100 --repeat 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from xml.etree import ElementTree
+
+PIPELINE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PIPELINE_DIR))
+
+import synthetic
+import xml_io
+
+
+# TranscriptParser.prettify before the parser used xml_io.indent
+def legacy_prettify(element, indent='    ', level=0):
+
+    if len(element):
+        if not element.text or not element.text.strip():
+            element.text = '\n' + indent * (level + 1)
+        if not element.tail or not element.tail.strip():
+            element.tail = '\n' + indent * level
+    else:
+        if level and (not element.tail or not element.tail.strip()):
+            element.tail = '\n' + indent * level
+
+    for subelement in element:
+        legacy_prettify(subelement, indent, level + 1)
+
+
+def engines():
+    """XML engines that are installed, by name, with whether they are lxml."""
+    found = {"ElementTree": (ElementTree, False)}
+    try:
+        from lxml import etree
+        found["lxml"] = (etree, True)
+    except ImportError:
+        pass
+    return found
+
+
+def use_engine(engine, is_lxml):
+    """Make xml_io run on the given engine."""
+    xml_io.ET = engine
+    xml_io.LXML = is_lxml
+
+
+def stream(path):
+    """Read a transcript the way the Neo4j import does, touching the text of every section."""
+    count = 0
+    for element in xml_io.iter_sections(path):
+        count += sum(len(text.text or "") for text in element.iter("text"))
+    return count
+
+
+def timed(fn, repeat):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        seconds.append(time.perf_counter() - start)
+    return result, statistics.median(seconds)
+
+
+def peak_kb(fn):
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def write_inputs(work_dir, factors):
+    """Write the sample transcripts scaled by every factor; returns (name, factor, path)."""
+    inputs = []
+    for name, root in synthetic.load_samples().items():
+        for factor in factors:
+            path = os.path.join(work_dir, f"{name}-x{factor}.xml")
+            xml_io.write_xml(synthetic.scale_transcript(root, factor), path)
+            inputs.append((name, factor, path))
+    return inputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time XML parsing, pretty printing and serialization with each engine.")
+    parser.add_argument("--scale", type=int, action="append", help="Transcript scale factor, can be repeated. Defaults to 1 and 10.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per file and step; the median is reported.")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    inputs = write_inputs(work_dir, args.scale if args.scale else [1, 10])
+    default = (xml_io.ET, xml_io.LXML)
+
+    print(f"{'transcript':<22}{'engine':<13}{'KB':>8}{'parse ms':>10}{'stream ms':>11}{'indent ms':>11}"
+          f"{'prettify ms':>13}{'write ms':>10}  same xml")
+    for name, factor, path in inputs:
+        size = os.path.getsize(path) / 1024
+        expected = None
+        for engine_name, (engine, is_lxml) in engines().items():
+            use_engine(engine, is_lxml)
+            root, parse = timed(lambda: engine.parse(path).getroot(), args.repeat)
+            _, streaming = timed(lambda: stream(path), args.repeat)
+            _, indent = timed(lambda: xml_io.indent(root), args.repeat)
+            _, prettify = timed(lambda: legacy_prettify(root), args.repeat)
+            xml_io.indent(root)
+            data, write = timed(lambda: xml_io.to_bytes(root), args.repeat)
+            # The engines write empty elements as <a /> and <a/>, compare the canonical form
+            canonical = ElementTree.canonicalize(data)
+            expected = expected if expected is not None else canonical
+            print(f"{name[:14] + ' x' + str(factor):<22}{engine_name:<13}{size:>8.0f}{parse * 1000:>10.2f}"
+                  f"{streaming * 1000:>11.2f}{indent * 1000:>11.2f}{prettify * 1000:>13.2f}{write * 1000:>10.2f}"
+                  f"  {canonical == expected}")
+    use_engine(*default)
+
+    print()
+    print("Peak Python heap with ElementTree, KB")
+    use_engine(ElementTree, False)
+    for name, factor, path in inputs:
+        full = peak_kb(lambda: ElementTree.parse(path))
+        streaming = peak_kb(lambda: stream(path))
+        print(f"{name[:14] + ' x' + str(factor):<22}full parse {full:>10.0f}   stream {streaming:>10.0f}")
+    use_engine(*default)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""Offline stand-ins for FinBERT, OpenAI, Yahoo Finance and Whisper.
+
+install() registers fake transformers, openai, yfinance and whisper modules, so the pipeline
+runs unchanged (its lazy imports pick up the fakes) without network access or model weights.
+The fakes replay the outputs recorded in sample_output/*.xml where the same input was seen,
+i.e. the Q&A FinBERT scores, the OpenAI summaries and the header prices, and otherwise answer
+with deterministic values derived from a hash of the input. torch is still needed, the
+sentiment stage computes its softmax with it.
+
+Every fake call can be given an artificial latency, to see how a stage behaves when the model
+or the network is the bottleneck.
+"""
+import hashlib
+import os
+import re
+import sys
+import time
+import types
+from datetime import datetime, timedelta
+from xml.etree import ElementTree as ET
+
+SAMPLE_OUTPUT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_output")
+
+# Header tags of the recorded transcripts -> Yahoo Finance symbol and price column
+HEADER_PRICES = {
+    "S_P500_open": ("^GSPC", "Open"),
+    "S_P500_close": ("^GSPC", "Close"),
+    "KBWBankIndex_open": ("^BKX", "Open"),
+    "KBWBankIndex_close": ("^BKX", "Close"),
+    "open_price": (None, "Open"),
+    "close_price": (None, "Close"),
+    "high_price": (None, "High"),
+    "low_price": (None, "Low"),
+}
+
+# Number of calls made to each fake, e.g. {"finbert_loads": 3, "openai_calls": 120}
+CALLS = {}
+
+
+def normalize(text):
+    return " ".join(text.split()) if text else ""
+
+
+def text_hash(text):
+    return hashlib.sha256(normalize(text).encode("utf-8")).digest()
+
+
+def count(name):
+    CALLS[name] = CALLS.get(name, 0) + 1
+
+
+class Recordings:
+    """Model and API outputs recorded in the sample transcripts."""
+
+    def __init__(self, folder=SAMPLE_OUTPUT):
+        self.summaries = {}
+        self.scores = {}
+        # (symbol, "YYYY-MM-DD") -> {"Open": ..., "Close": ...}
+        self.prices = {}
+        for filename in sorted(os.listdir(folder)):
+            if filename.endswith(".xml"):
+                self.load(ET.parse(os.path.join(folder, filename)).getroot())
+
+    def load(self, root):
+        for text_element in root.iter("text"):
+            text = normalize(text_element.text)
+            summary = text_element.find("summary")
+            if summary is not None and summary.text and summary.text != "None":
+                self.summaries[text] = summary.text
+            scores = [text_element.find(tag) for tag in ("pos", "neg", "neutr")]
+            if all(score is not None for score in scores):
+                self.scores[text] = tuple(float(score.text) for score in scores)
+
+        header = root.find("header")
+        date = datetime.strptime(header.find("time").text, "%A, %B %d, %Y %I:%M %p %Z").strftime("%Y-%m-%d")
+        ticker = header.find("ticker").text
+        for tag, (symbol, column) in HEADER_PRICES.items():
+            element = header.find(tag)
+            if element is not None and element.text:
+                self.prices.setdefault((symbol if symbol else ticker, date), {})[column] = float(element.text)
+
+
+class Latency:
+    """Seconds each fake call sleeps for, by kind of call."""
+
+    def __init__(self, finbert=0.0, openai=0.0, yfinance=0.0, whisper=0.0):
+        self.finbert = finbert
+        self.openai = openai
+        self.yfinance = yfinance
+        self.whisper = whisper
+
+    @staticmethod
+    def wait(seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+# FinBERT -----------------------------------------------------------------------------------
+
+class FakeTokenizer:
+    def __init__(self, recordings, latency):
+        self.recordings = recordings
+        self.latency = latency
+
+    def __call__(self, text, padding=False, truncation=False, return_tensors=None, max_length=512, **kwargs):
+        texts = [text] if isinstance(text, str) else list(text)
+        if kwargs.get("return_offsets_mapping"):
+            return FakeEncoding(offset_mapping=[self.offsets(t) for t in texts], texts=texts)
+        # Roughly the length of the FinBERT word pieces, including [CLS] and [SEP]
+        lengths = [len(t.split()) * 4 // 3 + 2 for t in texts]
+        if truncation:
+            lengths = [min(length, max_length) for length in lengths]
+        if return_tensors is None:
+            # Lists of unpadded ids, as the real tokenizer returns without padding
+            return FakeEncoding(input_ids=[[1] * length for length in lengths], attention_mask=[[1] * length for length in lengths],
+                                texts=texts)
+        import torch
+        width = max(lengths) if padding else lengths[0]
+        input_ids = torch.zeros((len(texts), width), dtype=torch.long)
+        attention_mask = torch.zeros((len(texts), width), dtype=torch.long)
+        for i, length in enumerate(lengths):
+            input_ids[i, :length] = 1
+            attention_mask[i, :length] = 1
+        return FakeEncoding(input_ids=input_ids, attention_mask=attention_mask, texts=texts)
+
+    @staticmethod
+    def offsets(text):
+        """Character span of every word piece, every third word is cut in two pieces."""
+        offsets = []
+        for i, word in enumerate(re.finditer(r"\S+", text)):
+            start, end = word.span()
+            if i % 3 == 2:
+                middle = max(start + 1, (start + end) // 2)
+                offsets += [(start, middle), (middle, max(middle, end))]
+            else:
+                offsets.append((start, end))
+        return offsets
+
+
+class FakeEncoding(dict):
+    def to(self, device):
+        return self
+
+
+class FakeModel:
+    """Returns logits whose softmax is the recorded score of the text, or a score derived from its hash."""
+
+    def __init__(self, recordings, latency):
+        self.recordings = recordings
+        self.latency = latency
+        self.config = types.SimpleNamespace(id2label={0: "positive", 1: "negative", 2: "neutral"})
+
+    def eval(self):
+        return self
+
+    def to(self, device):
+        return self
+
+    def logits_for(self, text):
+        scores = self.recordings.scores.get(normalize(text))
+        if scores is None:
+            digest = text_hash(text)
+            raw = [1 + digest[i] for i in range(3)]
+            # Most sentences of an earnings call are neutral
+            raw[2] += 400
+            scores = tuple(value / sum(raw) for value in raw)
+        return [max(score, 1e-6) for score in scores]
+
+    def __call__(self, input_ids=None, attention_mask=None, texts=(), **kwargs):
+        import torch
+        count("finbert_forward_passes")
+        self.latency.wait(self.latency.finbert)
+        logits = torch.log(torch.tensor([self.logits_for(text) for text in texts], dtype=torch.float32))
+        return types.SimpleNamespace(logits=logits)
+
+
+def make_transformers(recordings, latency):
+    module = types.ModuleType("transformers")
+
+    class AutoTokenizer:
+        @staticmethod
+        def from_pretrained(name, **kwargs):
+            count("finbert_tokenizer_loads")
+            return FakeTokenizer(recordings, latency)
+
+    class AutoModelForSequenceClassification:
+        @staticmethod
+        def from_pretrained(name, **kwargs):
+            count("finbert_loads")
+            return FakeModel(recordings, latency)
+
+    module.AutoTokenizer = AutoTokenizer
+    module.AutoModelForSequenceClassification = AutoModelForSequenceClassification
+    return module
+
+
+# OpenAI ------------------------------------------------------------------------------------
+
+def make_openai(recordings, latency):
+    module = types.ModuleType("openai")
+    prefix = "with only one sentence: "
+
+    def create(model=None, messages=(), **kwargs):
+        count("openai_calls")
+        latency.wait(latency.openai)
+        prompt = messages[-1]["content"]
+        text = prompt.split(prefix, 1)[1] if prefix in prompt else prompt
+        summary = recordings.summaries.get(normalize(text))
+        if summary is None:
+            summary = text.split(". ")[0].strip()
+        usage = types.SimpleNamespace(
+            prompt_tokens=sum(len(message["content"].split()) for message in messages) * 4 // 3,
+            completion_tokens=len(summary.split()) * 4 // 3,
+        )
+        message = types.SimpleNamespace(content=summary, role="assistant")
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=usage, model=model)
+
+    class OpenAI:
+        def __init__(self, api_key=None, **kwargs):
+            self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=create))
+
+    module.OpenAI = OpenAI
+    return module
+
+
+# Yahoo Finance -----------------------------------------------------------------------------
+
+def synthetic_price(symbol, date):
+    digest = hashlib.sha256(f"{symbol}:{date}".encode("utf-8")).digest()
+    base = 20 + int.from_bytes(digest[:2], "big") % 5000
+    drift = (digest[2] - 128) / 2560 * base
+    return {"Open": float(base), "Close": base + drift, "High": base + abs(drift) + 1, "Low": base - abs(drift) - 1}
+
+
+def make_yfinance(recordings, latency):
+    import pandas as pd
+    module = types.ModuleType("yfinance")
+
+    def daily_bars(symbol, days):
+        rows = []
+        for day in days:
+            prices = synthetic_price(symbol, day.strftime("%Y-%m-%d"))
+            prices.update(recordings.prices.get((symbol, day.strftime("%Y-%m-%d")), {}))
+            rows.append(prices)
+        return pd.DataFrame(rows, index=pd.DatetimeIndex(days, name="Date"))
+
+    def minute_bars(symbol, days):
+        """Minute bars around the clock, enough for calls scaled far beyond their real length."""
+        frames = []
+        for day in days:
+            index = pd.date_range(day, day + timedelta(days=1), freq="1min", inclusive="left", name="Datetime")
+            base = synthetic_price(symbol, day.strftime("%Y-%m-%d"))["Open"]
+            steps = [((i * 7919) % 200 - 100) / 10000 * base for i in range(len(index))]
+            close = [base + step for step in steps]
+            frames.append(pd.DataFrame({"Open": close, "Close": close, "High": [c + 0.01 for c in close],
+                                        "Low": [c - 0.01 for c in close], "Volume": 1000}, index=index))
+        return pd.concat(frames)
+
+    def download(tickers, start=None, end=None, interval="1m", group_by="column", **kwargs):
+        count("yfinance_requests")
+        latency.wait(latency.yfinance)
+        first = pd.Timestamp(start)
+        if first.tzinfo is not None:
+            first = first.tz_localize(None)
+        first = first.normalize()
+        last = pd.Timestamp(end).normalize() if end is not None else first + timedelta(days=1)
+        days = list(pd.date_range(first, last, freq="D", inclusive="left"))
+        symbols = [tickers] if isinstance(tickers, str) else list(tickers)
+        frames = {symbol: daily_bars(symbol, days) if interval == "1d" else minute_bars(symbol, days) for symbol in symbols}
+        if isinstance(tickers, str):
+            return frames[tickers]
+        return pd.concat(frames, axis=1)
+
+    module.download = download
+    return module
+
+
+# Whisper -----------------------------------------------------------------------------------
+
+class FakeWhisperModel:
+    """Transcribes a call by reading its transcript aloud at a steady pace.
+
+    Set script to the transcript root before calling transcribe.
+    """
+
+    def __init__(self, latency, words_per_second=2.5, words_per_segment=12):
+        self.latency = latency
+        self.words_per_second = words_per_second
+        self.words_per_segment = words_per_segment
+        self.script = None
+
+    def transcribe(self, audio_path, **kwargs):
+        count("whisper_transcriptions")
+        self.latency.wait(self.latency.whisper)
+        segments = []
+        words = []
+        for section in ("Presentation", "Question and Answer"):
+            element = self.script.find(f"./body/section[@name='{section}']")
+            if element is not None:
+                for text_element in element.iter("text"):
+                    words.extend((text_element.text or "").split())
+        for start in range(0, len(words), self.words_per_segment):
+            chunk = words[start:start + self.words_per_segment]
+            segments.append({
+                "id": len(segments),
+                "start": start / self.words_per_second,
+                "end": (start + len(chunk)) / self.words_per_second,
+                "text": " " + " ".join(chunk),
+            })
+        return {"text": " ".join(words), "segments": segments, "language": "en"}
+
+
+def make_whisper(latency):
+    module = types.ModuleType("whisper")
+
+    def load_model(name, **kwargs):
+        count("whisper_loads")
+        return FakeWhisperModel(latency)
+
+    module.load_model = load_model
+    return module
+
+
+def install(recordings=None, latency=None):
+    """Replace transformers, openai, yfinance and whisper with the offline fakes in this process."""
+    recordings = recordings if recordings else Recordings()
+    latency = latency if latency else Latency()
+    sys.modules["transformers"] = make_transformers(recordings, latency)
+    sys.modules["openai"] = make_openai(recordings, latency)
+    sys.modules["yfinance"] = make_yfinance(recordings, latency)
+    sys.modules["whisper"] = make_whisper(latency)
+    return recordings
@@ -0,0 +1,120 @@
+"""Synthetic transcripts for scaling benchmarks.
+
+The inputs are the enriched transcripts in sample_output. strip_enrichment() turns them back
+into what the parser produces, and scale_transcript() repeats their presentation statements
+and Q&A exchanges to build calls 10x or 100x longer than a real one, with the question ids
+renumbered so the Q&A structure stays valid.
+"""
+import copy
+import os
+import sys
+
+PIPELINE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PIPELINE_DIR)
+
+# The trees are enriched by the pipeline stages, so they must come from the same XML engine
+from xml_io import ET
+
+SAMPLE_OUTPUT = os.path.join(PIPELINE_DIR, "sample_output")
+
+# Header tags written by the prices and index stages
+ENRICHED_HEADER_TAGS = ["open_price", "close_price", "high_price", "low_price", "stock_performance",
+                        "S_P500_open", "S_P500_close", "KBWBankIndex_open", "KBWBankIndex_close"]
+
+QA_TAGS_WITH_QUESTION_ID = {"followQuestion", "followAnswer"}
+QA_TAGS_WITH_ID = {"question", "answer"}
+
+
+def strip_enrichment(root):
+    """Remove the tags added by the enrichment stages, in place.
+
+    Every child of a <text> element is a stage tag (sentiment, summary, emotion, timeStamp...).
+    """
+    for text_element in root.iter("text"):
+        for child in list(text_element):
+            text_element.remove(child)
+    header = root.find("header")
+    if header is not None:
+        for tag in ENRICHED_HEADER_TAGS:
+            for element in header.findall(tag):
+                header.remove(element)
+    return root
+
+
+def load_samples(folder=SAMPLE_OUTPUT):
+    """Parsed-stage trees of the sample transcripts.
+
+    Returns:
+        samples: dict mapping the transcript name to its root element
+    """
+    samples = {}
+    for filename in sorted(os.listdir(folder)):
+        if filename.endswith(".xml"):
+            root = ET.parse(os.path.join(folder, filename)).getroot()
+            samples[os.path.splitext(filename)[0]] = strip_enrichment(root)
+    return samples
+
+
+def scale_transcript(root, factor):
+    """Return a copy of the transcript with its presentation and Q&A repeated factor times."""
+    root = copy.deepcopy(root)
+    if factor <= 1:
+        return root
+
+    presentation = root.find("./body/section[@name='Presentation']")
+    if presentation is not None:
+        statements = presentation.findall("statement")
+        for _ in range(factor - 1):
+            for statement in statements:
+                presentation.append(copy.deepcopy(statement))
+
+    qa = root.find("./body/section[@name='Question and Answer']")
+    if qa is not None:
+        children = list(qa)
+        # The closing remarks stay at the end of the call
+        exchanges = [child for child in children if child.tag != "ending"]
+        endings = [child for child in children if child.tag == "ending"]
+        ids = [int(child.get("id")) for child in exchanges if child.tag in QA_TAGS_WITH_ID and child.get("id")]
+        question_count = max(ids) + 1 if ids else 0
+        for element in endings:
+            qa.remove(element)
+        for k in range(1, factor):
+            offset = k * question_count
+            for child in exchanges:
+                element = copy.deepcopy(child)
+                if element.tag in QA_TAGS_WITH_ID and element.get("id") is not None:
+                    element.set("id", str(int(element.get("id")) + offset))
+                if element.tag in QA_TAGS_WITH_QUESTION_ID and element.get("question_id") is not None:
+                    element.set("question_id", str(int(element.get("question_id")) + offset))
+                qa.append(element)
+        for element in endings:
+            qa.append(element)
+    return root
+
+
+def turn_count(root):
+    """Number of speaker turns (text elements) in the presentation and Q&A."""
+    return sum(1 for section in root.iter("section") if section.get("name") in ("Presentation", "Question and Answer")
+               for _ in section.iter("text"))
+
+
+def char_count(root):
+    return sum(len(text_element.text or "") for section in root.iter("section")
+               if section.get("name") in ("Presentation", "Question and Answer")
+               for text_element in section.iter("text"))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Write synthetic transcripts scaled from the sample outputs.")
+    parser.add_argument("--save-dir", type=str, required=True, help="Directory to save the synthetic XML files.")
+    parser.add_argument("--scale", type=int, action="append", help="Scale factor, can be repeated. Defaults to 10 and 100.")
+    args = parser.parse_args()
+
+    os.makedirs(args.save_dir, exist_ok=True)
+    for name, root in load_samples().items():
+        for factor in args.scale if args.scale else [10, 100]:
+            path = os.path.join(args.save_dir, f"{name}-x{factor}.xml")
+            scaled = scale_transcript(root, factor)
+            ET.ElementTree(scaled).write(path, encoding="utf-8", xml_declaration=True)
+            print(f"{path}: {turn_count(scaled)} turns, {char_count(scaled)} characters")
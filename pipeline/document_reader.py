@@ -0,0 +1,593 @@
+"""In-memory reader for the transcript documents.
+
+The S&P Capital IQ transcripts are downloaded with an .rtf extension but are either real RTF or
+Word 97-2003 binary documents (OLE2 compound files). read_document() parses both straight from
+the bytes of the file into the structure the transcript parser walks, the same one python-docx
+exposes: doc.paragraphs are the paragraphs outside tables, doc.tables the top level tables,
+table.rows[i].cells[j].text the text of a cell. Line breaks read as "\\n", fields as their result
+and pictures, page breaks and nested tables are dropped, like python-docx does.
+"""
+import re
+import struct
+
+OLE2_MAGIC = bytes.fromhex("D0CF11E0A1B11AE1")
+RTF_MAGIC = b"{\\rtf"
+
+
+class Paragraph:
+    def __init__(self, text):
+        self.text = text
+
+
+class Cell:
+    def __init__(self, paragraphs):
+        self.paragraphs = [Paragraph(text) for text in paragraphs]
+        self.text = "\n".join(paragraphs)
+
+
+class Row:
+    def __init__(self, cells):
+        self.cells = cells
+
+
+class Table:
+    def __init__(self, rows):
+        self.rows = rows
+
+
+class Document:
+    def __init__(self, paragraphs, tables):
+        self.paragraphs = paragraphs
+        self.tables = tables
+
+
+class DocumentBuilder:
+    """Collects the text of a document into paragraphs, table cells, rows and tables.
+
+    The readers feed it text and structure marks in document order. depth is the table nesting
+    level of the paragraph the mark ends: 0 outside tables, 1 in a top level table. Text of
+    nested tables is dropped, it is not part of the text of the enclosing cell.
+    """
+
+    def __init__(self):
+        self.paragraphs = []
+        self.tables = []
+        self.parts = []
+        self.cell_paragraphs = []
+        self.cells = []
+        # Rows of the table being read, None between tables
+        self.rows = None
+
+    def add_text(self, text):
+        self.parts.append(text)
+
+    def end_paragraph(self, depth=0):
+        text = "".join(self.parts)
+        self.parts = []
+        if depth == 0:
+            # A paragraph outside a table ends the table before it
+            self.rows = None
+            self.paragraphs.append(Paragraph(text))
+        elif depth == 1:
+            self.cell_paragraphs.append(text)
+
+    def end_cell(self, depth=1):
+        self.end_paragraph(depth)
+        if depth == 1:
+            self.cells.append(Cell(self.cell_paragraphs))
+            self.cell_paragraphs = []
+
+    def end_row(self, depth=1):
+        self.parts = []
+        if depth != 1:
+            return
+        if self.rows is None:
+            self.rows = []
+            self.tables.append(Table(self.rows))
+        self.rows.append(Row(self.cells))
+        self.cells = []
+        self.cell_paragraphs = []
+
+    def finish(self):
+        if self.parts:
+            self.end_paragraph()
+        return Document(self.paragraphs, self.tables)
+
+
+def read_document(path):
+    """Read a transcript document without converting it or writing anything to disk.
+
+    Args:
+        path: RTF or Word 97-2003 (.doc) file, whatever its extension
+
+    Returns:
+        doc: Document with the paragraphs and tables of the main text
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    return parse_document(data, path)
+
+
+def parse_document(data, name="document"):
+    if data.startswith(OLE2_MAGIC):
+        return parse_word_binary(data)
+    if data.lstrip().startswith(RTF_MAGIC):
+        return parse_rtf(data)
+    raise ValueError(f"{name} is neither an RTF nor a Word 97-2003 document")
+
+
+# OLE2 compound file -------------------------------------------------------------------------
+
+END_OF_CHAIN = 0xFFFFFFFA  # every sector id from here up is a marker, not a sector
+
+
+def read_compound_file(data):
+    """Return the streams of an OLE2 compound file.
+
+    Returns:
+        streams: dict mapping the stream name to its bytes
+    """
+    sector_size = 1 << struct.unpack_from("<H", data, 0x1E)[0]
+    mini_sector_size = 1 << struct.unpack_from("<H", data, 0x20)[0]
+    (fat_sectors, first_dir_sector, mini_cutoff, first_mini_fat_sector, mini_fat_sectors,
+     first_difat_sector, difat_sectors) = struct.unpack_from("<II4xIIIII", data, 0x2C)
+    per_sector = sector_size // 4
+
+    def sector(sid):
+        offset = (sid + 1) * sector_size
+        return data[offset:offset + sector_size]
+
+    difat = list(struct.unpack_from("<109I", data, 0x4C))
+    sid = first_difat_sector
+    for _ in range(difat_sectors):
+        entries = struct.unpack(f"<{per_sector}I", sector(sid))
+        difat.extend(entries[:-1])
+        sid = entries[-1]
+    fat = []
+    for sid in difat[:fat_sectors]:
+        fat.extend(struct.unpack(f"<{per_sector}I", sector(sid)))
+
+    def chain(sid, table):
+        seen = 0
+        while sid < END_OF_CHAIN:
+            yield sid
+            sid = table[sid]
+            seen += 1
+            if seen > len(table):
+                raise ValueError("Corrupt compound file: sector chain loops")
+
+    def read_chain(sid):
+        return b"".join(sector(s) for s in chain(sid, fat))
+
+    directory = read_chain(first_dir_sector)
+    entries = []
+    for offset in range(0, len(directory) - 127, 128):
+        name_length = struct.unpack_from("<H", directory, offset + 64)[0]
+        name = directory[offset:offset + max(name_length - 2, 0)].decode("utf-16-le", "replace")
+        entry_type = directory[offset + 66]
+        start, size = struct.unpack_from("<IQ", directory, offset + 116)
+        entries.append((name, entry_type, start, size))
+
+    root_start, root_size = entries[0][2], entries[0][3]
+    mini_stream = read_chain(root_start)[:root_size] if root_size else b""
+    mini_fat = []
+    if mini_fat_sectors:
+        raw = read_chain(first_mini_fat_sector)
+        mini_fat = list(struct.unpack(f"<{len(raw) // 4}I", raw))
+
+    streams = {}
+    for name, entry_type, start, size in entries:
+        if entry_type != 2:
+            continue
+        if size < mini_cutoff:
+            raw = b"".join(mini_stream[s * mini_sector_size:(s + 1) * mini_sector_size] for s in chain(start, mini_fat))
+        else:
+            raw = read_chain(start)
+        streams[name] = raw[:size]
+    return streams
+
+
+# Word 97-2003 binary ------------------------------------------------------------------------
+
+# Offsets in the FIB (File Information Block) at the start of the WordDocument stream
+FIB_FLAGS = 0x0A
+FIB_CCP_TEXT = 0x4C
+FIB_FC_LCB = 0x9A
+# Index of the (fc, lcb) pairs in FibRgFcLcb97
+FC_PLCF_SED = 6
+FC_PLCF_BTE_PAPX = 13
+FC_CLX = 33
+
+F_ENCRYPTED = 0x0100
+F_WHICH_TABLE_STREAM = 0x0200
+
+# Paragraph sprms that place a paragraph in a table
+SPRM_P_IN_TABLE = 0x2416
+SPRM_P_TTP = 0x2417
+SPRM_P_ITAP = 0x6649
+SPRM_P_HUGE_PAPX = 0x6646
+SPRM_T_DEF_TABLE = 0xD608
+SPRM_P_CHG_TABS = 0xC615
+
+CELL_MARK = "\x07"
+FIELD_BEGIN, FIELD_SEPARATOR, FIELD_END = "\x13", "\x14", "\x15"
+# Characters kept in the text, all other control characters are objects or marks
+TEXT_CONTROLS = {"\t": "\t", "\x0b": "\n", "\x1e": "-"}
+
+# The 8-bit pieces of a Word document are cp1252, with the bytes cp1252 leaves undefined kept as is
+CP1252 = {byte: bytes([byte]).decode("cp1252") for byte in range(0x80, 0xA0) if byte not in (0x81, 0x8D, 0x8F, 0x90, 0x9D)}
+
+
+def fc_lcb(word_document, index):
+    return struct.unpack_from("<II", word_document, FIB_FC_LCB + index * 8)
+
+
+def iter_sprms(grpprl):
+    """Yield (sprm, operand) for every property modifier of a grpprl."""
+    i = 0
+    while i + 2 <= len(grpprl):
+        sprm = struct.unpack_from("<H", grpprl, i)[0]
+        i += 2
+        spra = sprm >> 13
+        if spra in (0, 1):
+            size = 1
+        elif spra in (2, 4, 5):
+            size = 2
+        elif spra == 3:
+            size = 4
+        elif spra == 7:
+            size = 3
+        elif sprm == SPRM_T_DEF_TABLE:
+            size = struct.unpack_from("<H", grpprl, i)[0] - 1
+            i += 2
+        elif sprm == SPRM_P_CHG_TABS and i < len(grpprl) and grpprl[i] == 255:
+            deleted = grpprl[i + 1]
+            added = grpprl[i + 2 + deleted * 4]
+            size = 3 + deleted * 4 + added * 3
+        else:
+            size = grpprl[i] if i < len(grpprl) else 0
+            i += 1
+        yield sprm, grpprl[i:i + size]
+        i += size
+
+
+def paragraph_runs(word_document, table_stream, data_stream):
+    """Paragraph table properties from the PAPX FKPs.
+
+    Returns:
+        starts: file offsets where each run of paragraph properties starts
+        runs: (start, end, depth, row_end) per run, depth being the table nesting level
+    """
+    fc, lcb = fc_lcb(word_document, FC_PLCF_BTE_PAPX)
+    count = (lcb - 4) // 8
+    pages = struct.unpack_from(f"<{count}I", table_stream, fc + (count + 1) * 4)
+    runs = []
+    for pn in pages:
+        page = word_document[(pn & 0x3FFFFF) * 512:(pn & 0x3FFFFF) * 512 + 512]
+        crun = page[511]
+        bounds = struct.unpack_from(f"<{crun + 1}I", page, 0)
+        for k in range(crun):
+            offset = page[(crun + 1) * 4 + k * 13] * 2
+            properties = {}
+            if offset:
+                cb = page[offset]
+                if cb == 0:
+                    grpprl = page[offset + 2:offset + 2 + 2 * page[offset + 1]]
+                else:
+                    grpprl = page[offset + 1:offset + 2 * cb]
+                # The first two bytes are the paragraph style
+                properties = dict(iter_sprms(grpprl[2:]))
+                if SPRM_P_HUGE_PAPX in properties:
+                    # The properties did not fit in the page and are in the Data stream
+                    huge = struct.unpack("<I", properties[SPRM_P_HUGE_PAPX])[0]
+                    size = struct.unpack_from("<H", data_stream, huge)[0]
+                    properties.update(iter_sprms(data_stream[huge + 2:huge + 2 + size]))
+            depth = 0
+            if properties.get(SPRM_P_IN_TABLE, b"\0")[0]:
+                depth = struct.unpack("<i", properties[SPRM_P_ITAP])[0] if SPRM_P_ITAP in properties else 1
+            row_end = bool(properties.get(SPRM_P_TTP, b"\0")[0])
+            runs.append((bounds[k], bounds[k + 1], depth, row_end))
+    runs.sort()
+    return [run[0] for run in runs], runs
+
+
+def pieces(word_document, table_stream):
+    """Text pieces of the document from the piece table.
+
+    Returns:
+        pieces: (cp_start, cp_end, file offset, bytes per character) per piece
+    """
+    fc, lcb = fc_lcb(word_document, FC_CLX)
+    clx = table_stream[fc:fc + lcb]
+    i = 0
+    while i < len(clx) and clx[i] == 1:
+        # Prc, property modifiers referenced by complex pieces
+        i += 3 + struct.unpack_from("<h", clx, i + 1)[0]
+    if i >= len(clx) or clx[i] != 2:
+        raise ValueError("Word document without a piece table")
+    size = struct.unpack_from("<I", clx, i + 1)[0]
+    plc = clx[i + 5:i + 5 + size]
+    count = (size - 4) // 12
+    cps = struct.unpack_from(f"<{count + 1}I", plc, 0)
+    result = []
+    for k in range(count):
+        fc = struct.unpack_from("<I", plc, (count + 1) * 4 + k * 8 + 2)[0]
+        if fc & 0x40000000:
+            result.append((cps[k], cps[k + 1], (fc & 0x3FFFFFFF) // 2, 1))
+        else:
+            result.append((cps[k], cps[k + 1], fc, 2))
+    return result
+
+
+def section_ends(word_document, table_stream):
+    """Character positions of the section breaks, which also end a paragraph."""
+    fc, lcb = fc_lcb(word_document, FC_PLCF_SED)
+    if not lcb:
+        return set()
+    count = (lcb - 4) // 16
+    return {cp - 1 for cp in struct.unpack_from(f"<{count + 1}I", table_stream, fc)[1:]}
+
+
+def parse_word_binary(data):
+    streams = read_compound_file(data)
+    word_document = streams.get("WordDocument")
+    if word_document is None or struct.unpack_from("<H", word_document, 0)[0] != 0xA5EC:
+        raise ValueError("Not a Word document")
+    flags = struct.unpack_from("<H", word_document, FIB_FLAGS)[0]
+    if flags & F_ENCRYPTED:
+        raise ValueError("Encrypted Word documents are not supported")
+    table_stream = streams.get("1Table" if flags & F_WHICH_TABLE_STREAM else "0Table")
+    if table_stream is None:
+        raise ValueError("Word documents older than Word 97 are not supported")
+    data_stream = streams.get("Data", b"")
+    main_length = struct.unpack_from("<I", word_document, FIB_CCP_TEXT)[0]
+
+    starts, runs = paragraph_runs(word_document, table_stream, data_stream)
+    sections = section_ends(word_document, table_stream)
+
+    def paragraph_at(offset):
+        # The properties of a paragraph are those of the run holding its paragraph mark
+        lo, hi = 0, len(starts)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if starts[mid] <= offset:
+                lo = mid + 1
+            else:
+                hi = mid
+        run = runs[lo - 1] if lo else None
+        if run is None or offset >= run[1]:
+            return 0, False
+        return run[2], run[3]
+
+    builder = DocumentBuilder()
+    # One entry per open field, True once its separator is passed and its result is shown
+    fields = []
+    for cp_start, cp_end, offset, width in pieces(word_document, table_stream):
+        if cp_start >= main_length:
+            break
+        cp_end = min(cp_end, main_length)
+        raw = word_document[offset:offset + (cp_end - cp_start) * width]
+        if width == 1:
+            text = raw.decode("latin-1").translate(CP1252)
+        else:
+            text = raw.decode("utf-16-le", "replace")
+        position = 0
+        for match in re.finditer(r"[\x00-\x1f]", text):
+            i = match.start()
+            if i > position and all(fields):
+                builder.add_text(text[position:i])
+            position = i + 1
+            char = match.group()
+            cp = cp_start + i
+            if char == FIELD_BEGIN:
+                fields.append(False)
+            elif char == FIELD_SEPARATOR:
+                if fields:
+                    fields[-1] = True
+            elif char == FIELD_END:
+                if fields:
+                    fields.pop()
+            elif char == "\r" or char == CELL_MARK or (char == "\x0c" and cp in sections):
+                depth, row_end = paragraph_at(offset + i * width)
+                if char == CELL_MARK:
+                    depth = max(depth, 1)
+                    if row_end:
+                        builder.end_row(depth)
+                    else:
+                        builder.end_cell(depth)
+                else:
+                    builder.end_paragraph(depth)
+            elif char in TEXT_CONTROLS and all(fields):
+                builder.add_text(TEXT_CONTROLS[char])
+        if position < len(text) and all(fields):
+            builder.add_text(text[position:])
+    return builder.finish()
+
+
+# RTF ----------------------------------------------------------------------------------------
+
+RTF_TOKEN = re.compile(
+    rb"\\([a-zA-Z]{1,32})(-?\d{1,10})? ?"  # control word with an optional parameter
+    rb"|\\'([0-9a-fA-F]{2})"  # character given by its code in the code page
+    rb"|\\([^a-zA-Z'])"  # control symbol
+    rb"|([{}])"
+    rb"|[\r\n]+"
+    rb"|([^\\{}\r\n]+)"
+)
+
+# Destinations whose content is not document text
+SKIPPED_DESTINATIONS = {
+    "fonttbl", "colortbl", "stylesheet", "info", "pict", "object", "shp", "shppict", "nonshppict",
+    "header", "headerl", "headerr", "headerf", "footer", "footerl", "footerr", "footerf",
+    "footnote", "annotation", "fldinst", "bkmkstart", "bkmkend", "listtable", "listoverridetable",
+    "revtbl", "rsidtbl", "listtext", "pntext", "pn", "pntxta", "pntxtb", "txe", "xe", "tc", "tcn",
+    "ftnsep", "ftnsepc", "ftncn", "aftnsep", "aftnsepc", "aftncn", "template", "filetbl",
+    "datafield", "do", "falt", "panose", "generator", "xmlnstbl", "themedata", "colorschememapping",
+    "latentstyles", "datastore", "mmathPr", "pgdsctbl", "userprops", "docvar", "sp", "sn", "sv",
+}
+
+RTF_SYMBOLS = {
+    "line": "\n", "tab": "\t", "emdash": "\u2014", "endash": "\u2013", "bullet": "\u2022",
+    "lquote": "\u2018", "rquote": "\u2019", "ldblquote": "\u201c", "rdblquote": "\u201d",
+    "emspace": "\u2003", "enspace": "\u2002", "qmspace": "\u2005",
+}
+RTF_CONTROL_SYMBOLS = {"~": "\xa0", "_": "-", "\\": "\\", "{": "{", "}": "}"}
+
+# \fcharset values -> code page
+CHARSET_CODEPAGES = {
+    0: 1252, 77: 10000, 128: 932, 129: 949, 134: 936, 136: 950, 161: 1253, 162: 1254, 163: 1258,
+    177: 1255, 178: 1256, 186: 1257, 204: 1251, 222: 874, 238: 1250,
+}
+
+
+class RtfState:
+    """Formatting state of an RTF group, copied when a group opens and restored when it closes."""
+
+    def __init__(self):
+        self.skip = False
+        self.font_table = False
+        self.unicode_skip = 1
+        self.codepage = None
+        self.in_table = False
+        self.depth = 1
+
+    def copy(self):
+        state = RtfState()
+        state.__dict__.update(self.__dict__)
+        return state
+
+
+def decode_codepage(raw, codepage):
+    try:
+        return raw.decode(f"cp{codepage}")
+    except (LookupError, UnicodeDecodeError):
+        return raw.decode("cp1252", "replace")
+
+
+def parse_rtf(data):
+    builder = DocumentBuilder()
+    state = RtfState()
+    stack = []
+    ansi_codepage = 1252
+    font_codepages = {}
+    font = None
+    # Bytes of the text and of \'hh characters, decoded together in the code page of the font so
+    # 8-bit text and double byte code pages work
+    pending = bytearray()
+    # Characters still to skip after a \u character, its plain text fallback
+    to_skip = 0
+    # Set by \*, the group is a destination that can be ignored if unknown
+    starred = False
+
+    def flush():
+        if pending:
+            if not state.skip:
+                builder.add_text(decode_codepage(bytes(pending), state.codepage or ansi_codepage))
+            pending.clear()
+
+    def paragraph_depth():
+        return state.depth if state.in_table else 0
+
+    position = 0
+    while position < len(data):
+        match = RTF_TOKEN.match(data, position)
+        if match is None:
+            # A lone backslash at the end of the data
+            break
+        position = match.end()
+        word, param, hex_code, symbol, brace, text = match.groups()
+        if hex_code is not None:
+            if to_skip:
+                to_skip -= 1
+            else:
+                pending.append(int(hex_code, 16))
+            continue
+        if text is not None:
+            if to_skip:
+                skipped = min(to_skip, len(text))
+                text = text[skipped:]
+                to_skip -= skipped
+            # The font table is skipped, flush() drops the text of skipped groups
+            pending.extend(text)
+            continue
+        if brace is None and word is None and symbol is None:
+            # Line breaks in the RTF source carry no meaning
+            continue
+        flush()
+        to_skip = 0
+
+        if brace == b"{":
+            stack.append(state)
+            state = state.copy()
+            continue
+        if brace == b"}":
+            if stack:
+                state = stack.pop()
+            continue
+
+        if symbol is not None:
+            symbol = symbol.decode("latin-1")
+            if symbol == "*":
+                starred = True
+            elif symbol in ("\n", "\r"):
+                if not state.skip:
+                    builder.end_paragraph(paragraph_depth())
+            elif symbol in RTF_CONTROL_SYMBOLS and not state.skip:
+                builder.add_text(RTF_CONTROL_SYMBOLS[symbol])
+            continue
+
+        word = word.decode("ascii")
+        value = int(param) if param is not None else None
+        if starred:
+            starred = False
+            if word not in ("fldrslt", "shptxt"):
+                state.skip = True
+                continue
+        if word == "bin":
+            # Binary data follows, skip it whatever the group
+            position += value or 0
+            continue
+        if word == "fonttbl":
+            state.font_table = True
+            state.skip = True
+        elif state.font_table:
+            if word == "f":
+                font = value
+            elif word == "fcharset" and font is not None:
+                font_codepages[font] = CHARSET_CODEPAGES.get(value)
+        elif word in SKIPPED_DESTINATIONS:
+            state.skip = True
+        elif word == "ansicpg" and value:
+            ansi_codepage = value
+        elif word == "f":
+            state.codepage = font_codepages.get(value)
+        elif word == "uc" and value is not None:
+            state.unicode_skip = value
+        elif word == "u" and value is not None:
+            if not state.skip:
+                builder.add_text(chr(value + 65536 if value < 0 else value))
+            to_skip = state.unicode_skip
+        elif word == "pard":
+            state.in_table = False
+            state.depth = 1
+        elif word == "intbl":
+            state.in_table = True
+        elif word == "itap" and value is not None:
+            state.in_table = value > 0
+            state.depth = max(value, 1)
+        elif state.skip:
+            continue
+        elif word in ("par", "sect"):
+            builder.end_paragraph(paragraph_depth())
+        elif word == "cell":
+            builder.end_cell(1)
+        elif word == "nestcell":
+            builder.end_cell(max(state.depth, 2))
+        elif word == "row":
+            builder.end_row(1)
+        elif word == "nestrow":
+            builder.end_row(max(state.depth, 2))
+        elif word in RTF_SYMBOLS:
+            builder.add_text(RTF_SYMBOLS[word])
+    flush()
+    return builder.finish()
@@ -1,25 +1,35 @@
 import os
 import pandas as pd
 import warnings
-from xml.etree import ElementTree as ET
 import json
-import matplotlib.pyplot as plt
+import hashlib
 from collections import Counter
-import nltk
 from nltk.tokenize import word_tokenize
 from nltk.corpus import stopwords
 from nltk.stem import PorterStemmer
 from nltk.util import ngrams
+from resources import ensure_nltk_data
+from xml_io import ET, remove_tags, write_xml
 warnings.filterwarnings("ignore")
 
-nltk.download('punkt', quiet=True)
-nltk.download('stopwords', quiet=True)
-
 class EmotionClassificationProcessor:
+    # Bump when a code change alters the tags this stage writes, so cached results are rebuilt
+    STAGE_VERSION = "1"
+    # Tag this stage adds to every <text> of the Q&A section
+    TAGS = ["emotion"]
+
     def __init__(self):
         self.stemmed_keywords = self.load_stemmed_keywords('glossary/emotion_keywords_stemmed.json')
         self.emotion_score_ranges = self.load_emotion_score_ranges('glossary/emotion_score_range.json')
 
+    def warm_up(self):
+        ensure_nltk_data('punkt', 'stopwords')
+
+    def stage_version(self):
+        # The glossaries act as the model of this stage, editing them invalidates cached results
+        glossary = json.dumps([self.stemmed_keywords, self.emotion_score_ranges], sort_keys=True)
+        return f"{self.STAGE_VERSION}:{hashlib.sha256(glossary.encode('utf-8')).hexdigest()[:16]}"
+
     def load_stemmed_keywords(self, filepath: str) -> dict:
         with open(filepath, 'r') as file:
             return json.load(file)
@@ -28,11 +38,8 @@ class EmotionClassificationProcessor:
         with open(filepath, 'r') as file:
             return json.load(file)
         
-    def extract_qa_text(self, xml_file_path: str) -> pd.DataFrame:
+    def extract_qa_text(self, root) -> pd.DataFrame:
         # Implementation remains as provided
-        tree = ET.parse(xml_file_path)
-        root = tree.getroot()
-
         # Empty lists to store speaker IDs and text content
         speaker_id_list = []
         speaker_name_list = []
@@ -82,6 +89,7 @@ class EmotionClassificationProcessor:
 
     def process_text(self, text: str) -> list:
         # Implementation remains as provided
+        ensure_nltk_data('punkt', 'stopwords')
         tokens = word_tokenize(text)
         additional_stop_words = [',', '.', '--', "'s", "'d", "'ll", "'re", "'ve", '``', "''"]
         stop_words = set(stopwords.words('english') + additional_stop_words)
@@ -145,6 +153,7 @@ class EmotionClassificationProcessor:
         return df
 
     def plot_emotion_distribution(self, column: pd.Series, plot_title: str, file_name: str) -> None:
+        import matplotlib.pyplot as plt
         all_emotions = []
         for emotions in column:
             all_emotions.extend(emotions.split(', '))
@@ -172,7 +181,9 @@ class EmotionClassificationProcessor:
     def get_final_emotion_tags(self, file_path: str, plot=False) -> pd.DataFrame:
         # load data
         df = pd.read_csv(file_path)
+        return self.get_final_emotion_tags_from_df(df, plot=plot)
 
+    def get_final_emotion_tags_from_df(self, df: pd.DataFrame, plot=False) -> pd.DataFrame:
         # get emotion categories from score ranges
         df['Emotion By Score Ranges'] = df.apply(self.classify_emotion_score_ranges, axis=1)
         if plot:
@@ -193,10 +204,7 @@ class EmotionClassificationProcessor:
             self.plot_emotion_distribution(df_combined['Emotion Category'], 'Emotion By Score and Keyword', 'combined_emotion_distribution')
         return df_combined
 
-    def add_qa_emotion_tag_to_xml(self, xml_file_path: str, qa_df: pd.DataFrame, file_name: str) -> None:
-        tree = ET.parse(xml_file_path)
-        root = tree.getroot()
-
+    def add_qa_emotion_tag_to_xml(self, root, qa_df: pd.DataFrame):
         qa_section = root.find("./body/section[@name='Question and Answer']")
 
         idx = 0
@@ -206,11 +214,27 @@ class EmotionClassificationProcessor:
                 emotion_element = ET.SubElement(text_element, "emotion")
                 emotion_element.text = qa_df.loc[idx, 'Emotion Category'].lower()
             idx += 1
-            
-        # Save the modified XML file
-        tree.write(file_name, encoding='utf-8', xml_declaration=True)
-        print(f"Updated XML file saved to {file_name}")
-    
+        return root
+
+    def process_root(self, root, file_name: str = "transcript"):
+        """Add emotion tags to the Q&A section of an in-memory transcript tree that already has sentiment tags
+
+        Args:
+            root: root element of the transcript XML
+            file_name: name used in progress messages
+
+        Returns:
+            root: the same element, with the emotion tags added
+        """
+        remove_tags(root, self.TAGS)
+        print(f"[{file_name}] Adding emotion tags to the XML for the Q&A section... ")
+        df = self.extract_qa_text(root)
+        # The scores are read from the XML as strings; the score range rules need numbers
+        for column in ['Positive Score', 'Negative Score', 'Neutral Score']:
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+        df = self.get_final_emotion_tags_from_df(df, plot=False)
+        return self.add_qa_emotion_tag_to_xml(root, df)
+
     def complete_emotion_tagging(self, xml_file_path: str) -> None:
         # Extract file name
         print("xml_file_path: ", xml_file_path)
@@ -220,22 +244,12 @@ class EmotionClassificationProcessor:
         file_name = os.path.splitext(file_name_with_extension)[0]
         print("file_name: ", file_name)   
         # Q&A SECTION
-        print(f"[{file_name}] Adding emotion tags to the XML for the Q&A section... ")
-        df = self.extract_qa_text(xml_file_path)
-        output = f'qa_{file_name}.csv'
-        df.to_csv(output, index=False) # MUST SAVE THE DATA
-
-        # ADD EMOTION TAGS TO DF
-        df = self.get_final_emotion_tags(output, plot=False)
-        # output = f'csv/emotions_qa_{file_name}.csv'
-        # df.to_csv(output, index=False) # SAVE THE DATA  (OPTIONAL)
-
-        # ADD TAGS TO XML
-        file_output = xml_file_path
-        self.add_qa_emotion_tag_to_xml(xml_file_path, df, file_output)
+        tree = ET.parse(xml_file_path)
+        self.process_root(tree.getroot(), file_name)
 
-        # CLEANUP
-        os.remove(f'qa_{file_name}.csv')
+        # Save the modified XML file
+        write_xml(tree.getroot(), xml_file_path)
+        print(f"Updated XML file saved to {xml_file_path}")
 
     def process_file(self, xml_file_path: str):
         self.complete_emotion_tagging(xml_file_path)
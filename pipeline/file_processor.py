@@ -3,74 +3,376 @@ from sentiment_analysis_processor import SentimentAnalysisProcessor
 from emotion_classification_processor import EmotionClassificationProcessor
 from summary_processor import SummaryProcessor
 from indexInfo_processor import IndexProcessor
+from stage_cache import StageCache, STAGES
+from stage_scheduler import Stage, StageScheduler
+from metrics import METRICS
+from resources import MODELS
+from transcript_schema import TranscriptValidationError, check
+from xml_io import ET, atomic_write, write_xml
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import argparse
+import gc
+import multiprocessing
 import os
+import shutil
+import traceback
+
+# Stage processors of a pool worker, built once by _init_worker and reused for every file
+_WORKER_PROCESSOR = None
+
+
+def _init_worker(save_dir, use_cache, rebuild, parallel_stages, quarantine_dir):
+    """Pool initializer: load FinBERT, the OpenAI client and the other stage resources once per worker."""
+    global _WORKER_PROCESSOR
+    # A forked worker starts with a copy of the metrics of the parent, which the parent already counts
+    METRICS.drain()
+    _WORKER_PROCESSOR = FileProcessor(file_dir=None, save_dir=save_dir, use_cache=use_cache, rebuild=rebuild,
+                                      parallel_stages=parallel_stages, quarantine_dir=quarantine_dir)
+    _WORKER_PROCESSOR.warm_up()
+    inherited = sum(row["inherited"] for row in MODELS.stats())
+    print(f"[worker {os.getpid()}] stage models loaded, {inherited} inherited from the parent process")
+
+
+def _process_in_worker(file_dir, filename, save_dir):
+    """Parse a transcript and run the enrichment stages on it inside a pool worker.
+
+    Returns:
+        (file, error, entries, metrics): file is the name of the saved XML file; error is None on
+            success, otherwise the formatted traceback; entries are the stage cache manifest entries
+            and metrics the stage records and other counters of the worker for the parent to merge
+    """
+    file = None
+    try:
+        root, file = _WORKER_PROCESSOR.parse_valid_transcript(file_dir, filename)
+        print(f"Transcript parsing completed: {file}")
+        root = _WORKER_PROCESSOR.run_stages(root, file, filename)
+        out_path = os.path.join(save_dir, file)
+        data = write_xml(root, out_path)
+        entries = {}
+        if _WORKER_PROCESSOR.cache is not None:
+            _WORKER_PROCESSOR.cache.record_written(filename, out_path, _WORKER_PROCESSOR.versions(), data)
+            entries = _WORKER_PROCESSOR.cache.entries(filename, STAGES + ["written"])
+        return file, None, entries, METRICS.drain()
+    except Exception:
+        return file, traceback.format_exc(), {}, METRICS.drain()
+
 
 class FileProcessor:
-    def __init__(self, file_dir, save_dir, filename=None):
+    def __init__(self, file_dir, save_dir, filename=None, workers=1, use_cache=True, rebuild=None, parallel_stages=True,
+                 metrics_dir=None, quarantine_dir=None):
         self.file_dir = file_dir
         self.save_dir = save_dir
         self.filename = filename
+        self.workers = workers
+        self.parallel_stages = parallel_stages
+        self.use_cache = use_cache
+        self.rebuild = rebuild
+        # Stage timings and counters are exported here after every transcript
+        self.metrics_dir = metrics_dir
+        # Transcripts that do not match the transcript schema are set aside here instead of being enriched
+        self.quarantine_dir = quarantine_dir if quarantine_dir else os.path.join(save_dir, "quarantine") if save_dir else None
+        # Stage outputs are cached next to the XML files, reruns skip stages whose input did not change
+        # and folder runs resume where an interrupted run stopped
+        self.cache = StageCache(save_dir, rebuild) if use_cache and save_dir else None
         self.tp = TranscriptParser()
+        # Models load lazily; with a process pool they are only loaded in the workers
+        self.load_stages()
+
+    def load_stages(self):
+        # The parser queues the price requests of the calls it parses for this stage
+        self.price_processor = self.tp.price_processor
         self.sa_processor = SentimentAnalysisProcessor()
         self.ec_processor = EmotionClassificationProcessor()
         self.su_processor = SummaryProcessor()
         self.index_processor = IndexProcessor()
 
-    def process_single_file(self, save_dir):
-        print(f"Processing file: {self.file_dir}")
-        file = self.tp.process_file(self.file_dir, self.filename, self.save_dir)
-        temp_filename= os.path.join(save_dir, file)
-        print(f"Transcript parsing completed. File saved in: {temp_filename}")
+    def warm_up(self):
+        """Load the models and data the stages otherwise load lazily on first use."""
+        self.sa_processor.warm_up()
+        self.ec_processor.warm_up()
+        self.su_processor.warm_up()
+
+    def versions(self):
+        """Combined version of the parser and every stage, recorded with each saved XML file."""
+        versions = [f"parse:{self.tp.stage_version()}"]
+        versions += [f"{stage.name}:{stage.processor.stage_version()}" for stage in self.stages()]
+        return ";".join(versions)
+
+    def already_processed(self, file_dir, filename):
+        """True if an earlier run saved this transcript and nothing it depends on changed since."""
+        if self.cache is None:
+            return False
+        input_hash = StageCache.hash_file(os.path.join(file_dir, filename))
+        if self.cache.finished(filename, input_hash, self.versions()):
+            print(f"[{filename}] already processed, skipping")
+            return True
+        return False
+
+    def stages(self):
+        """Enrichment stages and the stages whose tags they read.
+
+        Summaries (OpenAI), stock and index prices (yfinance) only need the parsed transcript, so
+        they run while FinBERT scores the sentiment; emotion classification reads the sentiment scores.
+        The order of the list is the order the tags appear in the XML.
+        """
+        return [
+            Stage("sentiment", self.sa_processor, message="Sentiment analysis completed."),
+            Stage("emotion", self.ec_processor, deps=["sentiment"], message="Emotion classification completed."),
+            Stage("summary", self.su_processor, message="Summary generation completed."),
+            Stage("prices", self.price_processor, message="Header stock prices completed."),
+            Stage("index", self.index_processor, message="index header addition completed."),
+        ]
+
+    def parse_transcript(self, file_dir, filename):
+        """Parse a transcript, or load the parsed tree from the stage cache if the RTF did not change.
+
+        Returns:
+            root: root element of the parsed transcript XML
+            file: name of the output XML file
+        """
+        with METRICS.stage("parse", filename):
+            if self.cache is None:
+                return self.tp.parse_file(file_dir, filename)
+            return self.parse_cached(file_dir, filename)
+
+    def parse_valid_transcript(self, file_dir, filename):
+        """Parse a transcript and check it against the transcript schema before any stage runs on it.
+
+        A transcript the parser cannot lay out, or whose parsed tree misses a section, lists a
+        speaker that is not a call participant or has no text, is quarantined before any
+        enrichment stage runs, so FinBERT and OpenAI are not asked anything for it.
+
+        Raises:
+            TranscriptValidationError: listing the problems, after the transcript was quarantined
+        """
+        try:
+            root, file = self.parse_transcript(file_dir, filename)
+            with METRICS.stage("validate", filename):
+                check(root, filename)
+        except TranscriptValidationError as e:
+            self.quarantine(file_dir, filename, e)
+            raise
+        return root, file
 
-        self.sa_processor.process_file(temp_filename, self.save_dir)
-        print("Sentiment analysis completed.")
+    def quarantine(self, file_dir, filename, error):
+        """Copy a transcript into the quarantine folder, next to a <filename>.error.txt listing its problems."""
+        METRICS.count("quarantined_transcripts")
+        if self.quarantine_dir is None:
+            return
+        os.makedirs(self.quarantine_dir, exist_ok=True)
+        shutil.copy2(os.path.join(file_dir, filename), os.path.join(self.quarantine_dir, filename))
+        report = f"{os.path.join(file_dir, filename)}\n" + "".join(f"- {problem}\n" for problem in error.problems)
+        atomic_write(os.path.join(self.quarantine_dir, filename + ".error.txt"), report.encode("utf-8"))
+        print(f"[{filename}] quarantined in {self.quarantine_dir}: {error}")
 
-        self.ec_processor.process_file(temp_filename)
-        print("Emotion classification completed.")
+    def parse_cached(self, file_dir, filename):
+        input_hash = StageCache.hash_file(os.path.join(file_dir, filename))
+        version = self.tp.stage_version()
+        cached = self.cache.lookup(filename, "parse", input_hash, version)
+        if cached is not None:
+            print(f"[{filename}] parse unchanged, using cached result")
+            METRICS.count("cache_hits")
+            return ET.fromstring(cached), self.cache.entries(filename)["parse"]["file"]
 
-        self.su_processor.process_file(temp_filename)
-        print("Summary generation completed.")
+        root, file = self.tp.parse_file(file_dir, filename)
+        self.cache.store(filename, "parse", input_hash, version, ET.tostring(root, encoding='utf-8'), file=file)
+        return root, file
 
-        self.index_processor.process_file(temp_filename)
-        print("index header addition completed.")
+    def run_stages(self, root, file_name, transcript=None):
+        """Run every enrichment stage on an in-memory transcript tree.
+
+        The tree is handed to the stages without touching the disk, so a transcript is parsed
+        once and serialized once no matter how many stages it goes through. Stages that do not
+        depend on each other run at the same time, so a transcript takes as long as its slowest
+        chain of stages. With the stage cache enabled, a stage whose input and version match the
+        manifest is not run and its recorded output is used instead.
+
+        Args:
+            root: root element of the parsed transcript XML
+            file_name: name of the output XML file, used in progress messages
+            transcript: name of the source transcript, the stage cache key
+
+        Returns:
+            root: the same element, with sentiment, emotion, summary and index tags added
+        """
+        name = os.path.splitext(file_name)[0]
+
+        def run_stage(stage, stage_input):
+            with METRICS.stage(stage.name, transcript if transcript else file_name):
+                return run_cached(stage, stage_input)
+
+        def run_cached(stage, stage_input):
+            if self.cache is None or transcript is None:
+                return stage.processor.process_root(stage_input, name)
+            input_hash = StageCache.hash_bytes(ET.tostring(stage_input, encoding='utf-8'))
+            version = stage.processor.stage_version()
+            cached = self.cache.lookup(transcript, stage.name, input_hash, version)
+            if cached is not None:
+                print(f"[{name}] {stage.name} unchanged, using cached result")
+                METRICS.count("cache_hits")
+                return ET.fromstring(cached)
+            output = stage.processor.process_root(stage_input, name)
+            self.cache.store(transcript, stage.name, input_hash, version, ET.tostring(output, encoding='utf-8'))
+            return output
+
+        scheduler = StageScheduler(self.stages(), max_workers=None if self.parallel_stages else 1)
+        return scheduler.run(root, run_stage)
+
+    def process_transcript(self, file_dir, filename, save_dir):
+        root, file = self.parse_valid_transcript(file_dir, filename)
+        print(f"Transcript parsing completed: {file}")
+
+        root = self.run_stages(root, file, filename)
+
+        out_path = os.path.join(save_dir, file)
+        data = write_xml(root, out_path)
+        if self.cache is not None:
+            self.cache.record_written(filename, out_path, self.versions(), data)
+            self.cache.save()
+        METRICS.export(self.metrics_dir)
+        print(f"File saved in: {out_path}")
         return file
 
+    def process_single_file(self, save_dir=None):
+        save_dir = save_dir if save_dir else self.save_dir
+        print(f"Processing file: {self.file_dir}")
+        return self.process_transcript(self.file_dir, self.filename, save_dir)
+
+    def list_transcripts(self):
+        transcripts = []
+        for root, dirs, files in os.walk(os.path.abspath(self.file_dir)):
+            for filename in files:
+                if filename.endswith(".rtf"):
+                    transcripts.append((root, filename))
+        return transcripts
+
+    def prefetch_prices(self, transcripts):
+        """Fetch the stock and index prices of every call in the folder in a few bulk requests.
+
+        Only the header of each transcript is read here. The price stages of the transcripts then
+        find their prices in the market data store instead of asking Yahoo Finance one call at a time.
+        """
+        for file_dir, filename in transcripts:
+            try:
+                self.price_processor.queue(*self.tp.read_header(file_dir, filename))
+            except Exception as e:
+                # The transcript fails or fetches its own prices when it is processed
+                print(f"[{filename}] could not read the header: {e}")
+        self.price_processor.resolve(self.index_processor.INDICES)
+
     def process_all_files(self):
         print(f"Processing all files in folder: {self.file_dir}")
-        self.tp.process_folder(self.file_dir, self.save_dir)
-        print("Transcript parsing for all files completed.")
+        transcripts = [(file_dir, filename) for file_dir, filename in self.list_transcripts()
+                       if not self.already_processed(file_dir, filename)]
+        self.prefetch_prices(transcripts)
+        if self.workers > 1:
+            failed = self.process_all_files_parallel(transcripts)
+        else:
+            failed = {}
+            quarantined = 0
+            for root, filename in transcripts:
+                try:
+                    self.process_transcript(root, filename, self.save_dir)
+                except TranscriptValidationError as e:
+                    failed[filename] = str(e)
+                    quarantined += 1
+                except Exception:
+                    # Like a pool worker, a failure in one file does not stop the others
+                    failed[filename] = traceback.format_exc()
+                    print(f"Failed to process {filename}:\n{failed[filename]}")
+            print(f"Processing for all files completed: {len(transcripts) - len(failed)} succeeded, "
+                  f"{quarantined} quarantined, {len(failed) - quarantined} failed.")
+        if self.cache is not None:
+            self.cache.prune()
+        METRICS.export(self.metrics_dir)
+        return failed
 
-        self.sa_processor.process_folder(self.save_dir)
-        print("Sentiment analysis for all files completed.")
+    def process_all_files_parallel(self, transcripts):
+        """Spread the transcripts of the folder across a process pool.
 
-        self.ec_processor.process_folder(self.save_dir)
-        print("Emotion classification for all files completed.")
+        Each worker parses its transcripts and runs their enrichment stages. Where workers are forked,
+        the models are loaded here first and the workers inherit them. Speaker ids come from
+        the shared speaker registry database, which hands out every id once however many workers
+        parse at the same time. A failure in one file is reported and does not stop the others.
 
-        self.su_processor.process_folder(self.save_dir)
-        print("Summary generation completed.")
+        Args:
+            transcripts: (folder, filename) of every transcript to process
+
+        Returns:
+            failed: dict mapping the transcript name to the error message of every file that failed
+        """
+        print(f"Processing with {self.workers} worker processes")
+        context = multiprocessing.get_context()
+        if context.get_start_method() == "fork":
+            # Forked workers inherit the models loaded here and share their weights copy-on-write.
+            # Frozen objects are left alone by the garbage collector, which would otherwise copy their pages
+            self.warm_up()
+            gc.freeze()
+        failed = {}
+        done = 0
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(self.save_dir, self.use_cache, self.rebuild, self.parallel_stages,
+                                           self.quarantine_dir)) as pool:
+            futures = {}
+            for file_dir, filename in transcripts:
+                futures[pool.submit(_process_in_worker, file_dir, filename, self.save_dir)] = filename
+
+            for future in as_completed(futures):
+                filename = futures[future]
+                file, error, entries, metrics = future.result()
+                if self.cache is not None:
+                    self.cache.update(filename, entries)
+                    # Workers are still appending to the journal, keep it until the pool is done
+                    self.cache.save(compact=False)
+                METRICS.merge(*metrics)
+                METRICS.export(self.metrics_dir)
+                if error:
+                    failed[filename] = error
+                    print(f"Failed to process {filename}:\n{error}")
+                else:
+                    done += 1
+                    print(f"File saved in: {os.path.join(self.save_dir, file)}")
+
+        if self.cache is not None:
+            self.cache.save()
+        print(f"Processing for all files completed: {done} succeeded, {len(failed)} failed.")
+        for file in failed:
+            print(f"  failed: {file}")
+        return failed
 
-        self.index_processor.process_folder(self.save_dir)
-        print("index header addition completed.")
-        
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Process files for sentiment and emotion analysis.")
     parser.add_argument("--file-dir", type=str, required=True, help="Directory containing the files to process.")
     parser.add_argument("--save-dir", type=str, required=True, help="Directory to save processed files.")
     parser.add_argument("--filename", type=str, required=False, help="Name of a specific file to process.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes used when processing a whole folder.")
+    parser.add_argument("--rebuild", action="append", choices=STAGES + ["all"], help="Recompute a stage even if its cached result is up to date. Can be repeated.")
+    parser.add_argument("--no-cache", action="store_true", help="Run every stage without reading or writing the stage cache.")
+    parser.add_argument("--serial-stages", action="store_true", help="Run the stages of a transcript one at a time instead of overlapping independent ones.")
+    parser.add_argument("--metrics-dir", type=str, required=False, help="Directory to write per-stage metrics to (metrics.jsonl and metrics.prom).")
+    parser.add_argument("--quarantine-dir", type=str, required=False, help="Directory for transcripts that fail validation. Defaults to <save-dir>/quarantine.")
     args = parser.parse_args()
 
     if args.filename:
-        processor = FileProcessor(file_dir=args.file_dir, save_dir=args.save_dir, filename=args.filename)
+        processor = FileProcessor(file_dir=args.file_dir, save_dir=args.save_dir, filename=args.filename,
+                                  use_cache=not args.no_cache, rebuild=args.rebuild, parallel_stages=not args.serial_stages,
+                                  metrics_dir=args.metrics_dir, quarantine_dir=args.quarantine_dir)
         processor.process_single_file()
+        METRICS.report()
     else:
-        processor = FileProcessor(file_dir=args.file_dir, save_dir=args.save_dir)
+        processor = FileProcessor(file_dir=args.file_dir, save_dir=args.save_dir, workers=args.workers,
+                                  use_cache=not args.no_cache, rebuild=args.rebuild, parallel_stages=not args.serial_stages,
+                                  metrics_dir=args.metrics_dir, quarantine_dir=args.quarantine_dir)
         processor.process_all_files()
+        METRICS.report()
 
 '''
 Example:
 
 python file_processor.py --file-dir "transcripts/NTRS" --save-dir "xml" --filename "Northern Trust Corporation, Q1 2024 Earnings Call, Apr 16, 2024.rtf"
 python file_processor.py --file-dir "transcripts" --save-dir "xml"
-'''
\ No newline at end of file
+python file_processor.py --file-dir "transcripts" --save-dir "xml" --workers 4
+python file_processor.py --file-dir "transcripts" --save-dir "xml" --rebuild sentiment
+python file_processor.py --file-dir "transcripts" --save-dir "xml" --metrics-dir "metrics"
+'''
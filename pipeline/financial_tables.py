@@ -0,0 +1,158 @@
+import argparse
+import io
+import os
+from xml_io import atomic_write
+
+# Columns of the store, one row per value of a table
+COLUMNS = ["call", "ticker", "quarter", "year", "table", "metric", "period", "type", "value"]
+ESTIMATES = "estimates"
+EPS_HISTORY = "eps_history"
+EPS_NORMALIZED = "EPS Normalized"
+
+
+def to_number(cell):
+    """Value of a table cell as a float, e.g. "1,234.5", "5.21 %" or "(0.12)"; None if it has none."""
+    text = cell.replace(",", "").replace("%", "").strip()
+    negative = text.startswith("(") and text.endswith(")")
+    try:
+        value = float(text.strip("()"))
+    except ValueError:
+        return None
+    return -value if negative else value
+
+
+def period_name(cell):
+    """Period of a header cell, "-FQ1 2020-" -> "FQ1 2020"."""
+    return " ".join(cell.replace("-", " ").split())
+
+
+def estimate_rows(table):
+    """Values of the earnings estimates table as (metric, period, type, value).
+
+    The first row names the periods and the second the type of every column. A period spans
+    as many columns as it has types (CONSENSUS, ACTUAL and SURPRISE for the quarter just reported,
+    only CONSENSUS for the estimates ahead), so a column starts the next period when its type was
+    already seen in the current one.
+    """
+    periods = [period_name(cell) for cell in table[0][1:] if cell.strip()]
+    columns = []
+    seen = set()
+    position = -1
+    for value_type in table[1][1:]:
+        if position < 0 or value_type in seen:
+            position += 1
+            seen = set()
+        seen.add(value_type)
+        columns.append((periods[position] if position < len(periods) else None, value_type))
+
+    rows = []
+    for row in table[2:]:
+        metric = " ".join(row[0].split())
+        for (period, value_type), cell in zip(columns, row[1:]):
+            if period is not None:
+                rows.append((metric, period, value_type, to_number(cell)))
+    return rows
+
+
+def eps_history_rows(table):
+    """Values of the EPS normalized table of the past quarters as (metric, period, type, value).
+
+    After the two header rows every row is a period followed by a value for every type of the
+    second header row.
+    """
+    types = table[1][1:]
+    rows = []
+    for row in table[2:]:
+        for value_type, cell in zip(types, row[1:]):
+            if value_type:
+                rows.append((EPS_NORMALIZED, period_name(row[0]), value_type, to_number(cell)))
+    return rows
+
+
+def table_rows(estimates, eps_history):
+    """Typed rows of the two financial tables of a transcript, (table, metric, period, type, value)."""
+    return [(ESTIMATES, *row) for row in estimate_rows(estimates)] + \
+        [(EPS_HISTORY, *row) for row in eps_history_rows(eps_history)]
+
+
+def surprises(frame):
+    """Consensus, actual and surprise of every reported value, one row per call, table, metric and period.
+
+    Periods without an actual value, the estimates ahead, are left out.
+
+    Args:
+        frame: rows of the store, e.g. FinancialTableStore.load()
+
+    Returns:
+        DataFrame with the CONSENSUS, ACTUAL and SURPRISE columns, SURPRISE in percent
+    """
+    reported = frame.pivot_table(index=["call", "ticker", "quarter", "year", "table", "metric", "period"],
+                                 columns="type", values="value", aggfunc="first")
+    return reported.dropna(subset=["ACTUAL"]).reset_index()
+
+
+class FinancialTableStore:
+    """Typed values of the Financial Tables section of every transcript, stored as Parquet.
+
+    Every call is one Parquet file in the store directory, named like its XML, so parser
+    processes write their calls without waiting for each other and a reparsed call replaces its
+    rows. load() reads the whole directory as one dataset, so questions over the corpus, like
+    the EPS surprise of every call, are column scans instead of walking every XML tree.
+    """
+
+    def __init__(self, path="financial_tables"):
+        self.path = path
+
+    def file_path(self, call):
+        return os.path.join(self.path, f"{call}.parquet")
+
+    def write(self, call, ticker, quarter, year, rows):
+        """Replace the rows of a call.
+
+        Args:
+            call: file name of the transcript without extension, e.g. BK-Q1-2020
+            ticker, quarter, year: the header of the transcript
+            rows: (table, metric, period, type, value) from table_rows
+        """
+        import pandas as pd
+        frame = pd.DataFrame([(call, ticker, quarter, int(year), *row) for row in rows], columns=COLUMNS)
+        frame = frame.astype({"year": "int16", "value": "float64"})
+        buffer = io.BytesIO()
+        frame.to_parquet(buffer, engine="pyarrow", index=False)
+        os.makedirs(self.path, exist_ok=True)
+        atomic_write(self.file_path(call), buffer.getvalue())
+
+    def load(self, columns=None, filters=None):
+        """Rows of every call in the store as a DataFrame.
+
+        Args:
+            columns: columns to read, all by default
+            filters: pyarrow row filters, e.g. [("ticker", "=", "BK")]
+        """
+        import pandas as pd
+        if not os.path.isdir(self.path) or not any(name.endswith(".parquet") for name in os.listdir(self.path)):
+            return pd.DataFrame(columns=COLUMNS)
+        return pd.read_parquet(self.path, engine="pyarrow", columns=columns, filters=filters)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the EPS surprise of every call in the financial table store.")
+    parser.add_argument("--store", type=str, default="financial_tables", help="Directory of the financial table store.")
+    parser.add_argument("--ticker", type=str, action="append", help="Only show these tickers, can be repeated.")
+    args = parser.parse_args()
+
+    filters = [("metric", "=", EPS_NORMALIZED)]
+    if args.ticker:
+        filters.append(("ticker", "in", args.ticker))
+    frame = FinancialTableStore(args.store).load(filters=filters)
+    if frame.empty:
+        print("No calls in the store.")
+    else:
+        print(surprises(frame).to_string(index=False))
+
+'''
+Example:
+
+python financial_tables.py
+python financial_tables.py --store "financial_tables" --ticker BK
+'''
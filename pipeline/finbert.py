@@ -0,0 +1,436 @@
+import bisect
+import hashlib
+import os
+import re
+import threading
+import time
+from configparser import ConfigParser
+from pathlib import Path
+from metrics import METRICS
+from resources import hf_tokenizer, onnx_session, sequence_classifier
+from sentiment_cache import text_key
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+CONFIG = ConfigParser()
+CONFIG.read(BASE_DIR / "config.ini")
+# Branch, tag or commit of the hub model to load, empty for the latest
+REVISION = CONFIG.get("SENTIMENT", "revision", fallback="")
+# torch, or onnx for the int8 quantized model run by ONNX Runtime on CPU
+BACKEND = CONFIG.get("SENTIMENT", "backend", fallback="torch")
+# Quantized model of the onnx backend, exported on first use when missing
+ONNX_PATH = CONFIG.get("SENTIMENT", "onnx_path", fallback="models/finbert-int8.onnx")
+# Padded tokens per forward pass: texts in the batch times the tokens of the longest one
+MAX_TOKENS = CONFIG.getint("SENTIMENT", "max_tokens", fallback=8192)
+# Largest token count of every length bucket, batches never mix texts of two buckets
+LENGTH_BUCKETS = [int(edge) for edge in CONFIG.get("SENTIMENT", "length_buckets", fallback="16,32,64,128,256,512").split(",")]
+# Tokens two consecutive windows of a text longer than FinBERT reads have in common
+WINDOW_OVERLAP = CONFIG.getint("SENTIMENT", "window_overlap", fallback=128)
+# How the window scores of a long text make its score: mean, max_negative or length_weighted
+WINDOW_AGGREGATION = CONFIG.get("SENTIMENT", "window_aggregation", fallback="length_weighted")
+
+# Labels of the FinBERT logits, in order
+LABELS = ["positive", "negative", "neutral"]
+# Tokens FinBERT reads, [CLS] and [SEP] included
+MAX_LENGTH = 512
+AGGREGATIONS = ["mean", "max_negative", "length_weighted"]
+
+
+def label(scores):
+    """Label of the highest of the (pos, neg, neutr) scores, the first one on a tie."""
+    return LABELS[scores.index(max(scores))]
+
+
+def checkpoint_fingerprint(path):
+    """Short hash of the names, sizes and modification times of the files of a local checkpoint."""
+    paths = [path] if os.path.isfile(path) else sorted(
+        os.path.join(folder, file) for folder, _, files in os.walk(path) for file in files)
+    digest = hashlib.sha256()
+    for file in paths:
+        stat = os.stat(file)
+        digest.update(f"{os.path.relpath(file, path)}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:12]
+
+
+def weights_revision(model_name, model):
+    """Hub commit a model was loaded from, or the fingerprint of its local checkpoint."""
+    commit = getattr(model.config, "_commit_hash", None)
+    if commit:
+        return commit
+    if os.path.exists(model_name):
+        return checkpoint_fingerprint(model_name)
+    return "unversioned"
+
+
+def aggregate(scores, lengths, rule):
+    """Score of a text from the scores of its windows.
+
+    Args:
+        scores: (pos, neg, neutr) tuple of every window
+        lengths: tokens of every window
+        rule: mean of the windows, max_negative for the scores of the most negative window, or
+            length_weighted for their mean weighted by their tokens
+
+    Returns:
+        scores: (pos, neg, neutr) of the text
+    """
+    if rule == "max_negative":
+        return max(scores, key=lambda window: window[1])
+    if rule == "mean":
+        weights = [1] * len(scores)
+    elif rule == "length_weighted":
+        weights = lengths
+    else:
+        raise ValueError(f"Unknown window aggregation {rule!r}, expected one of {', '.join(AGGREGATIONS)}")
+    return tuple(sum(weight * window[k] for weight, window in zip(weights, scores)) / sum(weights) for k in range(len(LABELS)))
+
+
+class FinBert:
+    """FinBERT sentiment scores of many texts, run in batches.
+
+    score() takes every text to classify at once, e.g. the sentences of all presentation
+    statements and all Q&A turns of one or several transcripts, and runs them through the model
+    under torch.inference_mode(). The texts are tokenized, sorted by token count and put in
+    length buckets (LENGTH_BUCKETS). Each bucket is cut into batches of at most max_tokens padded
+    tokens and at most batch_size texts, so two-word fragments go through the model hundreds at a
+    time and 500-token turns a dozen at a time, and a batch is padded to about the length of its
+    own texts. The scores come back in the order of the input. Padding is masked out, so a text
+    gets the scores it gets when run alone, up to float rounding.
+
+    A text longer than the 512 tokens FinBERT reads, e.g. a long answer of an executive, is not
+    truncated: it is split into windows of 512 tokens that overlap by window_overlap tokens, the
+    windows are scored in the same batches as the other texts, and their scores are aggregated
+    into the score of the text (aggregate()).
+
+    The texts, batches, padding and time of every bucket are kept for bucket_stats() and
+    report(), to tune max_tokens to the cores of the machine.
+
+    With a SentimentCache, texts scored before by the same model revision are read from it, a
+    text repeated in the input is scored once, and only the new texts go through the model. The
+    revision is the hub commit of the weights, or a fingerprint of a local checkpoint, so new
+    weights under the same model name start from an empty cache.
+    """
+
+    def __init__(self, model_name="ProsusAI/finbert", batch_size=128, cache=None, max_tokens=MAX_TOKENS,
+                 buckets=LENGTH_BUCKETS, window_overlap=WINDOW_OVERLAP, aggregation=WINDOW_AGGREGATION,
+                 hub_revision=REVISION):
+        """
+        Args:
+            model_name: Hugging Face model or local checkpoint
+            batch_size: most texts per forward pass
+            cache: SentimentCache, or None to run every text through the model
+            max_tokens: most padded tokens per forward pass, None for no limit
+            buckets: largest token count of every length bucket, in increasing order
+            window_overlap: tokens consecutive windows of a long text have in common
+            aggregation: mean, max_negative or length_weighted, see aggregate()
+            hub_revision: branch, tag or commit of the hub model to load, empty for the latest
+        """
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Unknown window aggregation {aggregation!r}, expected one of {', '.join(AGGREGATIONS)}")
+        if not 0 <= window_overlap < MAX_LENGTH - 2:
+            raise ValueError(f"Window overlap must be between 0 and {MAX_LENGTH - 3} tokens, not {window_overlap}")
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.cache = cache
+        self.max_tokens = max_tokens
+        self.buckets = sorted(buckets)
+        self.window_overlap = window_overlap
+        self.aggregation = aggregation
+        self.hub_revision = hub_revision if hub_revision else None
+        # Model the scores come from, without loading it
+        self.name = model_name if self.hub_revision is None else f"{model_name}@{self.hub_revision}"
+        self._revision = None
+        # Bucket -> texts, batches, tokens, padded tokens and seconds of the batches run so far
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    @property
+    def tokenizer(self):
+        # Loaded on first use, once per process whichever processor asks
+        return sequence_classifier(self.model_name, self.hub_revision)[0]
+
+    @property
+    def model(self):
+        return sequence_classifier(self.model_name, self.hub_revision)[1]
+
+    def warm_up(self):
+        sequence_classifier(self.model_name, self.hub_revision)
+
+    @property
+    def revision(self):
+        """Revision of the weights that compute the scores, under which the cache keeps them.
+
+        A pinned commit is used as it is. Otherwise the model is loaded to read the commit it
+        came from, so scores of other weights under the same name are not read from the cache.
+        """
+        if self._revision is None:
+            if self.hub_revision is not None and re.fullmatch(r"[0-9a-f]{40}", self.hub_revision):
+                self._revision = f"{self.model_name}@{self.hub_revision}"
+            else:
+                self._revision = f"{self.model_name}@{weights_revision(self.model_name, self.model)}"
+        return self._revision
+
+    def windowing(self):
+        """How long texts are scored, part of the version of the scores the sentiment stage writes."""
+        return f"windows-{self.window_overlap}-{self.aggregation}"
+
+    def score(self, texts):
+        """Sentiment scores of every text, from the cache where it has them.
+
+        Args:
+            texts: the texts to classify
+
+        Returns:
+            scores: (pos, neg, neutr) tuple of every text, in the order of texts
+        """
+        texts = list(texts)
+        windows = self.windows(texts)
+        # Every text, or its windows when it is too long, goes into the same batches
+        parts = [part for text in texts for part, _ in windows.get(text, [(text, None)])]
+        part_scores = iter(self.score_texts(parts))
+        scores = []
+        for text in texts:
+            if text in windows:
+                window_scores = [next(part_scores) for _ in windows[text]]
+                scores.append(aggregate(window_scores, [length for _, length in windows[text]], self.aggregation))
+            else:
+                scores.append(next(part_scores))
+        return scores
+
+    def windows(self, texts):
+        """Overlapping windows of the texts longer than the model reads.
+
+        Every window has at most 510 tokens, so that it is read whole with [CLS] and [SEP], and
+        starts window_overlap tokens before the end of the one before. A window is the span of the
+        text its tokens come from.
+
+        Returns:
+            windows: dict mapping every long text to a list of (window text, tokens)
+        """
+        # Every token has at least one character, so only texts this long can be too long
+        candidates = list(dict.fromkeys(text for text in texts if len(text) > MAX_LENGTH - 2))
+        if not candidates:
+            return {}
+        size = MAX_LENGTH - 2
+        step = size - self.window_overlap
+        windows = {}
+        encodings = self.tokenizer(candidates, add_special_tokens=False, return_offsets_mapping=True)
+        for text, offsets in zip(candidates, encodings["offset_mapping"]):
+            if len(offsets) <= size:
+                continue
+            windows[text] = []
+            for start in range(0, len(offsets), step):
+                end = min(start + size, len(offsets))
+                windows[text].append((text[offsets[start][0]:offsets[end - 1][1]], end - start))
+                if end == len(offsets):
+                    break
+            METRICS.count("finbert_long_texts")
+            METRICS.count("finbert_windows", len(windows[text]))
+        return windows
+
+    def score_texts(self, texts):
+        """Sentiment scores of texts the model reads whole, from the cache where it has them."""
+        if self.cache is None:
+            return self.infer(texts)
+        keys = [text_key(text) for text in texts]
+        unique = dict(zip(keys, texts))
+        known = self.cache.lookup(list(unique), self.revision)
+        new_keys = [key for key in unique if key not in known]
+        computed = dict(zip(new_keys, self.infer([unique[key] for key in new_keys])))
+        self.cache.store(computed, self.revision)
+        known.update(computed)
+        return [known[key] for key in keys]
+
+    def infer(self, texts):
+        """Sentiment scores of every text, computed by the model.
+
+        Returns:
+            scores: (pos, neg, neutr) tuple of every text, in the order of texts
+        """
+        texts = list(texts)
+        scores = [None] * len(texts)
+        if not texts:
+            return scores
+        lengths = self.token_lengths(texts)
+        for bucket, batch in self.batches(lengths):
+            start = time.perf_counter()
+            probabilities = self.forward([texts[i] for i in batch])
+            seconds = time.perf_counter() - start
+            tokens = sum(lengths[i] for i in batch)
+            padded = len(batch) * max(lengths[i] for i in batch)
+            self.record(bucket, len(batch), tokens, padded, seconds)
+            for i, row in zip(batch, probabilities):
+                scores[i] = tuple(row)
+        return scores
+
+    def token_lengths(self, texts):
+        """Tokens the model reads of every text, with [CLS] and [SEP]."""
+        return [len(ids) for ids in self.tokenizer(texts, truncation=True)["input_ids"]]
+
+    def bucket(self, length):
+        """Length bucket of a text of length tokens, the last one for anything longer."""
+        return self.buckets[min(bisect.bisect_left(self.buckets, length), len(self.buckets) - 1)]
+
+    def batches(self, lengths):
+        """Batches of text indices, in increasing token count.
+
+        Yields:
+            (bucket, indices): the indices of the texts of one forward pass and their bucket
+        """
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+        batch, batch_bucket = [], None
+        for i in order:
+            bucket = self.bucket(lengths[i])
+            # Texts come in increasing length, so the new text sets the padded length
+            full = len(batch) >= self.batch_size or (
+                self.max_tokens is not None and (len(batch) + 1) * lengths[i] > self.max_tokens)
+            if batch and (bucket != batch_bucket or full):
+                yield batch_bucket, batch
+                batch = []
+            batch.append(i)
+            batch_bucket = bucket
+        if batch:
+            yield batch_bucket, batch
+
+    def record(self, bucket, texts, tokens, padded, seconds):
+        METRICS.count("finbert_forward_passes")
+        METRICS.count("finbert_texts", texts)
+        METRICS.count("finbert_tokens", tokens)
+        METRICS.count("finbert_padding_tokens", padded - tokens)
+        with self.lock:
+            stats = self.stats.setdefault(bucket, {"texts": 0, "batches": 0, "tokens": 0, "padded": 0, "seconds": 0.0})
+            stats["texts"] += texts
+            stats["batches"] += 1
+            stats["tokens"] += tokens
+            stats["padded"] += padded
+            stats["seconds"] += seconds
+
+    def bucket_stats(self):
+        """Batches run so far in every length bucket.
+
+        Returns:
+            stats: list of {"bucket", "texts", "batches", "tokens", "padded", "padding_ratio", "batch_ms", "texts_per_second"},
+            padded counts the tokens of the batches with their padding, padding_ratio is the share of them that is padding
+        """
+        with self.lock:
+            return [{"bucket": bucket, "texts": stats["texts"], "batches": stats["batches"], "tokens": stats["tokens"],
+                     "padded": stats["padded"], "padding_ratio": 1 - stats["tokens"] / stats["padded"],
+                     "batch_ms": 1000 * stats["seconds"] / stats["batches"],
+                     "texts_per_second": stats["texts"] / stats["seconds"] if stats["seconds"] else 0.0}
+                    for bucket, stats in sorted(self.stats.items())]
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {}
+
+    def report(self):
+        print(f"{'tokens':>8}{'texts':>8}{'batches':>9}{'texts/batch':>13}{'padding':>9}{'ms/batch':>10}{'texts/s':>10}")
+        for row in self.bucket_stats():
+            print(f"{'<=' + str(row['bucket']):>8}{row['texts']:>8}{row['batches']:>9}{row['texts'] / row['batches']:>13.1f}"
+                  f"{row['padding_ratio']:>9.1%}{row['batch_ms']:>10.1f}{row['texts_per_second']:>10.1f}")
+
+    def forward(self, texts):
+        """Softmax of the logits of one batch, as a list of [pos, neg, neutr] rows."""
+        import torch
+        with torch.inference_mode():
+            inputs = self.tokenizer(texts, padding=True, truncation=True, return_tensors='pt')
+            outputs = self.model(**inputs)
+            return torch.nn.functional.softmax(outputs.logits, dim=-1).tolist()
+
+
+class OnnxFinBert(FinBert):
+    """FinBERT run by ONNX Runtime on CPU, with its linear layers quantized to int8.
+
+    The model is exported from the PyTorch weights with dynamic batch and sequence axes, then
+    quantized with onnxruntime's dynamic quantization: weights are stored as int8 and activations
+    are quantized per batch, which makes the file about a quarter of the size and the forward pass
+    faster on CPU. Scores move by a few hundredths at most and depend slightly on the other texts
+    of the batch, so they are cached under their own revision, and a label can flip on texts the
+    model is unsure of; benchmarks/bench_finbert.py --onnx measures both against the PyTorch model.
+
+    Inference only needs onnxruntime and the tokenizer. Exporting needs torch and onnx as well,
+    and happens once, the first time the model file is missing.
+    """
+
+    def __init__(self, model_name="ProsusAI/finbert", batch_size=128, cache=None, max_tokens=MAX_TOKENS,
+                 buckets=LENGTH_BUCKETS, window_overlap=WINDOW_OVERLAP, aggregation=WINDOW_AGGREGATION,
+                 hub_revision=REVISION, path=ONNX_PATH):
+        super().__init__(model_name, batch_size, cache, max_tokens, buckets, window_overlap, aggregation, hub_revision)
+        self.path = path
+        self.name = f"{self.name}:onnx-int8"
+
+    @property
+    def tokenizer(self):
+        return hf_tokenizer(self.model_name, self.hub_revision)
+
+    @property
+    def revision(self):
+        """Fingerprint of the exported model file, which a new export changes."""
+        if self._revision is None:
+            self.export()
+            self._revision = f"{self.name}:{checkpoint_fingerprint(self.path)}"
+        return self._revision
+
+    @property
+    def session(self):
+        self.export()
+        return onnx_session(self.path)
+
+    def export(self):
+        if not os.path.exists(self.path):
+            export_onnx(self.model_name, self.path, self.hub_revision)
+
+    def warm_up(self):
+        # The session is not created here: ONNX Runtime sessions do not survive a fork, so every
+        # pool worker opens its own on first use
+        hf_tokenizer(self.model_name, self.hub_revision)
+        self.export()
+
+    def forward(self, texts):
+        import numpy as np
+        session = self.session
+        inputs = self.tokenizer(texts, padding=True, truncation=True, return_tensors='np')
+        feed = {node.name: inputs[node.name].astype(np.int64) for node in session.get_inputs()}
+        logits = session.run(["logits"], feed)[0]
+        exponentials = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        return (exponentials / exponentials.sum(axis=-1, keepdims=True)).tolist()
+
+
+def export_onnx(model_name, path, revision=None):
+    """Export a sequence classifier to ONNX and quantize its weights to int8.
+
+    Args:
+        model_name: Hugging Face model, e.g. ProsusAI/finbert
+        path: file of the quantized model, written atomically
+        revision: branch, tag or commit of the hub model, None for the latest
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    tokenizer, model = sequence_classifier(model_name, revision)
+    # In the order of the positional arguments of BertForSequenceClassification.forward
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    inputs = tokenizer(["Revenue grew 5% in the quarter."], return_tensors='pt')
+    axes = {name: {0: "batch", 1: "sequence"} for name in names}
+    axes["logits"] = {0: "batch"}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    full_precision = f"{path}.fp32.tmp"
+    quantized = f"{path}.tmp"
+    print(f"Exporting {model_name} to {path}")
+    try:
+        with torch.no_grad():
+            torch.onnx.export(model, tuple(inputs[name] for name in names), full_precision, input_names=names,
+                              output_names=["logits"], dynamic_axes=axes, opset_version=14)
+        quantize_dynamic(full_precision, quantized, weight_type=QuantType.QInt8)
+        os.replace(quantized, path)
+    finally:
+        for leftover in (full_precision, quantized):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+
+def engine(backend=BACKEND, model_name="ProsusAI/finbert", batch_size=128, cache=None, max_tokens=MAX_TOKENS):
+    """FinBert of the configured backend, torch or onnx."""
+    if backend == "torch":
+        return FinBert(model_name, batch_size, cache, max_tokens)
+    if backend == "onnx":
+        return OnnxFinBert(model_name, batch_size, cache, max_tokens)
+    raise ValueError(f"Unknown FinBERT backend {backend!r}, expected torch or onnx")
@@ -0,0 +1,156 @@
+import argparse
+import os
+from market_data import MARKET_DATA, call_date
+from xml_io import ET, remove_tags, write_xml
+
+
+class HeaderPriceProcessor:
+    """Daily stock prices of the company in the header of a transcript.
+
+    The parser writes the header without prices and queues the (ticker, day) of the call here.
+    resolve() then fetches the bars of every queued call that the market data store does not have
+    in a few bulk requests, and the prices are filled into the header of each transcript from the
+    store. A call without prices, e.g. because the request failed, gets no price tags at all,
+    stock_performance included, instead of stopping the transcript.
+    """
+    # Bump when a code change alters the tags this stage writes, so cached results are rebuilt
+    STAGE_VERSION = "2"
+    # Tags this stage adds to the header
+    TAGS = ["open_price", "close_price", "high_price", "low_price", "stock_performance"]
+
+    def __init__(self):
+        # (ticker, day) of the calls whose prices have not been fetched yet
+        self.pending = set()
+
+    def stage_version(self):
+        return self.STAGE_VERSION
+
+    def queue(self, ticker, time):
+        """Ask for the prices of a ticker on the day of a call, fetched by the next resolve()."""
+        self.pending.add((ticker, call_date(time)))
+
+    def resolve(self, tickers=()):
+        """Fetch the daily bars of every queued call that are not in the market data store yet.
+
+        Every ticker is asked for the days of every call, so the queued calls of a whole folder come
+        in one request per distinct missing range instead of one per call.
+
+        Args:
+            tickers: other tickers to fetch for the same days, e.g. the indices of IndexProcessor
+        """
+        if not self.pending:
+            return
+        tickers = sorted({ticker for ticker, _ in self.pending} | set(tickers))
+        days = sorted({day for _, day in self.pending})
+        try:
+            MARKET_DATA.prefetch(tickers, days)
+        except Exception as e:
+            # The lookups of the single calls will try again
+            print("An error occurred:", str(e))
+        self.pending.clear()
+
+    @staticmethod
+    def get_stock_info(ticker_symbol, time):
+        open_price,close_price, high_price, low_price = None, None, None, None
+
+        try:
+            # Served from the local market data store, Yahoo Finance is only asked for new days
+            data = MARKET_DATA.daily(ticker_symbol, call_date(time))
+
+            if data is not None:
+                open_price =  data['Open']
+                close_price = data['Close']
+                high_price = data['High']
+                low_price = data['Low']
+            else:
+                print("No data available for the specified date.")
+        except Exception as e:
+            print("An error occurred:", str(e))
+
+        return open_price,close_price, high_price, low_price
+
+    @staticmethod
+    def analyze_stock_performance(open_price, close_price, high_price, low_price):
+        if close_price > open_price:
+            return "increased"
+        elif close_price < open_price:
+            return "decreased"
+        else:
+            if high_price > open_price or high_price > close_price:
+                return "increased"
+            elif low_price < open_price or low_price < close_price:
+                return "decreased"
+            else:
+                return "neutral"
+
+    @staticmethod
+    def read_header(xml_file_path):
+        """Ticker and call time in the header of a transcript, read without parsing the rest of the file."""
+        ticker = time = None
+        for _, element in ET.iterparse(xml_file_path):
+            if element.tag == "ticker":
+                ticker = element.text
+            elif element.tag == "time":
+                time = element.text
+            elif element.tag == "header":
+                break
+        return ticker, time
+
+    def add_prices_to_header(self, root):
+        header = root.find("header")
+        ticker = header.find("ticker").text
+        time = header.find("time").text
+        prices = self.get_stock_info(ticker, time)
+        if None in prices:
+            # No tags rather than "None" in each of them, readers skip the missing prices
+            return root
+        values = [f"{price:.6f}" for price in prices] + [self.analyze_stock_performance(*prices)]
+        for tag, value in zip(self.TAGS, values):
+            ET.SubElement(header, tag).text = value
+        return root
+
+    def process_root(self, root, file_name="transcript"):
+        """Add the stock prices of the call to the header of an in-memory transcript tree.
+
+        Args:
+            root: root element of the transcript XML
+            file_name: name used in progress messages
+
+        Returns:
+            root: the same element, with the price tags added to the header
+        """
+        print(f"[{file_name}] Adding stock prices to the header...")
+        # Fetches what the parser queued so far, this call included
+        self.resolve()
+        remove_tags(root, self.TAGS, path="header")
+        return self.add_prices_to_header(root)
+
+    def process_file(self, xml_file_path):
+        root = ET.parse(xml_file_path).getroot()
+        root = self.process_root(root, os.path.splitext(os.path.basename(xml_file_path))[0])
+        write_xml(root, xml_file_path)
+
+    def process_folder(self, folder_path):
+        xml_file_paths = [os.path.join(folder_path, filename) for filename in os.listdir(folder_path) if filename.endswith('.xml')]
+        # The prices of every call in the folder come in a few requests
+        for xml_file_path in xml_file_paths:
+            ticker, time = self.read_header(xml_file_path)
+            if ticker and time:
+                self.queue(ticker, time)
+        for xml_file_path in xml_file_paths:
+            self.process_file(xml_file_path)
+            print(f"Processed {os.path.basename(xml_file_path)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill the stock prices into the header of parsed transcripts.")
+    parser.add_argument("--save-dir", type=str, required=True, help="Directory containing the XML files.")
+    args = parser.parse_args()
+
+    HeaderPriceProcessor().process_folder(args.save_dir)
+
+'''
+Example:
+
+python header_price_processor.py --save-dir "xml"
+'''
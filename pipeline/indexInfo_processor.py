@@ -1,39 +1,37 @@
-from summarization import Summarizer
 import os
-import pandas as pd
-import torch
-import yfinance as yf
-from xml.etree import ElementTree as ET
-from datetime import datetime,timedelta
+from market_data import MARKET_DATA, call_date
+from xml_io import ET, remove_tags, write_xml
 
 import warnings
 warnings.filterwarnings("ignore")
 
 class IndexProcessor:
+    # Bump when a code change alters the tags this stage writes, so cached results are rebuilt
+    STAGE_VERSION = "1"
+    # Tags this stage adds to the header
+    TAGS = ["S_P500_open", "S_P500_close", "KBWBankIndex_open", "KBWBankIndex_close"]
+    # S&P 500 and KBW Bank Index
+    INDICES = ["^GSPC", "^BKX"]
+
     def __init__(self):
         pass
 
+    def stage_version(self):
+        return self.STAGE_VERSION
+
     @staticmethod
     def get_stock_info(ticker_symbol, time):
         open_price,close_price, high_price, low_price = None, None, None, None
 
         try:
-            ticker = yf.Ticker(ticker_symbol)
-
-            date_str = time
-            date_format = "%A, %B %d, %Y %I:%M %p %Z"
-            datetime_obj = datetime.strptime(date_str, date_format)
-
-            formatted_date = datetime_obj.strftime("%Y-%m-%d")
-            datetime_obj_plus_one = datetime_obj + timedelta(days=1)
-            # print(formatted_date)
-            data = ticker.history(start=formatted_date, end=datetime_obj_plus_one)
-
-            if not data.empty:
-                open_price =  data['Open'].iloc[0]
-                close_price = data['Close'].iloc[0]
-                high_price = data['High'].iloc[0] 
-                low_price = data['Low'].iloc[0]
+            # Served from the local market data store, Yahoo Finance is only asked for new days
+            data = MARKET_DATA.daily(ticker_symbol, call_date(time))
+
+            if data is not None:
+                open_price =  data['Open']
+                close_price = data['Close']
+                high_price = data['High'] 
+                low_price = data['Low']
             else:
                 print("No data available for the specified date.")
         except Exception as e:
@@ -41,26 +39,48 @@ class IndexProcessor:
 
         return open_price,close_price, high_price, low_price
     
+    @staticmethod
+    def header_time(xml_file_path):
+        """Call time in the header of a transcript, read without parsing the rest of the file."""
+        for _, element in ET.iterparse(xml_file_path):
+            if element.tag == "time":
+                return element.text
+        return None
+
     def add_index_prices_to_xml(self, root):
         print("processing header")
         header = root.find("header")
         
         if header is not None:
             time = header.find("time").text
+            # Both indices come with one request when the store does not have the day yet
+            MARKET_DATA.prefetch(self.INDICES, [call_date(time)])
+            sp_open, sp_close = self.get_stock_info("^GSPC", time)[:2]
             sp_open_price = ET.SubElement(header, "S_P500_open")
             sp_close_price = ET.SubElement(header, "S_P500_close")
-            sp_open_price.text = format(self.get_stock_info("^GSPC", time)[0], ".6f")
-            sp_close_price.text = format(self.get_stock_info("^GSPC", time)[1], ".6f")
+            sp_open_price.text = format(sp_open, ".6f")
+            sp_close_price.text = format(sp_close, ".6f")
             
+            kbw_open, kbw_close = self.get_stock_info("^BKX", time)[:2]
             kbw_open_price = ET.SubElement(header, "KBWBankIndex_open")
             kbw_close_price = ET.SubElement(header, "KBWBankIndex_close")
-            kbw_open_price.text = format(self.get_stock_info("^BKX", time)[0], ".6f")
-            kbw_close_price.text = format(self.get_stock_info("^BKX", time)[1], ".6f")
+            kbw_open_price.text = format(kbw_open, ".6f")
+            kbw_close_price.text = format(kbw_close, ".6f")
         return root
 
 
 
-    
+    def process_root(self, root, file_name="transcript"):
+        """
+        Add the S&P 500 and KBW Bank Index prices to the header of an in-memory transcript tree.
+
+        Args:
+            root: ElementTree of the transcript
+            file_name: name used in progress messages
+        """
+        remove_tags(root, self.TAGS, path="header")
+        return self.add_index_prices_to_xml(root)
+
     def process_file(self, xml_file_path: str):
         """
         Process a single XML file by adding summaries to its presentation and Q&A sections.
@@ -72,10 +92,10 @@ class IndexProcessor:
         root = tree.getroot()
 
         # Add summaries to presentation and Q&A sections
-        root = self.add_index_prices_to_xml(root)
+        root = self.process_root(root)
 
         # Write the modified XML back to the same file
-        tree.write(xml_file_path, encoding='utf-8', xml_declaration=True)
+        write_xml(root, xml_file_path)
         print(f"Processed {xml_file_path}")
     
 
@@ -86,12 +106,14 @@ class IndexProcessor:
         Args:
             folder_path: Path to the folder containing XML files to be processed.
         """
-        for filename in os.listdir(folder_path):
-            if filename.endswith('.xml'):
-                print(f"Start summarize {filename}")
-                xml_file_path = os.path.join(folder_path, filename)
-                self.process_file(xml_file_path)
-                print(f"Processed {filename}")
+        xml_file_paths = [os.path.join(folder_path, filename) for filename in os.listdir(folder_path) if filename.endswith('.xml')]
+        # The index prices of every call in the folder come with one request
+        times = [self.header_time(xml_file_path) for xml_file_path in xml_file_paths]
+        MARKET_DATA.prefetch(self.INDICES, [call_date(time) for time in times if time])
+        for xml_file_path in xml_file_paths:
+            print(f"Start summarize {os.path.basename(xml_file_path)}")
+            self.process_file(xml_file_path)
+            print(f"Processed {os.path.basename(xml_file_path)}")
     
 if __name__=="__main__":
     ip = IndexProcessor()
@@ -0,0 +1,189 @@
+from file_processor import FileProcessor
+from neo4j_processor import Neo4jProcessor
+from metrics import METRICS
+from transcript_schema import TranscriptValidationError
+from datetime import datetime
+import os
+import queue
+import shutil
+import threading
+import time
+import traceback
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".m4a")
+
+
+class IngestionDaemon:
+    """Watch a drop folder and push every new transcript through the pipeline and into Neo4j.
+
+    The stage models, the Neo4j driver and (with add_stock) Whisper are loaded once when the
+    daemon starts, so each transcript only costs its processing time. A polling thread queues
+    every .rtf file whose size and modification time stayed the same for one poll interval, i.e.
+    that is completely copied, and the main thread processes the queue one file at a time.
+    Transcripts are moved to <watch_dir>/processed once they are in Neo4j, or to <watch_dir>/failed
+    together with an .error.txt file holding the traceback. Transcripts that fail validation go to
+    <watch_dir>/quarantine instead, next to an .error.txt file listing their problems.
+    """
+
+    def __init__(self, watch_dir, save_dir, uri, auth, add_stock=False, audio_dir=None, stock_dir="stock",
+                 poll_interval=5.0, use_cache=True, parallel_stages=True, metrics_dir=None):
+        """
+        Args:
+            watch_dir: drop folder the transcripts arrive in
+            save_dir: folder the processed XML files are saved in
+            uri, auth: Neo4j connection
+            add_stock: add time stamps and minute level stock prices when the call audio is available
+            audio_dir: folder searched for the call audio, defaults to watch_dir
+            stock_dir: folder the minute level stock data is saved in
+            poll_interval: seconds between two scans of the drop folder
+            metrics_dir: folder the per-stage metrics are exported to after every transcript
+        """
+        self.watch_dir = watch_dir
+        self.save_dir = save_dir
+        self.audio_dir = audio_dir if audio_dir else watch_dir
+        self.stock_dir = stock_dir
+        self.poll_interval = poll_interval
+        self.metrics_dir = metrics_dir
+        self.processed_dir = os.path.join(watch_dir, "processed")
+        self.failed_dir = os.path.join(watch_dir, "failed")
+        self.quarantine_dir = os.path.join(watch_dir, "quarantine")
+        os.makedirs(self.processed_dir, exist_ok=True)
+        os.makedirs(self.failed_dir, exist_ok=True)
+        os.makedirs(save_dir, exist_ok=True)
+
+        # Transcripts that fail validation are quarantined before any model runs on them
+        self.file_processor = FileProcessor(file_dir=watch_dir, save_dir=save_dir, use_cache=use_cache,
+                                            parallel_stages=parallel_stages, quarantine_dir=self.quarantine_dir)
+        self.neo4j_processor = Neo4jProcessor(uri, auth)
+        self.stock_processor = None
+        if add_stock:
+            from timeStamp_stock_processor import TimeStampStockProcessor
+            self.stock_processor = TimeStampStockProcessor()
+
+        self.queue = queue.Queue()
+        self.stop_event = threading.Event()
+        # file name -> (size, mtime) seen by the last scan, a file is ready once it stops changing
+        self.last_seen = {}
+        self.queued = set()
+
+    def warm_up(self):
+        print("Loading models...")
+        self.file_processor.warm_up()
+        if self.stock_processor is not None:
+            self.stock_processor.warm_up()
+        print("Models loaded.")
+
+    def scan(self):
+        """Return the transcripts in the drop folder that are completely written and not queued yet."""
+        current = {}
+        for filename in sorted(os.listdir(self.watch_dir)):
+            path = os.path.join(self.watch_dir, filename)
+            if filename.endswith(".rtf") and os.path.isfile(path):
+                stat = os.stat(path)
+                current[filename] = (stat.st_size, stat.st_mtime)
+
+        ready = [filename for filename, state in current.items()
+                 if filename not in self.queued and self.last_seen.get(filename) == state]
+        self.last_seen = current
+        # Forget files that were moved away so a new file with the same name is picked up again
+        self.queued &= set(current)
+        return ready
+
+    def watch(self):
+        while not self.stop_event.is_set():
+            try:
+                for filename in self.scan():
+                    self.queued.add(filename)
+                    self.queue.put(filename)
+                    print(f"Queued {filename} ({self.queue.qsize()} waiting)")
+            except OSError as e:
+                print(f"Failed to scan {self.watch_dir}: {e}")
+            self.stop_event.wait(self.poll_interval)
+
+    def find_audio(self, filename):
+        """Find the call audio matching a transcript.
+
+        Transcripts are named "<company>, Q3 2024 Earnings Call, Oct 11, 2024.rtf" and the audio
+        "<company> (NYSE_BK) Oct-11-2024 - Audio.mp3".
+
+        Returns:
+            audio_file: name of the audio file in audio_dir, or None
+        """
+        parts = [part.strip() for part in os.path.splitext(filename)[0].split(",")]
+        if len(parts) < 3 or not os.path.isdir(self.audio_dir):
+            return None
+        try:
+            date = datetime.strptime(", ".join(parts[-2:]), "%b %d, %Y").strftime("%b-%d-%Y")
+        except ValueError:
+            return None
+        for audio_file in sorted(os.listdir(self.audio_dir)):
+            if audio_file.lower().endswith(AUDIO_EXTENSIONS) and audio_file.startswith(parts[0]) and date in audio_file:
+                return audio_file
+        return None
+
+    def ingest(self, filename):
+        """Process one transcript and import it into Neo4j.
+
+        Returns:
+            moved: files to move out of the drop folder with the transcript
+        """
+        start = time.perf_counter()
+        file = self.file_processor.process_transcript(self.watch_dir, filename, self.save_dir)
+        xml_path = os.path.join(self.save_dir, file)
+        moved = []
+
+        if self.stock_processor is not None:
+            audio_file = self.find_audio(filename)
+            if audio_file is None:
+                print(f"No audio found for {filename}, skipping time stamps and stock prices")
+            else:
+                print(f"Generate time stamp for file: {file}")
+                with METRICS.stage("stock", filename):
+                    self.stock_processor.process_file(self.audio_dir, audio_file, self.stock_dir, self.save_dir, file,
+                                                      False, save_path=xml_path, plot=False)
+                if os.path.abspath(self.audio_dir) == os.path.abspath(self.watch_dir):
+                    moved.append(audio_file)
+
+        self.neo4j_processor.process_single_file(xml_path)
+        print(f"Completed importing {xml_path} to Neo4j in {time.perf_counter() - start:.1f}s.")
+        return moved
+
+    def handle(self, filename):
+        try:
+            moved = self.ingest(filename)
+        except TranscriptValidationError:
+            # The transcript and the list of its problems are already in the quarantine folder
+            os.remove(os.path.join(self.watch_dir, filename))
+            return False
+        except Exception:
+            error = traceback.format_exc()
+            print(f"Failed to process {filename}:\n{error}")
+            with open(os.path.join(self.failed_dir, filename + ".error.txt"), "w", encoding="utf-8") as file:
+                file.write(error)
+            shutil.move(os.path.join(self.watch_dir, filename), os.path.join(self.failed_dir, filename))
+            return False
+        finally:
+            METRICS.export(self.metrics_dir)
+        for name in [filename] + moved:
+            shutil.move(os.path.join(self.watch_dir, name), os.path.join(self.processed_dir, name))
+        return True
+
+    def run(self):
+        """Process transcripts as they arrive until interrupted with Ctrl+C."""
+        self.warm_up()
+        watcher = threading.Thread(target=self.watch, daemon=True)
+        watcher.start()
+        print(f"Watching {self.watch_dir} for new transcripts (Ctrl+C to stop)")
+        try:
+            while True:
+                try:
+                    filename = self.queue.get(timeout=1)
+                except queue.Empty:
+                    continue
+                self.handle(filename)
+        except KeyboardInterrupt:
+            print("Stopping ingestion daemon.")
+        finally:
+            self.stop_event.set()
+            watcher.join()
+            self.neo4j_processor.close()
@@ -0,0 +1,254 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from metrics import METRICS
+
+DAILY = "1d"
+MINUTE = "1m"
+# Yahoo Finance serves at most 8 days of minute bars per request
+MAX_MINUTE_DAYS = 7
+# and no minute bars older than about 30 days
+MINUTE_HORIZON_DAYS = 30
+# Seconds before days that came back empty, e.g. from a failed request, are asked for again
+EMPTY_TTL = 24 * 3600
+# Time format of the <time> header of a transcript
+CALL_TIME_FORMAT = "%A, %B %d, %Y %I:%M %p %Z"
+COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bars (
+    ticker TEXT NOT NULL,
+    interval TEXT NOT NULL,
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    volume REAL,
+    PRIMARY KEY (ticker, interval, date, time)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS fetched (
+    ticker TEXT NOT NULL,
+    interval TEXT NOT NULL,
+    date TEXT NOT NULL,
+    PRIMARY KEY (ticker, interval, date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS empty (
+    ticker TEXT NOT NULL,
+    interval TEXT NOT NULL,
+    date TEXT NOT NULL,
+    checked REAL NOT NULL,
+    PRIMARY KEY (ticker, interval, date)
+) WITHOUT ROWID;
+"""
+
+
+def call_date(time):
+    """Day of a call, YYYY-MM-DD, from the <time> header of its transcript."""
+    return datetime.strptime(time, CALL_TIME_FORMAT).strftime("%Y-%m-%d")
+
+
+def to_day(value):
+    if isinstance(value, str):
+        return value[:10]
+    return value.strftime("%Y-%m-%d")
+
+
+def day_range(first, last):
+    """Every calendar day from first to last, both included, as YYYY-MM-DD."""
+    start, end = date.fromisoformat(first), date.fromisoformat(last)
+    return [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+
+
+def ticker_frame(data, ticker):
+    """Columns of one ticker in a yf.download result, which has one column level per ticker or none."""
+    import pandas as pd
+    if isinstance(data.columns, pd.MultiIndex):
+        for level in range(data.columns.nlevels):
+            if ticker in data.columns.get_level_values(level):
+                return data.xs(ticker, axis=1, level=level)
+        return data.iloc[0:0]
+    return data
+
+
+class MarketData:
+    """Daily and minute price bars from Yahoo Finance, kept in a local SQLite store.
+
+    Bars are stored by (ticker, interval, date), and the days already asked for are recorded,
+    including the ones without trading. A lookup only goes to Yahoo Finance for the days it
+    does not have, fetching every missing range of several tickers in one request, so
+    reprocessing a corpus makes no network calls for prices seen before. Days that have not
+    finished yet are fetched again on the next lookup. Minute bars older than Yahoo Finance keeps
+    are recorded as fetched even when none came, and other days that came back empty are only
+    asked for again after EMPTY_TTL seconds. Minute bars are stored by their wall
+    clock time in New York, the time transcripts are matched against.
+
+    The store is opened on first use in every process and can be shared by pool workers.
+    """
+
+    def __init__(self, path="market_data.db"):
+        self.path = path
+        self.connection = None
+        self.pid = None
+        # The stages of a transcript run in threads of one process and share the connection
+        self.lock = threading.RLock()
+
+    def set_path(self, path):
+        """Use another store, e.g. a temporary one in the benchmarks."""
+        self.close()
+        self.path = path
+
+    def connect(self):
+        # A connection must not be carried into a forked pool worker
+        if self.connection is None or self.pid != os.getpid():
+            self.connection = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.executescript(SCHEMA)
+            self.pid = os.getpid()
+        return self.connection
+
+    def close(self):
+        if self.connection is not None and self.pid == os.getpid():
+            self.connection.close()
+        self.connection = None
+
+    def missing(self, tickers, interval, days):
+        """Days of each ticker that were never fetched.
+
+        Returns:
+            missing: dict mapping the ticker to its sorted missing days, tickers without any left out
+        """
+        connection = self.connect()
+        missing = {}
+        for ticker in tickers:
+            fetched = {row[0] for row in connection.execute(
+                "SELECT date FROM fetched WHERE ticker = ? AND interval = ? AND date BETWEEN ? AND ? "
+                "UNION SELECT date FROM empty WHERE ticker = ? AND interval = ? AND date BETWEEN ? AND ? AND checked > ?",
+                (ticker, interval, min(days), max(days), ticker, interval, min(days), max(days), time.time() - EMPTY_TTL))}
+            days_left = sorted(set(days) - fetched)
+            if days_left:
+                missing[ticker] = days_left
+        return missing
+
+    @staticmethod
+    def ranges(days, interval):
+        """Split sorted days into the ranges fetched with one request each.
+
+        Daily bars of a whole range are small, so they come in a single request; minute bars
+        come in runs of consecutive days of at most MAX_MINUTE_DAYS.
+        """
+        if interval == DAILY:
+            return [(days[0], days[-1])]
+        ranges = []
+        for day in days:
+            if ranges and len(day_range(ranges[-1][0], day)) <= MAX_MINUTE_DAYS \
+                    and date.fromisoformat(day) - date.fromisoformat(ranges[-1][1]) == timedelta(days=1):
+                ranges[-1] = (ranges[-1][0], day)
+            else:
+                ranges.append((day, day))
+        return ranges
+
+    def prefetch(self, tickers, days, interval=DAILY):
+        """Fetch the bars of the given days that are not in the store yet."""
+        days = [to_day(day) for day in days]
+        if not days:
+            return
+        with self.lock:
+            requests = defaultdict(list)
+            for ticker, days_left in self.missing(tickers, interval, days).items():
+                for first, last in self.ranges(days_left, interval):
+                    requests[(first, last)].append(ticker)
+            if not requests:
+                METRICS.count("market_data_hits")
+            for (first, last), group in requests.items():
+                self.fetch(group, interval, first, last)
+
+    def fetch(self, tickers, interval, first, last):
+        """Download the bars of tickers from first to last, both included, and store them."""
+        import yfinance as yf
+        end = (date.fromisoformat(last) + timedelta(days=1)).isoformat()
+        METRICS.count("yfinance_requests")
+        if interval == DAILY:
+            # The same split and dividend adjusted prices Ticker.history returns
+            data = yf.download(tickers, start=first, end=end, interval=interval, group_by="ticker",
+                               auto_adjust=True, progress=False)
+        else:
+            data = yf.download(tickers, start=first, end=end, interval=interval, group_by="ticker", progress=False)
+
+        today = datetime.now(timezone.utc).date()
+        horizon = (today - timedelta(days=MINUTE_HORIZON_DAYS)).isoformat()
+        today = today.isoformat()
+        now = time.time()
+        rows, fetched, empty = [], [], []
+        for ticker in tickers:
+            frame = ticker_frame(data, ticker)
+            if "Close" in frame.columns:
+                frame = frame.dropna(subset=["Close"])
+            if frame.empty or "Close" not in frame.columns:
+                # Failed requests also come back empty, so only minute bars Yahoo Finance no longer
+                # has are recorded as fetched, and the other days are tried again after EMPTY_TTL
+                days = [day for day in day_range(first, last) if day < today]
+                if interval != DAILY:
+                    fetched += [(ticker, interval, day) for day in days if day < horizon]
+                empty += [(ticker, interval, day, now) for day in days]
+                continue
+            index = frame.index
+            if interval != DAILY and index.tz is not None:
+                index = index.tz_convert("America/New_York").tz_localize(None)
+            for timestamp, values in zip(index, frame.reindex(columns=COLUMNS).itertuples(index=False)):
+                bar_time = timestamp.strftime("%Y-%m-%d %H:%M:%S")
+                rows.append((ticker, interval, bar_time[:10], bar_time if interval != DAILY else "",
+                             *[None if value != value else float(value) for value in values]))
+            fetched += [(ticker, interval, day) for day in day_range(first, last) if day < today]
+
+        connection = self.connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany("INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            connection.executemany("INSERT OR REPLACE INTO fetched VALUES (?, ?, ?)", fetched)
+            connection.executemany("INSERT OR REPLACE INTO empty VALUES (?, ?, ?, ?)", empty)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def daily(self, ticker, day):
+        """Daily bar of a ticker, {"Open", "High", "Low", "Close", "Volume"}, or None without trading that day."""
+        day = to_day(day)
+        with self.lock:
+            self.prefetch([ticker], [day])
+            row = self.connect().execute(
+                "SELECT open, high, low, close, volume FROM bars WHERE ticker = ? AND interval = ? AND date = ?",
+                (ticker, DAILY, day)).fetchone()
+        return dict(zip(COLUMNS, row)) if row else None
+
+    def minute(self, ticker, start, end=None, fetch=True):
+        """Minute bars of a ticker from the day of start to the day of end, both included.
+
+        Args:
+            fetch: False to only read the store, after a prefetch of several tickers
+
+        Returns:
+            DataFrame with the COLUMNS, indexed by the New York wall clock time ("Datetime")
+        """
+        import pandas as pd
+        first = to_day(start)
+        last = to_day(end) if end is not None else first
+        with self.lock:
+            if fetch:
+                self.prefetch([ticker], day_range(first, last), interval=MINUTE)
+            rows = self.connect().execute(
+                "SELECT time, open, high, low, close, volume FROM bars "
+                "WHERE ticker = ? AND interval = ? AND date BETWEEN ? AND ? ORDER BY time",
+                (ticker, MINUTE, first, last)).fetchall()
+        index = pd.DatetimeIndex([row[0] for row in rows], name="Datetime")
+        return pd.DataFrame([row[1:] for row in rows], index=index, columns=COLUMNS)
+
+
+# Store shared by the parser, the index stage and the time stamp stage
+MARKET_DATA = MarketData()
@@ -0,0 +1,174 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Counter name -> help text of the Prometheus metric
+COUNTERS = {
+    "finbert_forward_passes": "FinBERT forward passes.",
+    "finbert_texts": "Sentences and Q&A turns scored by FinBERT.",
+    "finbert_tokens": "Tokens of the texts scored by FinBERT.",
+    "finbert_padding_tokens": "Padding tokens added to FinBERT batches.",
+    "finbert_long_texts": "Texts longer than FinBERT reads, scored over overlapping windows.",
+    "finbert_windows": "Windows the long texts were split into.",
+    "sentiment_cache_hits": "Sentences and Q&A turns whose FinBERT scores came from the sentiment cache.",
+    "sentiment_cache_misses": "Sentences and Q&A turns not found in the sentiment cache.",
+    "openai_calls": "OpenAI chat completion requests.",
+    "openai_prompt_tokens": "OpenAI prompt tokens.",
+    "openai_completion_tokens": "OpenAI completion tokens.",
+    "yfinance_requests": "Yahoo Finance requests.",
+    "market_data_hits": "Price lookups answered by the local market data store.",
+    "whisper_transcriptions": "Audio files transcribed with Whisper.",
+    "model_loads": "Models and NLTK resources loaded into the model registry.",
+    "neo4j_queries": "Cypher queries sent to Neo4j.",
+    "neo4j_query_bytes": "Bytes of Cypher sent to Neo4j.",
+    "neo4j_nodes_created": "Nodes created in Neo4j.",
+    "neo4j_relationships_created": "Relationships created in Neo4j.",
+    "neo4j_properties_set": "Properties set in Neo4j.",
+    "cache_hits": "Stages skipped because their cached result was up to date.",
+    "quarantined_transcripts": "Transcripts set aside because they do not match the transcript schema.",
+}
+
+PREFIX = "irgraph"
+
+
+class Metrics:
+    """Per-stage wall time, CPU time and counters of the pipeline.
+
+    Every stage run is wrapped in stage(), which records one JSON line with its wall time, the
+    CPU time of the thread running it and the counters incremented while it ran, e.g. FinBERT
+    forward passes or OpenAI tokens. Stages of the scheduler run in their own threads, so the
+    current stage is tracked per thread. Counters incremented outside any stage are attributed
+    to the stage "none".
+
+    Records are exported to metrics.jsonl (appended) and metrics.prom (Prometheus text format,
+    cumulative per stage, rewritten on every export).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.records = []
+        self.exported = 0
+        # stage -> {"runs", "errors", "wall_seconds", "cpu_seconds", <counter>...}
+        self.totals = {}
+
+    @contextmanager
+    def stage(self, stage, transcript=None):
+        record = {"time": round(time.time(), 3), "pid": os.getpid(), "transcript": transcript, "stage": stage,
+                  "status": "ok", "counters": {}}
+        outer = getattr(self.local, "record", None)
+        self.local.record = record
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield record
+        except BaseException:
+            record["status"] = "error"
+            raise
+        finally:
+            # thread_time leaves out the intra-op threads of torch, wall time is the number to compare
+            record["wall_seconds"] = round(time.perf_counter() - wall, 6)
+            record["cpu_seconds"] = round(time.thread_time() - cpu, 6)
+            self.local.record = outer
+            self.add(record)
+
+    def count(self, name, value=1):
+        record = getattr(self.local, "record", None)
+        with self.lock:
+            if record is None:
+                totals = self.totals.setdefault("none", {})
+                totals[name] = totals.get(name, 0) + value
+            else:
+                record["counters"][name] = record["counters"].get(name, 0) + value
+
+    def add(self, record):
+        with self.lock:
+            self.records.append(record)
+            totals = self.totals.setdefault(record["stage"], {})
+            totals["runs"] = totals.get("runs", 0) + 1
+            totals["errors"] = totals.get("errors", 0) + (record["status"] == "error")
+            totals["wall_seconds"] = totals.get("wall_seconds", 0.0) + record["wall_seconds"]
+            totals["cpu_seconds"] = totals.get("cpu_seconds", 0.0) + record["cpu_seconds"]
+            for name, value in record["counters"].items():
+                totals[name] = totals.get(name, 0) + value
+
+    def drain(self):
+        """Return and forget the metrics of this process, used by pool workers to hand them to the parent.
+
+        Returns:
+            (records, counters): the stage records, and the counters incremented outside any stage,
+                e.g. the model loads of the worker initializer
+        """
+        with self.lock:
+            records, self.records = self.records, []
+            counters = self.totals.get("none", {})
+            self.exported = 0
+            self.totals = {}
+        return records, counters
+
+    def merge(self, records, counters=None):
+        """Add the records and counters drain() returned in another process."""
+        for record in records:
+            self.add(record)
+        with self.lock:
+            totals = self.totals.setdefault("none", {})
+            for name, value in (counters or {}).items():
+                totals[name] = totals.get(name, 0) + value
+
+    def prometheus(self):
+        lines = []
+
+        def metric(name, kind, help_text, values):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            for stage, value in values:
+                lines.append(f'{PREFIX}_{name}{{stage="{stage}"}} {value}')
+
+        with self.lock:
+            totals = {stage: dict(values) for stage, values in sorted(self.totals.items())}
+        staged = [stage for stage in totals if "runs" in totals[stage]]
+        metric("stage_runs_total", "counter", "Stage runs.", [(s, totals[s]["runs"]) for s in staged])
+        metric("stage_errors_total", "counter", "Stage runs that raised an error.", [(s, totals[s]["errors"]) for s in staged])
+        metric("stage_wall_seconds_total", "counter", "Wall time spent in the stage.",
+               [(s, round(totals[s]["wall_seconds"], 6)) for s in staged])
+        metric("stage_cpu_seconds_total", "counter", "CPU time of the thread running the stage.",
+               [(s, round(totals[s]["cpu_seconds"], 6)) for s in staged])
+        for name, help_text in COUNTERS.items():
+            values = [(stage, totals[stage][name]) for stage in totals if name in totals[stage]]
+            if values:
+                metric(f"{name}_total", "counter", help_text, values)
+        return "\n".join(lines) + "\n"
+
+    def export(self, metrics_dir):
+        """Append the new stage records to metrics.jsonl and rewrite metrics.prom."""
+        if not metrics_dir:
+            return
+        os.makedirs(metrics_dir, exist_ok=True)
+        with self.lock:
+            records = self.records[self.exported:]
+            self.exported = len(self.records)
+        with open(os.path.join(metrics_dir, "metrics.jsonl"), "a", encoding="utf-8") as file:
+            for record in records:
+                file.write(json.dumps(record) + "\n")
+        prom_path = os.path.join(metrics_dir, "metrics.prom")
+        # Write to a temporary file first, scrapers must never read a half written file
+        with open(prom_path + ".tmp", "w", encoding="utf-8") as file:
+            file.write(self.prometheus())
+        os.replace(prom_path + ".tmp", prom_path)
+
+    def report(self):
+        """Print wall time, CPU time and the main counters of every stage."""
+        with self.lock:
+            totals = {stage: dict(values) for stage, values in self.totals.items() if "runs" in values}
+        if not totals:
+            return
+        print(f"{'stage':<12}{'runs':>6}{'errors':>8}{'wall s':>10}{'cpu s':>10}  counters")
+        for stage, values in sorted(totals.items(), key=lambda item: -item[1]["wall_seconds"]):
+            counters = ", ".join(f"{name}={values[name]}" for name in COUNTERS if name in values)
+            print(f"{stage:<12}{values['runs']:>6}{values['errors']:>8}{values['wall_seconds']:>10.2f}"
+                  f"{values['cpu_seconds']:>10.2f}  {counters}")
+
+
+# Metrics of this process, shared by every processor
+METRICS = Metrics()
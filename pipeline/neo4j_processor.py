@@ -1,9 +1,10 @@
-import json
 from neo4j import GraphDatabase
 import os
 import sys
+from speaker_registry import SpeakerRegistry
 from schema import *
-import xml.etree.ElementTree as ET
+from xml_io import iter_sections
+from metrics import METRICS
 
 COMPANY = "COMPANY"
 EARNINGSCALL = "EARNINGSCALL"
@@ -212,6 +213,9 @@ class Neo4jProcessor:
     def __init__(self, uri, auth):
         self.driver = GraphDatabase.driver(uri, auth=auth)
         self.verify_connectivity()
+        # Speakers are read from the registry on the first import, then only the ones added since
+        self.speaker_registry = None
+        self.merged_speakers = 0
 
     def verify_connectivity(self):
         try:
@@ -223,28 +227,45 @@ class Neo4jProcessor:
 
     def close(self):
         self.driver.close()
+        if self.speaker_registry is not None:
+            self.speaker_registry.close()
+
+    def execute(self, query):
+        """Run a Cypher query and count its size and the graph writes it made."""
+        METRICS.count("neo4j_queries")
+        METRICS.count("neo4j_query_bytes", len(query.encode("utf-8")))
+        records, summary, keys = self.driver.execute_query(query)
+        counters = summary.counters
+        METRICS.count("neo4j_nodes_created", counters.nodes_created)
+        METRICS.count("neo4j_relationships_created", counters.relationships_created)
+        METRICS.count("neo4j_properties_set", counters.properties_set)
+        return records, summary, keys
 
     def main_processor(self, file):
         print(file)
+        self.import_sections(iter_sections(file))
 
-        tree = ET.parse(file)
-        root = tree.getroot()
+    def import_sections(self, elements):
+        """Write one transcript to the graph from its <header> and body <section> elements.
 
-        header_element = root.find('header')
+        The elements may come from iter_sections(), which frees each one once the next is read.
+        """
+        elements = iter(elements)
 
         # Extract header information
-        header_element = root.find('header')
+        header_element = next(elements)
         header = Header(
             company=header_element.find('company').text,
             quarter=header_element.find('quarter').text,
             time=header_element.find('time').text,
             currency=header_element.find('currency').text,
             note=header_element.find('note').text,
-            open_price=header_element.find('open_price').text,
-            close_price=header_element.find('close_price').text,
-            high_price=header_element.find('high_price').text,
-            low_price=header_element.find('low_price').text,
-            performance=header_element.find('stock_performance').text,
+            # The price tags are left out of the header when the prices of the call are missing
+            open_price=header_element.findtext('open_price'),
+            close_price=header_element.findtext('close_price'),
+            high_price=header_element.findtext('high_price'),
+            low_price=header_element.findtext('low_price'),
+            performance=header_element.findtext('stock_performance'),
             year=header_element.find('year').text,
             kbw_open = header_element.find("KBWBankIndex_open").text,
             kbw_close= header_element.find("KBWBankIndex_close").text,
@@ -252,7 +273,7 @@ class Neo4jProcessor:
         print(header.quarter)
         participants_section = None
         presentation_section = None
-        for section_element in root.findall('body/section'):
+        for section_element in elements:
             
             if section_element.get('name') == "Call Participants" or section_element.get('name') == "call participants":
                 participants_section = extract_participants(section_element, header)
@@ -298,10 +319,15 @@ class Neo4jProcessor:
 
         # process_header--------------------------------------------------------------------
         header = transcript.header
+        properties = [("name", header.quarter), ("time", header.time), ("open_price", header.open_price),
+                      ("close_price", header.close_price), ("high_price", header.high_price),
+                      ("low_price", header.low_price), ("performance", header.performance), ("year", header.year),
+                      ("kbw_open", header.kbw_open), ("kbw_close", header.kbw_close)]
+        # Missing prices are left off the node rather than stored as "None"
+        properties = ", ".join('%s: "%s"' % (key, value) for key, value in properties if value is not None)
         query = \
             'MERGE (%s:COMPANY {name: "%s"}) \n' % (COMPANY, header.company) + \
-            'CREATE (%s:EARNINGSCALL {name: "%s", time: "%s", open_price: "%s", close_price: "%s", high_price: "%s", low_price: "%s", performance: "%s", year: "%s",kbw_open: "%s",kbw_close: "%s"}) \n' \
-                % (EARNINGSCALL, header.quarter, header.time, header.open_price, header.close_price, header.high_price, header.low_price,header.performance, header.year,header.kbw_open,header.kbw_close) + \
+            'CREATE (%s:EARNINGSCALL {%s}) \n' % (EARNINGSCALL, properties) + \
             'CREATE (%s) -[:HAS_EARNINGS] -> (%s)' % (COMPANY, EARNINGSCALL)
         # print(f"query{query}")
         cypher = add_query(cypher, query)
@@ -359,20 +385,26 @@ class Neo4jProcessor:
         cypher = add_query(cypher, query)
 
 
-        records, summary, keys = self.driver.execute_query(cypher)
+        records, summary, keys = self.execute(cypher)
 
 
 
     def extract_all_participants(self):
-        with open('global_speaker.json', 'r') as file:
-            json_input = file.read()
-            
-        data = json.loads(json_input)
+        """MERGE the speakers of the registry that are not in the graph yet.
+
+        The registry is read once; later calls only load and merge the speakers parsers added since.
+        """
+        if self.speaker_registry is None:
+            self.speaker_registry = SpeakerRegistry()
+        self.speaker_registry.refresh()
+        data = list(self.speaker_registry.people.values())[self.merged_speakers:]
+        if self.merged_speakers and not data:
+            return
         # Create a list to hold the person objects
         persons = []
 
         # Iterate over each item in the data dictionary to create Person objects
-        for name, info in data.items():
+        for info in data:
             person = Person(id=info['id'], 
                             position=info['position'] if 'position' in info else "", 
                             company=info['company'], 
@@ -389,7 +421,8 @@ class Neo4jProcessor:
                 % (person.name, person.company, person.position, str(person.id), person.group)
             query = add_query(query, q)
 
-        records, summary, keys = self.driver.execute_query(query)
+        records, summary, keys = self.execute(query)
+        self.merged_speakers += len(data)
 
     def clear_db(self):
         print("clean the current database")
@@ -397,11 +430,34 @@ class Neo4jProcessor:
                 MATCH (n)
                 DETACH DELETE n
                 '''
-        records, summary, keys = self.driver.execute_query(query)
+        records, summary, keys = self.execute(query)
+        # The speakers went with it, merge them again on the next import
+        self.merged_speakers = 0
 
     def process_single_file(self, file_path):
+        with METRICS.stage("neo4j", os.path.basename(file_path)):
+            self.extract_all_participants()
+            self.main_processor(file_path)
+
+    def process_archive(self, archive_path):
+        """Import every transcript of a RAR, zip or tar archive without unpacking it.
+
+        The members are parsed straight from the archive one at a time, so only the transcript
+        being imported is held in memory.
+
+        Returns:
+            count: number of transcripts imported
+        """
+        from archive_reader import iter_archive_members
+        self.clear_db()
         self.extract_all_participants()
-        self.main_processor(file_path)
+        count = 0
+        for name, member in iter_archive_members(archive_path, suffix=".xml"):
+            print(name)
+            with METRICS.stage("neo4j", os.path.basename(name)):
+                self.import_sections(iter_sections(member))
+            count += 1
+        return count
 
     def process_folder(self, folder_path):
         self.clear_db()
@@ -1,9 +1,9 @@
-import json
 from neo4j import GraphDatabase
 import os
 import sys
 from upstreamPipeline.schema_without_timeStamp import *
-import xml.etree.ElementTree as ET
+from speaker_registry import SpeakerRegistry
+from xml_io import iter_sections
 
 COMPANY = "COMPANY"
 EARNINGSCALL = "EARNINGSCALL"
@@ -193,6 +193,9 @@ class Neo4jProcessor:
     def __init__(self, uri, auth):
         self.driver = GraphDatabase.driver(uri, auth=auth)
         self.verify_connectivity()
+        # Speakers are read from the registry on the first import, then only the ones added since
+        self.speaker_registry = None
+        self.merged_speakers = 0
 
     def verify_connectivity(self):
         try:
@@ -204,17 +207,16 @@ class Neo4jProcessor:
 
     def close(self):
         self.driver.close()
+        if self.speaker_registry is not None:
+            self.speaker_registry.close()
 
     def main_processor(self, file):
         print(file)
-
-        tree = ET.parse(file)
-        root = tree.getroot()
-
-        header_element = root.find('header')
+        # The header and the sections are read one at a time and freed once extracted
+        elements = iter_sections(file)
 
         # Extract header information
-        header_element = root.find('header')
+        header_element = next(elements)
         header = Header(
             company=header_element.find('company').text,
             quarter=header_element.find('quarter').text,
@@ -231,7 +233,7 @@ class Neo4jProcessor:
         print(header.quarter)
         participants_section = None
         presentation_section = None
-        for section_element in root.findall('body/section'):
+        for section_element in elements:
             if section_element.get('name') == "Call Participants" or section_element.get('name') == "call participants":
                 participants_section = extract_participants(section_element, header)
             elif section_element.get('name') == "Presentation":
@@ -341,15 +343,21 @@ class Neo4jProcessor:
 
 
     def extract_all_participants(self):
-        with open('global_speaker.json', 'r') as file:
-            json_input = file.read()
-            
-        data = json.loads(json_input)
+        """MERGE the speakers of the registry that are not in the graph yet.
+
+        The registry is read once; later calls only load and merge the speakers parsers added since.
+        """
+        if self.speaker_registry is None:
+            self.speaker_registry = SpeakerRegistry()
+        self.speaker_registry.refresh()
+        data = list(self.speaker_registry.people.values())[self.merged_speakers:]
+        if self.merged_speakers and not data:
+            return
         # Create a list to hold the person objects
         persons = []
 
         # Iterate over each item in the data dictionary to create Person objects
-        for name, info in data.items():
+        for info in data:
             person = Person(id=info['id'], 
                             position=info['position'] if 'position' in info else "", 
                             company=info['company'], 
@@ -367,6 +375,7 @@ class Neo4jProcessor:
             query = add_query(query, q)
 
         records, summary, keys = self.driver.execute_query(query)
+        self.merged_speakers += len(data)
 
 
     def process_single_file(self, file_path):
@@ -0,0 +1,171 @@
+import argparse
+import os
+import threading
+import time
+from metrics import METRICS
+
+# NLTK resource name -> path used by nltk.data.find to check whether it is installed
+NLTK_RESOURCES = {
+    "punkt": "tokenizers/punkt",
+    "stopwords": "corpora/stopwords",
+}
+
+
+def footprint(model):
+    """Bytes held by the parameters and buffers of a torch module, None for anything else."""
+    if not hasattr(model, "parameters") or not hasattr(model, "buffers"):
+        return None
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+
+class ModelRegistry:
+    """Models and data files shared by every processor of a process, each loaded once.
+
+    get() returns the object stored under a key and only calls its loader the first time the key
+    is asked for, whichever processor or stage thread asks. The time every load took and the
+    memory its weights hold are kept for stats().
+
+    Pool workers are forked from the process that started the pool, so models loaded there first
+    are inherited by every worker instead of being loaded again, and their weights stay in memory
+    pages shared copy-on-write between the workers as long as nobody writes to them.
+    """
+
+    def __init__(self):
+        self.models = {}
+        self.loads = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, loader, size=footprint):
+        """Object stored under key, loaded by loader() the first time.
+
+        Args:
+            key: tuple of strings naming the model, e.g. ("model", "ProsusAI/finbert")
+            loader: function without arguments that loads it
+            size: function returning the bytes the loaded object holds, or None when unknown
+        """
+        model = self.models.get(key)
+        if model is not None:
+            return model
+        with self.lock:
+            if key not in self.models:
+                start = time.perf_counter()
+                model = loader()
+                self.loads[key] = {"seconds": time.perf_counter() - start, "bytes": size(model), "pid": os.getpid()}
+                self.models[key] = model
+                METRICS.count("model_loads")
+        return self.models[key]
+
+    def stats(self):
+        """Every loaded model with its load time, weight bytes and whether it was inherited from the parent process.
+
+        Returns:
+            stats: list of {"model", "seconds", "bytes", "inherited"}, bytes is None for tokenizers and data
+        """
+        return [{"model": ":".join(key), "seconds": round(load["seconds"], 3), "bytes": load["bytes"],
+                 "inherited": load["pid"] != os.getpid()} for key, load in self.loads.items()]
+
+    def report(self):
+        print(f"{'model':<40}{'load s':>8}{'weights MB':>12}  inherited")
+        for row in self.stats():
+            size = f"{row['bytes'] / 2 ** 20:.1f}" if row["bytes"] is not None else "-"
+            print(f"{row['model']:<40}{row['seconds']:>8.2f}{size:>12}  {row['inherited']}")
+        try:
+            import resource
+        except ImportError:
+            # Not available on Windows
+            return
+        # ru_maxrss is in KB on Linux
+        print(f"peak resident memory of this process: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+
+# Registry of the process, used by every processor
+MODELS = ModelRegistry()
+
+
+def hf_tokenizer(name, revision=None):
+    def load():
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(name, revision=revision)
+
+    return MODELS.get(("tokenizer", name) if revision is None else ("tokenizer", name, revision), load)
+
+
+def sequence_classifier(name, revision=None):
+    """Tokenizer and model of a Hugging Face sequence classifier, e.g. ProsusAI/finbert.
+
+    Args:
+        name: model on the hub or local checkpoint
+        revision: branch, tag or commit of the hub model, None for the latest
+    """
+    def load_model():
+        from transformers import AutoModelForSequenceClassification
+        model = AutoModelForSequenceClassification.from_pretrained(name, revision=revision)
+        model.eval()
+        return model
+
+    key = ("model", name) if revision is None else ("model", name, revision)
+    return hf_tokenizer(name, revision), MODELS.get(key, load_model)
+
+
+def onnx_session(path):
+    """ONNX Runtime session of a model file on the CPU, e.g. the quantized FinBERT."""
+    def load():
+        import onnxruntime
+        return onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+
+    # The thread pool of a session does not survive a fork, so a forked worker opens its own.
+    # The weights live in the session, about the size of the file.
+    return MODELS.get(("onnx", path, str(os.getpid())), load, size=lambda session: os.path.getsize(path))
+
+
+def whisper_model(name="base"):
+    def load():
+        import whisper
+        return whisper.load_model(name)
+
+    return MODELS.get(("whisper", name), load)
+
+
+def ensure_nltk_data(*names):
+    """Download NLTK resources the first time a stage needs them.
+
+    nltk.download contacts the NLTK index on every call, so each resource is looked up locally
+    first and only downloaded when it is missing. Later calls in the same process are free.
+    """
+    for name in names:
+        MODELS.get(("nltk", name), lambda: find_nltk_data(name))
+
+
+def find_nltk_data(name):
+    import nltk
+    try:
+        nltk.data.find(NLTK_RESOURCES.get(name, name))
+    except LookupError:
+        nltk.download(name, quiet=True)
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load the pipeline models once and show their load time and memory.")
+    parser.add_argument("--model", type=str, action="append", help="Sequence classifier to load, can be repeated. Defaults to ProsusAI/finbert.")
+    parser.add_argument("--whisper", type=str, required=False, help="Whisper model to load as well, e.g. base.")
+    parser.add_argument("--onnx", type=str, required=False, help="ONNX model file to load as well, e.g. models/finbert-int8.onnx.")
+    args = parser.parse_args()
+
+    for model_name in args.model if args.model else ["ProsusAI/finbert"]:
+        sequence_classifier(model_name)
+    ensure_nltk_data(*NLTK_RESOURCES)
+    if args.whisper:
+        whisper_model(args.whisper)
+    if args.onnx:
+        onnx_session(args.onnx)
+    MODELS.report()
+
+'''
+Example:
+
+python resources.py
+python resources.py --whisper base
+python resources.py --onnx models/finbert-int8.onnx
+'''
@@ -1,28 +1,59 @@
 import os
 import pandas as pd
-import torch
-from xml.etree import ElementTree as ET
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from configparser import ConfigParser
+from pathlib import Path
+from finbert import BACKEND, engine, label
+from sentiment_cache import SENTIMENT_CACHE
+from xml_io import ET, remove_tags, write_xml
 import warnings
 warnings.filterwarnings("ignore")
 
-class SentimentAnalysisProcessor:
-    def __init__(self):
-        self.tokenizer = AutoTokenizer.from_pretrained("ProsusAI/finbert")
-        self.model = AutoModelForSequenceClassification.from_pretrained("ProsusAI/finbert")
+BASE_DIR = Path(__file__).resolve().parent.parent
+CONFIG = ConfigParser()
+CONFIG.read(BASE_DIR / "config.ini")
+# Most sentences and Q&A turns per FinBERT forward pass, within the max_tokens of finbert.py
+BATCH_SIZE = CONFIG.getint("SENTIMENT", "batch_size", fallback=128)
+# Transcripts of a folder scored together, then written, before the next ones are read
+FOLDER_CHUNK = CONFIG.getint("SENTIMENT", "folder_chunk", fallback=16)
 
-    def extract_presentation_statements(self, xml_file_path: str) -> pd.DataFrame:
+class SentimentAnalysisProcessor:
+    MODEL_NAME = "ProsusAI/finbert"
+    # Bump when a code change alters the tags this stage writes, so cached results are rebuilt
+    STAGE_VERSION = "2"
+    # Tags this stage adds to every <text>
+    TAGS = ["sentiment", "analysis", "pos", "neg", "neutr"]
+
+    def __init__(self, batch_size=None, backend=BACKEND, cache=SENTIMENT_CACHE):
+        # FinBERT is loaded on first use, so building the processor does not import torch
+        # Texts scored in earlier runs are read from the sentiment cache, None scores every text
+        self.finbert = engine(backend, self.MODEL_NAME, batch_size if batch_size else BATCH_SIZE, cache=cache)
+
+    @property
+    def tokenizer(self):
+        return self.finbert.tokenizer
+
+    @property
+    def model(self):
+        return self.finbert.model
+
+    def warm_up(self):
+        self.finbert.warm_up()
+
+    def stage_version(self):
+        # The name includes a pinned hub revision and the backend when it is not PyTorch, so
+        # switching rebuilds the scores, and so does changing how long Q&A turns are windowed.
+        # It is known without loading the model, unlike the revision the cache is keyed on.
+        return f"{self.STAGE_VERSION}:{self.finbert.name}:{self.finbert.windowing()}"
+
+    def extract_presentation_statements(self, root) -> pd.DataFrame:
         """Extract presentation statements from <statement><speaker><text>
 
         Args:
-            xml_file_path: Location of xml file that has no sentiment tags
+            root: root element of the transcript XML that has no sentiment tags
 
         Returns:
             statement_df: dataframe with these columns: Speaker ID, Speaker Company, Speaker Name, Statement
         """
-        tree = ET.parse(xml_file_path)
-        root = tree.getroot()
-
         # Extract data into a list of dictionaries
         data = []
         for statement in root.findall(".//statement"):
@@ -42,6 +73,21 @@ class SentimentAnalysisProcessor:
         # statement_df = statement_df.drop(0) # remove the operator
         return statement_df
 
+    @staticmethod
+    def split_sentences(text):
+        """Sentences of a presentation statement as FinBERT scores them, split at every period."""
+        if text is None:
+            print("There is None text")
+            return ["Neutral."]
+        return text.split(".")
+
+    @staticmethod
+    def presentation_sentiment(sentiment_scores):
+        """Labels of the sentences of a statement and its most common label, from their FinBERT scores."""
+        sentiment_labels = [label(scores) for scores in sentiment_scores]
+        most_common_label = max(sentiment_labels, key=sentiment_labels.count)
+        return sentiment_scores, sentiment_labels, most_common_label
+
     def get_presentation_sentiment_scores(self, text: str):
         """Use FinBERT to retrieve sentiment scores for the presentation statement text
 
@@ -53,40 +99,7 @@ class SentimentAnalysisProcessor:
             sentiment_labels: list of labels for each sentence
             most_common_label: positive, negative, or neutral
         """
-        tokenizer = self.tokenizer
-        model = self.model
-
-        # Split the text into sentences
-        sentences = []
-        if text is None:
-            sentences = ["Neutral."]
-            print("There is None text")
-        else:
-            sentences = text.split(".")
-
-        sentiment_labels = []
-        sentiment_scores = []
-        
-        # Loop through each sentence and get sentiment prediction (max score)
-        for sentence in sentences:
-            inputs = tokenizer(sentence, padding = True, truncation = True,  return_tensors='pt')
-            outputs = model(**inputs)
-            # Get the predicted sentiment score
-            scores = torch.nn.functional.softmax(outputs.logits, dim=-1)#outputs.logits.item()
-            scores_list = scores[:, 0].tolist(), scores[:, 1].tolist(), scores[:, 2].tolist() # pos, neg, neutr 
-            sentiment_scores.append(scores_list)
-            # Get the prediction (max score)   
-            max_index = scores_list.index(max(scores_list))
-            if max_index == 0:
-                sentiment_labels.append("positive")
-            elif max_index == 1:
-                sentiment_labels.append("negative")
-            else:
-                sentiment_labels.append("neutral")
-
-        most_common_label = max(sentiment_labels, key=sentiment_labels.count)
-
-        return sentiment_scores, sentiment_labels, most_common_label
+        return self.presentation_sentiment(self.finbert.score(self.split_sentences(text)))
 
     def find_presentation_negative_sentences(self, text: str, sentiment_labels: list) -> str:
         """Extract classified negative sentences from the presentation statement text
@@ -107,8 +120,8 @@ class SentimentAnalysisProcessor:
             sentences = text.split(".")
 
         negative_sentences = []
-        for sentence, label in zip(sentences, sentiment_labels):
-            if label=="negative":
+        for sentence, sentence_label in zip(sentences, sentiment_labels):
+            if sentence_label=="negative":
                 negative_sentences.append(sentence)
         
         output = ''
@@ -152,20 +165,16 @@ class SentimentAnalysisProcessor:
 
         return analysis_summary
 
-    def add_presentation_sentiment_tag_to_xml(self, xml_file_path: str, statement_df: pd.DataFrame, file_name: str):
-        """Add the sentiment labels as a <sentiment> tag, and the analysis text as an <analysis> tag to the original XML file
+    def add_presentation_sentiment_tag_to_xml(self, root, statement_df: pd.DataFrame):
+        """Add the sentiment labels as a <sentiment> tag, and the analysis text as an <analysis> tag to the transcript tree
         
         Args:
-            xml_file_path: Location of xml file that has no sentiment tags
+            root: root element of the transcript XML that has no sentiment tags
             statement_df: dataframe with these columns: Speaker ID, Speaker Company, Speaker Name, Statement, Sentiment Scores, Sentiment Labels, Top Sentiment Label, Analysis Summary
-            file_name: for saving the output XML file
 
         Returns:
-            None
+            root: the same element, with the presentation sentiment tags added
         """  
-        tree = ET.parse(xml_file_path)
-        root = tree.getroot()
-
         # Iterate over the statement elements and add sentiment tags
         for statement_element, sentiment_label in zip(root.findall(".//statement"), statement_df['Top Sentiment Label']):
             speaker_element = statement_element.find("speaker")
@@ -179,22 +188,18 @@ class SentimentAnalysisProcessor:
             text_element = speaker_element.find("text")
             analysis_element = ET.SubElement(text_element, "analysis")
             analysis_element.text = sentiment_analysis
-            
-        # Save the modified XML file
-        tree.write(file_name, encoding='utf-8', xml_declaration=True)
 
-    def extract_qa_text(self, xml_file_path: str) -> pd.DataFrame:
-        """Extract Q&A text from the XML file
+        return root
+
+    def extract_qa_text(self, root) -> pd.DataFrame:
+        """Extract Q&A text from the transcript tree
 
         Args:
-            xml_file_path: Location of xml file that has no sentiment tags
+            root: root element of the transcript XML that has no Q&A sentiment tags
 
         Returns:
             qa_df: dataframe with these columns: Speaker ID, Speaker Name, Speaker Company, Text
         """
-        tree = ET.parse(xml_file_path)
-        root = tree.getroot()
-
         # Empty lists to store speaker IDs and text content
         speaker_id_list = []
         speaker_name_list = []
@@ -225,9 +230,18 @@ class SentimentAnalysisProcessor:
                         'Text': text_list})
         return qa_df
 
+    @staticmethod
+    def qa_sentiment(scores):
+        """Rounded (pos, neg, neutr) scores of a Q&A turn and its label, from its FinBERT scores."""
+        pos_score, neg_score, neut_score = (round(score, 4) for score in scores)
+        return pos_score, neg_score, neut_score, label(scores)
+
     def get_qa_sentiment_scores(self, text: str):
         """Use FinBERT to retrieve sentiment scores for the Q&A text
 
+        A turn longer than the 512 tokens FinBERT reads is scored over overlapping windows that
+        cover all of it, and the window scores are aggregated as configured in [SENTIMENT].
+
         Args:
             text: Q&A statement text
 
@@ -237,42 +251,18 @@ class SentimentAnalysisProcessor:
             neut_score: neutral sentiment score
             sentiment_label: positive, negative, or neutral
         """
-        tokenizer = AutoTokenizer.from_pretrained("ProsusAI/finbert")
-        model = AutoModelForSequenceClassification.from_pretrained("ProsusAI/finbert")
-        
-        # Get sentiment prediction (max score)
-        inputs = tokenizer(text, padding = True, truncation = True,  return_tensors='pt')
-        outputs = model(**inputs)
-        # Get the predicted sentiment score
-        scores = torch.nn.functional.softmax(outputs.logits, dim=-1)
-        sentiment_scores = scores[:, 0].tolist(), scores[:, 1].tolist(), scores[:, 2].tolist() # (pos, neg, neutr) tuple
-        pos_score, neg_score, neut_score = round(sentiment_scores[0][0], 4), round(sentiment_scores[1][0], 4), round(sentiment_scores[2][0], 4)
-        # Get the prediction (max score) 
-        max_index = sentiment_scores.index(max(sentiment_scores))
-        sentiment_label = ''
-        if max_index == 0:
-            sentiment_label = "positive"
-        elif max_index == 1:
-            sentiment_label = "negative"
-        else:
-            sentiment_label = "neutral"
+        return self.qa_sentiment(self.finbert.score([text])[0])
 
-        return pos_score, neg_score, neut_score, sentiment_label
-
-    def add_qa_sentiment_tag_to_xml(self, xml_file_path: str, qa_df: pd.DataFrame, file_name: str):
-        """Add the sentiment labels as a <sentiment> tag, and the analysis text as an <analysis> tag to the original XML file
+    def add_qa_sentiment_tag_to_xml(self, root, qa_df: pd.DataFrame):
+        """Add the sentiment label and the pos, neg, neutr scores as tags to the Q&A section of the transcript tree
         
         Args:
-            xml_file_path: Location of xml file that has only the presentation sentiment tags 
-            qa_df: dataframe with these columns: Speaker ID, Speaker Name, Speaker Company, Text, Positive Score, Negative Score, Neutral Score, Sentiment Label        file_name: for saving the output XML file
-            file_name: for saving the output XML file
+            root: root element of the transcript XML that has only the presentation sentiment tags 
+            qa_df: dataframe with these columns: Speaker ID, Speaker Name, Speaker Company, Text, Positive Score, Negative Score, Neutral Score, Sentiment Label
 
         Returns:
-            None
+            root: the same element, with the Q&A sentiment tags added
         """  
-        tree = ET.parse(xml_file_path)
-        root = tree.getroot()
-
         qa_section = root.find("./body/section[@name='Question and Answer']")
                 
         idx = 0
@@ -291,37 +281,93 @@ class SentimentAnalysisProcessor:
                 neutr_element = ET.SubElement(element, "neutr")
                 neutr_element.text = str(qa_df.loc[idx, 'Neutral Score'])
                 idx += 1
-            
-        # Save the modified XML file
-        tree.write(file_name, encoding='utf-8', xml_declaration=True)
+
+        return root
+
+    def process_root(self, root, file_name: str = "transcript"):
+        """Add presentation and Q&A sentiment tags to an in-memory transcript tree
+
+        Args:
+            root: root element of the transcript XML
+            file_name: name used in progress messages
+
+        Returns:
+            root: the same element, with all sentiment tags added
+        """
+        return self.process_roots([root], [file_name])[0]
+
+    def process_roots(self, roots, file_names):
+        """Add presentation and Q&A sentiment tags to several in-memory transcript trees
+
+        The presentation sentences and the Q&A turns of all trees are scored by FinBERT together,
+        in batches of texts of about the same length.
+
+        Args:
+            roots: root elements of the transcript XMLs
+            file_names: name of every transcript, used in progress messages
+
+        Returns:
+            roots: the same elements, with all sentiment tags added
+        """
+        texts = []
+        transcripts = []
+        for root in roots:
+            remove_tags(root, self.TAGS)
+            statement_df = self.extract_presentation_statements(root)
+            sentences = [self.split_sentences(text) for text in statement_df.get('Statement', [])]
+            qa_df = self.extract_qa_text(root)
+            transcripts.append((statement_df, sentences, len(texts), qa_df))
+            texts += [sentence for statement in sentences for sentence in statement] + list(qa_df['Text'])
+
+        scores = self.finbert.score(texts)
+
+        for root, file_name, (statement_df, sentences, start, qa_df) in zip(roots, file_names, transcripts):
+            print(f"[{file_name}] Adding sentiment tags to the XML for the presentation section... ")
+            results = []
+            for statement in sentences:
+                results.append(self.presentation_sentiment(scores[start:start + len(statement)]))
+                start += len(statement)
+            statement_df['Sentiment Scores'] = [result[0] for result in results]
+            statement_df['Sentiment Labels'] = [result[1] for result in results]
+            statement_df['Top Sentiment Label'] = [result[2] for result in results]
+            statement_df['Analysis Summary'] = statement_df.apply(lambda x: self.create_presentation_analysis_summary(x['Statement'], x['Sentiment Labels']), axis=1)
+            self.add_presentation_sentiment_tag_to_xml(root, statement_df)
+
+            print(f"[{file_name}] Adding sentiment tags to the XML (with presentation sentiment) for the Q&A section... ")
+            results = [self.qa_sentiment(turn_scores) for turn_scores in scores[start:start + len(qa_df)]]
+            qa_df['Positive Score'] = [result[0] for result in results]
+            qa_df['Negative Score'] = [result[1] for result in results]
+            qa_df['Neutral Score'] = [result[2] for result in results]
+            qa_df['Sentiment Label'] = [result[3] for result in results]
+            self.add_qa_sentiment_tag_to_xml(root, qa_df)
+        return roots
 
     def complete_sentiment_tagging(self, xml_file_path: str, folder_path: str):
         # Extract file name
-        # print("here:", xml_file_path)
         file_name = os.path.basename(xml_file_path).split('.')[0]
 
-        print(f"[{file_name}] Adding sentiment tags to the XML for the presentation section... ")
-        statement_df = self.extract_presentation_statements(xml_file_path)
-        statement_df['Sentiment Scores'], statement_df['Sentiment Labels'], statement_df['Top Sentiment Label'] = zip(*statement_df['Statement'].apply(self.get_presentation_sentiment_scores))
-        statement_df['Analysis Summary'] = statement_df.apply(lambda x: self.create_presentation_analysis_summary(x['Statement'], x['Sentiment Labels']), axis=1)
-
-        pres_sentim_xml_file = os.path.join(folder_path, f'pres_sent_{file_name}.xml')
-        self.add_presentation_sentiment_tag_to_xml(xml_file_path, statement_df, pres_sentim_xml_file)
-
-        print(f"[{file_name}] Adding sentiment tags to the XML (with presentation sentiment) for the Q&A section... ")
-        qa_df = self.extract_qa_text(pres_sentim_xml_file)
-        qa_df['Positive Score'], qa_df['Negative Score'], qa_df['Neutral Score'], qa_df['Sentiment Label'] = zip(*qa_df['Text'].apply(self.get_qa_sentiment_scores))
+        tree = ET.parse(xml_file_path)
+        self.process_root(tree.getroot(), file_name)
 
         sentiment_file = os.path.join(folder_path, f'{file_name}.xml')
-        self.add_qa_sentiment_tag_to_xml(pres_sentim_xml_file, qa_df, sentiment_file)
-
-        os.remove(pres_sentim_xml_file)  # Cleanup
+        write_xml(tree.getroot(), sentiment_file)
 
     def process_file(self, xml_file_path: str, folder_path:str):
         self.complete_sentiment_tagging(xml_file_path, folder_path)
 
-    def process_folder(self, folder_path: str):
-        for filename in os.listdir(folder_path):
-            if filename.endswith('.xml'):
-                xml_file_path = os.path.join(folder_path, filename)
-                self.process_file(xml_file_path,folder_path)
+    def process_folder(self, folder_path: str, chunk: int = None):
+        """Add sentiment tags to every transcript of a folder, in place.
+
+        The sentences of chunk transcripts at a time share the FinBERT batches. Each chunk is
+        written as soon as it is scored, so memory does not grow with the folder and a failure
+        only loses the chunk it happened in.
+        """
+        chunk = chunk if chunk else FOLDER_CHUNK
+        xml_file_paths = sorted(os.path.join(folder_path, filename) for filename in os.listdir(folder_path) if filename.endswith('.xml'))
+        for start in range(0, len(xml_file_paths), chunk):
+            chunk_paths = xml_file_paths[start:start + chunk]
+            roots = [ET.parse(xml_file_path).getroot() for xml_file_path in chunk_paths]
+            file_names = [os.path.basename(xml_file_path).split('.')[0] for xml_file_path in chunk_paths]
+            self.process_roots(roots, file_names)
+            for root, file_name in zip(roots, file_names):
+                write_xml(root, os.path.join(folder_path, f'{file_name}.xml'))
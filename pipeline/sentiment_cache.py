@@ -0,0 +1,217 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from configparser import ConfigParser
+from pathlib import Path
+from metrics import METRICS
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+CONFIG = ConfigParser()
+CONFIG.read(BASE_DIR / "config.ini")
+# Empty to turn the cache off
+CACHE_PATH = CONFIG.get("SENTIMENT", "cache_path", fallback="sentiment_cache.db")
+# Least recently used scores are evicted beyond this many
+CACHE_MAX_ENTRIES = CONFIG.getint("SENTIMENT", "cache_max_entries", fallback=1000000)
+# SQLite limits the number of parameters of a statement
+CHUNK = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    key BLOB NOT NULL,
+    revision TEXT NOT NULL,
+    pos REAL NOT NULL,
+    neg REAL NOT NULL,
+    neutr REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (key, revision)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS scores_last_used ON scores (last_used);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+-- Rows of scores, counted once and kept up to date by store() and clear(), so evicting does not count the table
+INSERT INTO meta SELECT 'entries', (SELECT COUNT(*) FROM scores) WHERE NOT EXISTS (SELECT 1 FROM meta WHERE name = 'entries');
+"""
+
+
+def normalize(text):
+    """Text with its whitespace runs collapsed, which FinBERT's tokenizer does not see."""
+    return " ".join(text.split())
+
+
+def text_key(text):
+    return hashlib.sha256(normalize(text).encode("utf-8")).digest()
+
+
+def chunks(items):
+    for start in range(0, len(items), CHUNK):
+        yield items[start:start + CHUNK]
+
+
+class SentimentCache:
+    """FinBERT scores of every text seen before, kept in a local SQLite store.
+
+    Scores are stored by the hash of the normalized text and the revision of the model that
+    computed them, so the boilerplate every call repeats (safe-harbor language, "Thank you",
+    Operator transitions) is scored once, and a new model or backend starts from an empty cache
+    instead of reading scores it did not compute. Hits refresh the last use of a text, and the
+    least recently used texts are evicted when the store holds more than max_entries.
+
+    The store is opened on first use in every process and can be shared by pool workers.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES):
+        """
+        Args:
+            path: SQLite database of the cache, created if it does not exist; None or "" turns the cache off
+            max_entries: number of scores kept
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.connection = None
+        self.pid = None
+        # Stage threads of one process share the connection
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def set_path(self, path):
+        """Use another store, e.g. a temporary one in the benchmarks, or None to turn the cache off."""
+        self.close()
+        self.path = path
+
+    def connect(self):
+        # A connection must not be carried into a forked pool worker
+        if self.connection is None or self.pid != os.getpid():
+            self.connection = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.executescript(SCHEMA)
+            self.pid = os.getpid()
+        return self.connection
+
+    def close(self):
+        if self.connection is not None and self.pid == os.getpid():
+            self.connection.close()
+        self.connection = None
+
+    def lookup(self, keys, revision):
+        """Stored scores of the given text keys.
+
+        Returns:
+            scores: dict mapping every key found to its (pos, neg, neutr)
+        """
+        if not self.path or not keys:
+            return {}
+        found = {}
+        with self.lock:
+            connection = self.connect()
+            for chunk in chunks(list(keys)):
+                rows = connection.execute(
+                    f"SELECT key, pos, neg, neutr FROM scores WHERE revision = ? AND key IN ({','.join('?' * len(chunk))})",
+                    [revision, *chunk]).fetchall()
+                found.update((key, (pos, neg, neutr)) for key, pos, neg, neutr in rows)
+            if found:
+                now = time.time()
+                connection.execute("BEGIN IMMEDIATE")
+                try:
+                    connection.executemany("UPDATE scores SET last_used = ? WHERE key = ? AND revision = ?",
+                                           [(now, key, revision) for key in found])
+                except BaseException:
+                    connection.execute("ROLLBACK")
+                    raise
+                connection.execute("COMMIT")
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        METRICS.count("sentiment_cache_hits", len(found))
+        METRICS.count("sentiment_cache_misses", len(keys) - len(found))
+        return found
+
+    def store(self, scores, revision):
+        """Add the scores of new texts, then evict the least recently used ones beyond max_entries.
+
+        Args:
+            scores: dict mapping the text key to its (pos, neg, neutr)
+            revision: model revision that computed them
+        """
+        if not self.path or not scores:
+            return
+        now = time.time()
+        with self.lock:
+            connection = self.connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                # A text stored by another worker meanwhile has the same scores and is left as it is
+                before = connection.total_changes
+                connection.executemany("INSERT OR IGNORE INTO scores VALUES (?, ?, ?, ?, ?, ?)",
+                                       [(key, revision, *values, now) for key, values in scores.items()])
+                added = connection.total_changes - before
+                connection.execute("UPDATE meta SET value = value + ? WHERE name = 'entries'", (added,))
+                excess = connection.execute("SELECT value FROM meta WHERE name = 'entries'").fetchone()[0] - self.max_entries
+                if excess > 0:
+                    connection.execute("DELETE FROM scores WHERE (key, revision) IN "
+                                       "(SELECT key, revision FROM scores ORDER BY last_used LIMIT ?)", (excess,))
+                    connection.execute("UPDATE meta SET value = value - ? WHERE name = 'entries'", (excess,))
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def stats(self):
+        """Entries of the store by model revision, and the hits and misses of this process.
+
+        Returns:
+            stats: {"entries": {revision: count}, "hits", "misses", "hit_rate"}
+        """
+        entries = {}
+        if self.path:
+            with self.lock:
+                entries = dict(self.connect().execute("SELECT revision, COUNT(*) FROM scores GROUP BY revision").fetchall())
+        looked_up = self.hits + self.misses
+        return {"entries": entries, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / looked_up if looked_up else 0.0}
+
+    def clear(self, revision=None):
+        """Remove the scores of one model revision, or all of them."""
+        with self.lock:
+            connection = self.connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                if revision is None:
+                    connection.execute("DELETE FROM scores")
+                else:
+                    connection.execute("DELETE FROM scores WHERE revision = ?", (revision,))
+                connection.execute("UPDATE meta SET value = (SELECT COUNT(*) FROM scores) WHERE name = 'entries'")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+
+# Cache shared by the sentiment stage of every transcript
+SENTIMENT_CACHE = SentimentCache()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show or clear the cached FinBERT scores.")
+    parser.add_argument("--path", type=str, default=CACHE_PATH, help="SQLite database of the cache.")
+    parser.add_argument("--clear", action="store_true", help="Remove the cached scores.")
+    parser.add_argument("--revision", type=str, required=False, help="Only clear the scores of this model revision, as listed.")
+    args = parser.parse_args()
+
+    cache = SentimentCache(args.path)
+    if args.clear:
+        cache.clear(args.revision)
+    for revision, count in cache.stats()["entries"].items():
+        print(f"{revision}: {count} texts")
+
+'''
+Example:
+
+python sentiment_cache.py
+python sentiment_cache.py --clear
+'''
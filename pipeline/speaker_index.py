@@ -0,0 +1,140 @@
+from collections import Counter, defaultdict
+from heapq import merge
+from itertools import islice
+from fuzzywuzzy import fuzz
+
+# A known person matches when name ratio * company ratio / 10000 is above this
+MATCH_THRESHOLD = 0.65
+# Lowest company ratio that can still reach the threshold with a perfect name ratio
+MIN_COMPANY_RATIO = int(MATCH_THRESHOLD * 100) + 1
+# A string shorter than this factor times the other cannot reach MIN_COMPANY_RATIO with it
+LENGTH_FACTOR = 0.48
+
+
+def common_count(counts1, counts2):
+    """Number of characters two strings have in common, counting repeats, from their Counters."""
+    if len(counts1) > len(counts2):
+        counts1, counts2 = counts2, counts1
+    return sum(min(count, counts2.get(char, 0)) for char, count in counts1.items())
+
+
+def ratio_bound(length1, length2, common):
+    """Upper bound of fuzz.ratio for two strings sharing `common` characters (as a multiset).
+
+    fuzz.ratio rounds 2 * matches / total length to a percentage, whether difflib or
+    python-Levenshtein computes it, and two strings never match on more characters than they
+    have in common.
+    """
+    total = length1 + length2
+    return round(100 * (2.0 * common / total)) if total else 0
+
+
+class SpeakerIndex:
+    """Index over the speaker registry that finds the same person deal_ambigity used to find.
+
+    The linear scan returned the first person, in registry order, whose name ratio times company
+    ratio is above 0.65. The index returns exactly that person while scoring only a few:
+    an exact (name, company) entry bounds how far the search has to go, companies are grouped so
+    each distinct company is compared once and only those that can still reach the threshold
+    keep their people as candidates, and candidates whose length or character counts already
+    rule out a match are skipped before the real fuzz.ratio is computed.
+    """
+
+    def __init__(self, registry, ratio=fuzz.ratio):
+        """
+        Args:
+            registry: dict of the known people, each with "name" and "company", in insertion order
+            ratio: string similarity in 0-100, called as ratio(known, new) like deal_ambigity did
+        """
+        self.registry = registry
+        self.ratio = ratio
+        self.rebuild()
+
+    def rebuild(self):
+        self.people = []
+        self.name_counts = []
+        self.exact = {}
+        # company -> positions of its people in registry order
+        self.companies = defaultdict(list)
+        # Distinct companies in the order they were first seen
+        self.company_order = []
+        self.company_counts = {}
+        # company of a new person -> ({registry company: ratio} for the companies that can match,
+        # number of companies of company_order scored so far)
+        self.company_cache = {}
+        for person in self.registry.values():
+            self.index(person)
+
+    def index(self, person):
+        position = len(self.people)
+        name, company = person["name"], person["company"]
+        self.people.append(person)
+        self.name_counts.append(Counter(name))
+        self.exact.setdefault((name, company), position)
+        if company not in self.companies:
+            self.company_order.append(company)
+            self.company_counts[company] = Counter(company)
+        self.companies[company].append(position)
+
+    def add(self, key, person):
+        """Add a person to the registry and the index."""
+        self.registry[key] = person
+        if len(self.people) == len(self.registry) - 1:
+            self.index(person)
+        else:
+            self.rebuild()
+
+    def company_ratios(self, company):
+        """Ratios of the registry companies that can still reach the threshold, by company.
+
+        Cached per company and extended with the companies added since the last call, the
+        participants of a call mostly come from companies seen before.
+        """
+        scores, scored = self.company_cache.get(company, ({}, 0))
+        if scored < len(self.company_order):
+            scores.update(self.score_companies(company, self.company_order[scored:]))
+            self.company_cache[company] = (scores, len(self.company_order))
+        return scores
+
+    def score_companies(self, company, known_companies):
+        counts = Counter(company)
+        low, high = len(company) * LENGTH_FACTOR, len(company) / LENGTH_FACTOR
+        for known in known_companies:
+            if known != company:
+                if not low <= len(known) <= high:
+                    continue
+                common = common_count(self.company_counts[known], counts)
+                if ratio_bound(len(known), len(company), common) < MIN_COMPANY_RATIO:
+                    continue
+            score = self.ratio(known, company)
+            if score >= MIN_COMPANY_RATIO:
+                yield known, score
+
+    def match(self, person):
+        """Return the first known person matching person, or None."""
+        if len(self.people) < len(self.registry):
+            # People added to the registry without add(), e.g. loaded from the speaker registry
+            for known in islice(self.registry.values(), len(self.people), None):
+                self.index(known)
+        elif len(self.people) != len(self.registry):
+            self.rebuild()
+        name, company = person["name"], person["company"]
+        # An exact entry scores 100 * 100, no later person can come first
+        stop = self.exact.get((name, company), len(self.people))
+
+        company_scores = self.company_ratios(company)
+        blocks = [self.companies[known] for known in company_scores]
+
+        name_counts = Counter(name)
+        for position in merge(*blocks):
+            if position > stop:
+                break
+            node = self.people[position]
+            company_score = company_scores[node["company"]]
+            if node["name"] != name:
+                common = common_count(self.name_counts[position], name_counts)
+                if ratio_bound(len(node["name"]), len(name), common) * company_score / 10000 <= MATCH_THRESHOLD:
+                    continue
+            if self.ratio(node["name"], name) * company_score / 10000 > MATCH_THRESHOLD:
+                return node
+        return None
@@ -0,0 +1,178 @@
+import argparse
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from xml_io import atomic_write
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS speakers (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    company TEXT NOT NULL,
+    position TEXT,
+    speaker_group TEXT,
+    origin_position TEXT
+);
+"""
+
+COLUMNS = "id, name, company, position, speaker_group, origin_position"
+
+
+def to_person(row):
+    """Registry entry in the layout global_speaker.json used."""
+    id, name, company, position, group, origin_position = row
+    person = {"company": company}
+    if position is not None:
+        person["position"] = position
+    person.update({"name": name, "id": str(id), "group": group, "origin position": origin_position})
+    return person
+
+
+class SpeakerRegistry:
+    """Speaker registry shared by every process that parses transcripts, stored in SQLite.
+
+    Speakers are kept in the speakers table under the id they appear with in the XML files.
+    A parser resolves the participants of a call inside transaction(), which holds the
+    database write lock: it first loads the speakers other processes added since its last look,
+    so two processes parsing calls with the same new analyst add them once, and new speakers get
+    the next free id from the table, so ids never collide when files are parsed in parallel.
+    Each transaction only writes the rows it adds or changes.
+
+    The database runs in WAL mode, readers such as the Neo4j import are never blocked by a parser.
+    On first use it is filled from global_speaker.json, which export_json() can write again.
+    """
+
+    def __init__(self, path="global_speaker.db", json_path="global_speaker.json"):
+        """
+        Args:
+            path: SQLite database of the registry, created if it does not exist
+            json_path: registry of earlier versions, imported when the database is empty
+        """
+        self.path = path
+        self.json_path = json_path
+        # Opened on first use, a connection must not be shared with forked pool workers
+        self.connection = None
+        # id -> person, in id order; the parser matches new participants against it
+        self.people = {}
+        self.last_id = 0
+        self.added = []
+        # (person, origin position before the change), restored if the transaction rolls back
+        self.changed = []
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.executescript(SCHEMA)
+            self.migrate()
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def migrate(self):
+        """Import global_speaker.json into an empty database."""
+        if not os.path.exists(self.json_path) or os.path.getsize(self.json_path) == 0:
+            return
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have imported it while this one waited for the lock
+            if self.connection.execute("SELECT 1 FROM speakers LIMIT 1").fetchone() is None:
+                with open(self.json_path, "r", encoding="utf-8") as file:
+                    data = json.load(file)
+                self.connection.executemany(
+                    f"INSERT INTO speakers ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(int(info.get("id", key)), info["name"], info["company"], info.get("position"),
+                      info.get("group"), info.get("origin position")) for key, info in data.items()])
+                print(f"Imported {len(data)} speakers from {self.json_path} into {self.path}")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    def refresh(self):
+        """Load the speakers added since the last call, also by other processes.
+
+        Returns:
+            people: the newly loaded speakers, in id order
+        """
+        rows = self.connect().execute(
+            f"SELECT {COLUMNS} FROM speakers WHERE id > ? ORDER BY id", (self.last_id,)).fetchall()
+        people = [to_person(row) for row in rows]
+        for person in people:
+            self.people[person["id"]] = person
+        if rows:
+            self.last_id = rows[-1][0]
+        return people
+
+    @contextmanager
+    def transaction(self):
+        """Hold the write lock of the registry, with every speaker added so far loaded.
+
+        Everything added or updated inside is committed together when the block ends, and
+        rolled back if it raises, in the database and in people alike.
+        """
+        connection = self.connect()
+        connection.execute("BEGIN IMMEDIATE")
+        self.added = []
+        self.changed = []
+        try:
+            self.refresh()
+            yield self
+        except BaseException:
+            connection.execute("ROLLBACK")
+            for person, origin_position in reversed(self.changed):
+                person["origin position"] = origin_position
+            for id in self.added:
+                del self.people[id]
+            self.last_id = int(next(reversed(self.people))) if self.people else 0
+            raise
+        connection.execute("COMMIT")
+
+    def add(self, person):
+        """Add a new speaker under the next free id, stored in person["id"]. Call inside transaction()."""
+        cursor = self.connection.execute(
+            "INSERT INTO speakers (name, company, position, speaker_group, origin_position) VALUES (?, ?, ?, ?, ?)",
+            (person["name"], person["company"], person.get("position"), person.get("group"),
+             person.get("origin position")))
+        person["id"] = str(cursor.lastrowid)
+        self.people[person["id"]] = person
+        self.last_id = cursor.lastrowid
+        self.added.append(person["id"])
+        return person["id"]
+
+    def set_origin_position(self, person, origin_position):
+        """Record the title a known speaker was listed with in the latest call. Call inside transaction()."""
+        self.changed.append((person, person.get("origin position")))
+        person["origin position"] = origin_position
+        self.connection.execute("UPDATE speakers SET origin_position = ? WHERE id = ?",
+                                (origin_position, int(person["id"])))
+
+    def export_json(self, json_path):
+        """Write the registry in the global_speaker.json layout."""
+        rows = self.connect().execute(f"SELECT {COLUMNS} FROM speakers ORDER BY id").fetchall()
+        data = {str(row[0]): to_person(row) for row in rows}
+        atomic_write(json_path, json.dumps(data, indent=4).encode("utf-8"))
+        return len(data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the speaker registry.")
+    parser.add_argument("--db", type=str, default="global_speaker.db", help="SQLite database of the speaker registry.")
+    parser.add_argument("--export", type=str, required=True, help="JSON file to write the registry to.")
+    args = parser.parse_args()
+
+    registry = SpeakerRegistry(args.db)
+    count = registry.export_json(args.export)
+    registry.close()
+    print(f"Exported {count} speakers to {args.export}")
+
+'''
+Example:
+
+python speaker_registry.py --export "global_speaker.json"
+'''
@@ -0,0 +1,68 @@
+from collections import namedtuple
+
+OPERATOR = "Operator"
+
+# speaker: name the speaker is listed under in speaker_list, None for the Operator
+# title: the line under the speaker name, None for the Operator
+# text: what was said, blank lines left out
+Turn = namedtuple("Turn", ["speaker", "title", "text"])
+
+
+def normalize(line):
+    """Strip a line and collapse its whitespace runs to single spaces."""
+    return " ".join(line.split())
+
+
+def iter_turns(section_text, speaker_list, operator_line_text=False):
+    """Split the text of a Presentation or Q&A paragraph into speaker turns in one pass.
+
+    Every line is normalized once. A turn starts at a line that is the name of a call participant
+    (a key of speaker_list), followed by their title, and runs until the next participant or a line
+    reading just "Operator". A line containing "Operator" starts an Operator turn, which runs until
+    the next participant. Lines before the first turn are skipped.
+
+    Args:
+        section_text: text of the paragraph, one line per paragraph of the transcript
+        speaker_list: participants of the call by normalized name, with their "origin position"
+        operator_line_text: also keep what follows "Operator" on the line that starts an Operator
+            turn, as the Q&A section does
+
+    Yields:
+        Turn: (speaker, title, text) of every turn, in order
+    """
+    lines = section_text.split("\n")
+    keys = [normalize(line) for line in lines]
+    count = len(lines)
+    i = 0
+    while i < count:
+        key = keys[i]
+        if key in speaker_list:
+            title = lines[i + 1].strip() if i + 1 < count else ""
+            origin_position = speaker_list[key]["origin position"]
+            parts = []
+            if title != origin_position:
+                # The title of a known speaker is followed by what they said on the same line
+                split = title.split(origin_position)
+                other_part = split[1].strip() if len(split) > 1 else ""
+                if other_part:
+                    parts.append(other_part)
+            i += 2
+            while i < count and keys[i] not in speaker_list and keys[i] != OPERATOR:
+                if keys[i]:
+                    parts.append(lines[i])
+                i += 1
+            yield Turn(key, title, "\n".join(parts).strip())
+        elif OPERATOR in lines[i]:
+            if operator_line_text:
+                lines[i] = lines[i].replace(OPERATOR, "")
+                keys[i] = normalize(lines[i])
+            else:
+                i += 1
+            parts = []
+            while i < count and keys[i] not in speaker_list:
+                if keys[i]:
+                    parts.append(lines[i])
+                i += 1
+            yield Turn(None, None, "\n".join(parts).strip())
+        else:
+            i += 1
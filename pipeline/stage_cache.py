@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import threading
+from xml_io import atomic_write
+
+STAGES = ["parse", "sentiment", "emotion", "summary", "prices", "index"]
+
+
+class StageCache:
+    """Content-addressed cache of stage outputs with a per-transcript manifest.
+
+    For every transcript and stage the manifest records the hash of the stage input, the stage
+    version (code version plus model) and the hash of the stage output. Outputs are stored once
+    under their own hash in <save_dir>/.stage_cache/blobs, so a rerun only repeats the stages
+    whose input, code version or model changed.
+
+    manifest.json layout:
+        {transcript: {stage: {"input": <sha256>, "version": <str>, "output": <sha256>, ...}}}
+
+    The cache doubles as the checkpoint of folder runs. Every stored stage and every saved XML
+    file is appended to journal.jsonl and flushed to disk right away, so a run that is killed
+    halfway through a transcript resumes at the first stage that had not finished. The journal
+    is folded into manifest.json by save(). The "written" entry of a transcript records the XML
+    file saved for it; a rerun skips the transcript entirely while that file, the RTF and the
+    stage versions are unchanged.
+    """
+
+    def __init__(self, save_dir, rebuild=None):
+        """
+        Args:
+            save_dir: folder the processed XML files are saved in; the cache lives next to them
+            rebuild: stage names to recompute even when the manifest says they are up to date,
+                "all" forces every stage
+        """
+        self.cache_dir = os.path.join(save_dir, ".stage_cache")
+        self.blob_dir = os.path.join(self.cache_dir, "blobs")
+        self.manifest_path = os.path.join(self.cache_dir, "manifest.json")
+        self.journal_path = os.path.join(self.cache_dir, "journal.jsonl")
+        self.rebuild = set(rebuild) if rebuild else set()
+        self.lock = threading.Lock()
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self.manifest = self.load_manifest()
+
+    @staticmethod
+    def hash_bytes(data):
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def hash_file(path):
+        sha = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def load_manifest(self):
+        manifest = {}
+        if os.path.exists(self.manifest_path) and os.path.getsize(self.manifest_path) > 0:
+            with open(self.manifest_path, "r", encoding="utf-8") as file:
+                manifest = json.load(file)
+        # Replay the checkpoints recorded after the manifest was last saved
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        # The last line is cut short if the process died while writing it
+                        continue
+                    manifest.setdefault(event["transcript"], {})[event["stage"]] = event["entry"]
+        return manifest
+
+    def append_journal(self, transcript, stage, entry):
+        line = json.dumps({"transcript": transcript, "stage": stage, "entry": entry}) + "\n"
+        # One O_APPEND write per line, so pool workers can checkpoint into the same journal
+        fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode("utf-8"))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def save(self, compact=True):
+        """Write the manifest.
+
+        Args:
+            compact: also empty the journal, whose entries are now in the manifest; only safe when
+                no other process is appending to it, i.e. not while pool workers are running
+        """
+        with self.lock:
+            data = json.dumps(self.manifest, indent=4).encode("utf-8")
+        atomic_write(self.manifest_path, data)
+        if compact and os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def blob_path(self, output_hash):
+        return os.path.join(self.blob_dir, output_hash + ".xml")
+
+    def forced(self, stage):
+        return stage in self.rebuild or "all" in self.rebuild
+
+    def lookup(self, transcript, stage, input_hash, version):
+        """Return the cached output bytes of a stage, or None if the stage has to run."""
+        if self.forced(stage):
+            return None
+        entry = self.manifest.get(transcript, {}).get(stage)
+        if not entry or entry["input"] != input_hash or entry["version"] != version:
+            return None
+        path = self.blob_path(entry["output"])
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as file:
+            return file.read()
+
+    def store(self, transcript, stage, input_hash, version, output, **extra):
+        """Store the output bytes of a stage and record it in the manifest.
+
+        Returns:
+            entry: the manifest entry written for this stage
+        """
+        output_hash = self.hash_bytes(output)
+        path = self.blob_path(output_hash)
+        if not os.path.exists(path):
+            atomic_write(path, output)
+        entry = {"input": input_hash, "version": version, "output": output_hash, **extra}
+        self.record(transcript, stage, entry)
+        return entry
+
+    def record(self, transcript, stage, entry):
+        with self.lock:
+            self.manifest.setdefault(transcript, {})[stage] = entry
+            self.append_journal(transcript, stage, entry)
+
+    def record_written(self, transcript, file, versions, data):
+        """Checkpoint the XML file saved for a transcript once all its stages are done.
+
+        Args:
+            transcript: name of the source transcript
+            file: path of the saved XML file
+            versions: combined version of every stage the file went through
+            data: the bytes written to the file
+        """
+        self.record(transcript, "written", {"file": file, "versions": versions, "output": self.hash_bytes(data)})
+
+    def finished(self, transcript, input_hash, versions):
+        """True if the transcript was completely processed from the same RTF with the same stage versions
+        and its XML file is still the one that was saved."""
+        if self.rebuild:
+            return False
+        entries = self.manifest.get(transcript, {})
+        parse, written = entries.get("parse"), entries.get("written")
+        if not parse or not written or parse["input"] != input_hash or written["versions"] != versions:
+            return False
+        return os.path.exists(written["file"]) and self.hash_file(written["file"]) == written["output"]
+
+    def entries(self, transcript, stages=None):
+        entries = self.manifest.get(transcript, {})
+        if stages is None:
+            return dict(entries)
+        return {stage: entries[stage] for stage in stages if stage in entries}
+
+    def update(self, transcript, entries):
+        """Merge manifest entries recorded elsewhere, e.g. by a pool worker."""
+        with self.lock:
+            self.manifest.setdefault(transcript, {}).update(entries)
+
+    def prune(self):
+        """Delete blobs that no manifest entry refers to any more."""
+        referenced = {entry["output"] for stages in self.manifest.values()
+                      for stage, entry in stages.items() if stage != "written"}
+        for blob in os.listdir(self.blob_dir):
+            if blob.endswith(".xml") and blob[:-len(".xml")] not in referenced:
+                os.remove(os.path.join(self.blob_dir, blob))
@@ -0,0 +1,135 @@
+import copy
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class Stage:
+    """An enrichment stage and the stages whose tags it reads.
+
+    Args:
+        name: stage name, e.g. "sentiment"
+        processor: object with process_root(root, file_name) and stage_version()
+        deps: names of the stages that must finish before this one starts
+        message: progress message printed when the stage completes
+    """
+
+    def __init__(self, name, processor, deps=(), message=None):
+        self.name = name
+        self.processor = processor
+        self.deps = tuple(deps)
+        self.message = message if message else f"{name} completed."
+
+    def __repr__(self):
+        return f"Stage({self.name}, deps={list(self.deps)})"
+
+
+class StageScheduler:
+    """Run a graph of enrichment stages, overlapping the ones that do not depend on each other.
+
+    Stages only ever append elements to the transcript tree. Each stage runs on its own copy of
+    the parsed tree with the additions of its upstream stages applied, so independent stages
+    (e.g. network-bound summarization and CPU-bound FinBERT) can run at the same time without
+    sharing a tree. When all stages are done, their additions are grafted onto the parsed tree
+    in declaration order, which gives exactly the XML of a sequential run.
+    """
+
+    def __init__(self, stages, max_workers=None):
+        """
+        Args:
+            stages: list of Stage, in the order their tags should appear in the XML; every
+                dependency must be declared before the stages that use it
+            max_workers: number of stages allowed to run at once, defaults to all of them
+        """
+        self.stages = list(stages)
+        self.max_workers = max_workers if max_workers else len(self.stages)
+        self.by_name = {stage.name: stage for stage in self.stages}
+        seen = set()
+        for stage in self.stages:
+            for dep in stage.deps:
+                if dep not in self.by_name:
+                    raise ValueError(f"Stage {stage.name} depends on unknown stage {dep}")
+                if dep not in seen:
+                    raise ValueError(f"Stage {stage.name} is declared before its dependency {dep}")
+            seen.add(stage.name)
+
+    def ancestors(self, stage):
+        """Names of every stage upstream of the given stage, in declaration order."""
+        names = set()
+        pending = list(stage.deps)
+        while pending:
+            name = pending.pop()
+            if name not in names:
+                names.add(name)
+                pending.extend(self.by_name[name].deps)
+        return [s.name for s in self.stages if s.name in names]
+
+    @staticmethod
+    def find_additions(base, stage_input, stage_output):
+        """Collect the elements a stage appended, keyed by the index path of their parent in the base tree.
+
+        Returns:
+            additions: list of (path, [elements]) pairs
+        """
+        additions = []
+
+        def walk(b, i, o, path):
+            for k in range(len(b)):
+                walk(b[k], i[k], o[k], path + (k,))
+            for k in range(len(b), len(i)):
+                if sum(1 for _ in i[k].iter()) != sum(1 for _ in o[k].iter()):
+                    raise RuntimeError(f"A stage changed the <{i[k].tag}> element added by an upstream stage")
+            if len(o) > len(i):
+                additions.append((path, list(o)[len(i):]))
+
+        walk(base, stage_input, stage_output, ())
+        return additions
+
+    @staticmethod
+    def apply_additions(root, additions, copy_elements=True):
+        for path, elements in additions:
+            parent = root
+            for k in path:
+                parent = parent[k]
+            for element in elements:
+                parent.append(copy.deepcopy(element) if copy_elements else element)
+        return root
+
+    def build_input(self, base, stage, additions):
+        stage_input = copy.deepcopy(base)
+        for name in self.ancestors(stage):
+            self.apply_additions(stage_input, additions[name])
+        return stage_input
+
+    def run(self, root, run_stage):
+        """Run every stage as soon as its dependencies are done.
+
+        Args:
+            root: root element of the parsed transcript; it receives the tags of all stages
+            run_stage: callable(stage, stage_input) returning the stage output tree; it owns
+                stage_input and may modify it in place
+
+        Returns:
+            root: the same element, with the additions of every stage in declaration order
+        """
+        additions = {}
+        inputs = {}
+        pending = list(self.stages)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for stage in [s for s in pending if all(dep in additions for dep in s.deps)]:
+                    pending.remove(stage)
+                    inputs[stage.name] = self.build_input(root, stage, additions)
+                    # run_stage may modify its input in place, so keep an untouched copy to diff against
+                    stage_input = copy.deepcopy(inputs[stage.name])
+                    running[pool.submit(run_stage, stage, stage_input)] = stage
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    output = future.result()
+                    additions[stage.name] = self.find_additions(root, inputs.pop(stage.name), output)
+                    print(stage.message)
+
+        for stage in self.stages:
+            self.apply_additions(root, additions[stage.name], copy_elements=False)
+        return root
@@ -1,29 +1,42 @@
-from openai import OpenAI
 import os
 from configparser import ConfigParser
 from pathlib import Path
+from metrics import METRICS
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 # print(BASE_DIR)
 CONFIG = ConfigParser()
 CONFIG.read(BASE_DIR / "config.ini")
-OPENAI_KEY = CONFIG.get("UPSTREAM", "openai_api_key")
+OPENAI_KEY = CONFIG.get("UPSTREAM", "openai_api_key", fallback="")
 
 class Summarizer:
+    MODEL = "gpt-3.5-turbo"
 
     def __init__(self):
-        self.client = OpenAI(api_key=OPENAI_KEY)
+        # The OpenAI client is created on first use
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=OPENAI_KEY)
+        return self._client
 
     def summarize(self, text, tag):
         # tag = "question" if isQuestion else "answer"
         completion = self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
+            model=self.MODEL,
             messages=[
                 {"role": "system", "content": 
                         "You are a financial analyst reading earnings call transcript, skilled in analyzing the call and performing summarization. You are preparing for an upcoming earnings call and looking back to previous earnings calls to get insights. Your task is to summartize the presentation statement, questions and answers concisely."},
                 {"role": "user", "content": f"Summarize this {tag} with only one sentence: {text}"}
             ]
         )
+        METRICS.count("openai_calls")
+        if completion.usage is not None:
+            METRICS.count("openai_prompt_tokens", completion.usage.prompt_tokens)
+            METRICS.count("openai_completion_tokens", completion.usage.completion_tokens)
         summarization = completion.choices[0].message.content
         # print(len(summarization) / len(text) * 100, '%')
 
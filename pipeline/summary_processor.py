@@ -1,16 +1,25 @@
 from summarization import Summarizer
 import os
-import pandas as pd
-import torch
-from xml.etree import ElementTree as ET
+from xml_io import ET, remove_tags, write_xml
 
 import warnings
 warnings.filterwarnings("ignore")
 
 class SummaryProcessor:
+    # Bump when a code change alters the tags this stage writes, so cached results are rebuilt
+    STAGE_VERSION = "1"
+    # Tag this stage adds to every <text>
+    TAGS = ["summary"]
+
     def __init__(self):
         self.summarizer = Summarizer()
 
+    def stage_version(self):
+        return f"{self.STAGE_VERSION}:{self.summarizer.MODEL}"
+
+    def warm_up(self):
+        self.summarizer.client
+
     def add_presentation_summary_to_xml(self, root):
         """
         Add summaries to the XML file based on the section presentation.
@@ -86,6 +95,19 @@ class SummaryProcessor:
 
         return root
     
+    def process_root(self, root, file_name="transcript"):
+        """
+        Add summaries to the presentation and Q&A sections of an in-memory transcript tree.
+
+        Args:
+            root: ElementTree of the transcript
+            file_name: name used in progress messages
+        """
+        remove_tags(root, self.TAGS)
+        root = self.add_presentation_summary_to_xml(root)
+        root = self.add_QA_summary_to_xml(root)
+        return root
+
     def process_file(self, xml_file_path: str):
         """
         Process a single XML file by adding summaries to its presentation and Q&A sections.
@@ -97,11 +119,10 @@ class SummaryProcessor:
         root = tree.getroot()
 
         # Add summaries to presentation and Q&A sections
-        root = self.add_presentation_summary_to_xml(root)
-        root = self.add_QA_summary_to_xml(root)
+        root = self.process_root(root)
 
         # Write the modified XML back to the same file
-        tree.write(xml_file_path, encoding='utf-8', xml_declaration=True)
+        write_xml(root, xml_file_path)
         print(f"Processed {xml_file_path}")
     
 
@@ -0,0 +1,43 @@
+import glob
+import os
+import pytest
+from document_reader import parse_document, read_document
+
+SAMPLES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "sample_data", "*.rtf")))
+
+
+def texts(doc):
+    return [paragraph.text for paragraph in doc.paragraphs]
+
+
+def cells(table):
+    return [[cell.text.strip() for cell in row.cells] for row in table.rows]
+
+
+@pytest.mark.parametrize("path", SAMPLES, ids=os.path.basename)
+def test_samples_have_the_structure_the_parser_reads(path):
+    doc = read_document(path)
+    paragraphs = [text for text in texts(doc) if text]
+    assert "NYSE:" in paragraphs[0]
+    assert any(text.endswith("Earnings Call Transcripts") for text in paragraphs)
+    assert any(text.startswith("Presentation") for text in paragraphs)
+    assert any(text.startswith("Question and Answer") for text in paragraphs)
+    tables = [cells(table) for table in doc.tables if any(any(row) for row in cells(table))]
+    assert len(tables) >= 4
+    assert tables[1][1][1:4] == ["CONSENSUS", "ACTUAL", "SURPRISE"]
+    assert ["Call Participants"] in tables[3]
+    assert "EXECUTIVES" in tables[3][-1][0]
+
+
+def test_rtf_text_tables_and_code_page_characters():
+    data = (b"{\\rtf1\\ansi\\ansicpg1252{\\fonttbl{\\f0 Arial;}}"
+            b"Head \\u8220?q\\u8221? caf\\'e9 \x93x\x94\\par"
+            b"\\intbl A\\cell B\\cell\\row\\intbl C\\cell D\\cell\\row\\pard Tail\\par}")
+    doc = parse_document(data)
+    assert texts(doc) == ["Head “q” café “x”", "Tail"]
+    assert [cells(table) for table in doc.tables] == [[["A", "B"], ["C", "D"]]]
+
+
+def test_rtf_8bit_text_follows_the_ansi_code_page():
+    doc = parse_document(b"{\\rtf1\\ansi\\ansicpg1251 \xcf\xf0\xe8\xe2\xe5\xf2\\par}")
+    assert texts(doc) == ["Привет"]
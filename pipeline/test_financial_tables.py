@@ -0,0 +1,47 @@
+from financial_tables import eps_history_rows, estimate_rows, to_number
+
+# Rows of the two financial tables of the Q1 2020 sample transcript, as the parser reads them
+ESTIMATES = [
+    ["", "-FQ1 2020-", "-FQ2 2020-", "-FY 2020-", "-FY 2021-"],
+    ["", "CONSENSUS", "ACTUAL", "SURPRISE", "CONSENSUS", "CONSENSUS", "CONSENSUS"],
+    ["EPS Normalized", "0.91", "1.05", "15.38", "0.87", "3.47", "3.73"],
+    ["Revenue  (mm)", "3868.77", "4108.00", "6.18", "3755.18", "15034.88", "15020.39"],
+]
+EPS_HISTORY = [
+    ["", "", "- EPS NORMALIZED  -", ""],
+    ["", "CONSENSUS", "ACTUAL", "SURPRISE"],
+    ["FQ2 2019", "0.96", "1.01", "5.21 %"],
+    ["FQ1 2020", "0.91", "1.05", "15.38 %"],
+]
+
+
+def test_estimate_periods_span_their_types():
+    rows = estimate_rows(ESTIMATES)
+    assert rows[:6] == [
+        ("EPS Normalized", "FQ1 2020", "CONSENSUS", 0.91),
+        ("EPS Normalized", "FQ1 2020", "ACTUAL", 1.05),
+        ("EPS Normalized", "FQ1 2020", "SURPRISE", 15.38),
+        ("EPS Normalized", "FQ2 2020", "CONSENSUS", 0.87),
+        ("EPS Normalized", "FY 2020", "CONSENSUS", 3.47),
+        ("EPS Normalized", "FY 2021", "CONSENSUS", 3.73),
+    ]
+    assert rows[7] == ("Revenue (mm)", "FQ1 2020", "ACTUAL", 4108.0)
+
+
+def test_eps_history_keeps_every_type():
+    assert eps_history_rows(EPS_HISTORY) == [
+        ("EPS Normalized", "FQ2 2019", "CONSENSUS", 0.96),
+        ("EPS Normalized", "FQ2 2019", "ACTUAL", 1.01),
+        ("EPS Normalized", "FQ2 2019", "SURPRISE", 5.21),
+        ("EPS Normalized", "FQ1 2020", "CONSENSUS", 0.91),
+        ("EPS Normalized", "FQ1 2020", "ACTUAL", 1.05),
+        ("EPS Normalized", "FQ1 2020", "SURPRISE", 15.38),
+    ]
+
+
+def test_to_number():
+    assert to_number("1,234.5") == 1234.5
+    assert to_number("(0.12)") == -0.12
+    assert to_number("-3.2 %") == -3.2
+    assert to_number("NA") is None
+    assert to_number("-") is None
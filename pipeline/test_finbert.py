@@ -0,0 +1,69 @@
+import re
+import types
+import pytest
+from finbert import FinBert, aggregate, weights_revision
+
+
+class WordFinBert(FinBert):
+    """FinBert whose tokenizer makes one token of every word."""
+
+    @property
+    def tokenizer(self):
+        def tokenize(texts, **kwargs):
+            return {"offset_mapping": [[word.span() for word in re.finditer(r"\S+", text)] for text in texts]}
+        return tokenize
+
+
+def batches(lengths, batch_size=128, max_tokens=64, buckets=(16, 32, 512)):
+    return list(FinBert(batch_size=batch_size, max_tokens=max_tokens, buckets=buckets).batches(lengths))
+
+
+def test_batches_cover_every_text_once_in_increasing_length():
+    lengths = [30, 3, 12, 400, 5, 20, 16]
+    result = batches(lengths)
+    order = [i for _, batch in result for i in batch]
+    assert sorted(order) == list(range(len(lengths)))
+    assert [lengths[i] for i in order] == sorted(lengths)
+
+
+def test_batches_stay_in_one_bucket_and_within_the_token_budget():
+    lengths = [3, 5, 12, 16, 17, 20, 30, 400]
+    assert batches(lengths) == [(16, [0, 1, 2, 3]), (32, [4, 5]), (32, [6]), (512, [7])]
+    for _, batch in batches(lengths):
+        assert len(batch) == 1 or len(batch) * max(lengths[i] for i in batch) <= 64
+
+
+def test_batch_size_limits_the_texts_of_a_batch():
+    assert batches([2] * 5, batch_size=2, max_tokens=None) == [(16, [0, 1]), (16, [2, 3]), (16, [4])]
+
+
+def test_long_texts_are_split_into_overlapping_windows():
+    text = " ".join(f"w{i}" for i in range(1200))
+    windows = WordFinBert(window_overlap=10).windows(["short", text])
+    assert list(windows) == [text]
+    assert [length for _, length in windows[text]] == [510, 510, 200]
+    first, second, last = (window.split() for window, _ in windows[text])
+    assert (first[0], first[-1], second[0], second[-1], last[0], last[-1]) == ("w0", "w509", "w500", "w1009", "w1000", "w1199")
+
+
+def test_window_scores_are_aggregated_by_the_configured_rule():
+    scores = [(0.1, 0.8, 0.1), (0.6, 0.1, 0.3)]
+    assert aggregate(scores, [300, 100], "max_negative") == (0.1, 0.8, 0.1)
+    assert aggregate(scores, [300, 100], "mean") == pytest.approx((0.35, 0.45, 0.2))
+    assert aggregate(scores, [300, 100], "length_weighted") == pytest.approx((0.225, 0.625, 0.15))
+    with pytest.raises(ValueError):
+        FinBert(aggregation="median")
+
+
+def test_cache_revision_follows_the_weights(tmp_path):
+    commit = "a" * 40
+    assert FinBert(hub_revision=commit).revision == f"ProsusAI/finbert@{commit}"
+    checkpoint = tmp_path / "finbert"
+    checkpoint.mkdir()
+    (checkpoint / "model.safetensors").write_bytes(b"weights")
+    model = types.SimpleNamespace(config=types.SimpleNamespace(_commit_hash=None))
+    before = weights_revision(str(checkpoint), model)
+    (checkpoint / "model.safetensors").write_bytes(b"new weights")
+    assert weights_revision(str(checkpoint), model) != before
+    model.config._commit_hash = "b" * 40
+    assert weights_revision(str(checkpoint), model) == "b" * 40
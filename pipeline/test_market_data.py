@@ -0,0 +1,37 @@
+import sys
+import types
+import pandas as pd
+from market_data import MINUTE, MarketData
+
+
+def fake_yfinance(monkeypatch, frame):
+    calls = []
+
+    def download(tickers, **kwargs):
+        calls.append((tickers, kwargs["start"], kwargs["interval"]))
+        return frame
+
+    monkeypatch.setitem(sys.modules, "yfinance", types.SimpleNamespace(download=download))
+    return calls
+
+
+def test_minute_bars_past_the_horizon_are_asked_for_once(tmp_path, monkeypatch):
+    calls = fake_yfinance(monkeypatch, pd.DataFrame())
+    for _ in range(2):
+        store = MarketData(str(tmp_path / "market_data.db"))
+        store.prefetch(["BK", "^GSPC", "^BKX"], ["2020-04-16"], interval=MINUTE)
+        for ticker in ["BK", "^GSPC", "^BKX"]:
+            assert store.minute(ticker, "2020-04-16", fetch=False).empty
+        store.close()
+    assert calls == [(["BK", "^GSPC", "^BKX"], "2020-04-16", MINUTE)]
+
+
+def test_empty_days_are_not_asked_for_again_before_the_ttl(tmp_path, monkeypatch):
+    calls = fake_yfinance(monkeypatch, pd.DataFrame())
+    store = MarketData(str(tmp_path / "market_data.db"))
+    assert store.daily("BK", "2020-04-16") is None
+    assert store.daily("BK", "2020-04-16") is None
+    assert len(calls) == 1
+    monkeypatch.setattr("market_data.EMPTY_TTL", 0)
+    store.daily("BK", "2020-04-16")
+    assert len(calls) == 2
@@ -0,0 +1,16 @@
+from metrics import Metrics
+
+
+def test_drained_worker_counters_reach_the_parent_export(tmp_path):
+    worker, parent = Metrics(), Metrics()
+    # Counted outside any stage, like the model loads of the pool initializer
+    worker.count("model_loads", 2)
+    with worker.stage("sentiment", "call.rtf"):
+        worker.count("finbert_texts", 5)
+    parent.merge(*worker.drain())
+    assert worker.drain() == ([], {})
+
+    parent.export(str(tmp_path))
+    prom = (tmp_path / "metrics.prom").read_text()
+    assert 'irgraph_model_loads_total{stage="none"} 2' in prom
+    assert 'irgraph_finbert_texts_total{stage="sentiment"} 5' in prom
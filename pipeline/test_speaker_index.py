@@ -0,0 +1,46 @@
+import json
+import random
+from fuzzywuzzy import fuzz
+from speaker_index import SpeakerIndex
+
+
+def linear_match(registry, person):
+    """The scan deal_ambigity used to run over the whole registry."""
+    for node in registry.values():
+        if fuzz.ratio(node["name"], person["name"]) * fuzz.ratio(node["company"], person["company"]) / 10000 > 0.65:
+            return node
+    return None
+
+
+def perturb(text, rng):
+    chars = list(text)
+    for _ in range(rng.randint(0, 3)):
+        i = rng.randrange(len(chars)) if chars else 0
+        edit = rng.choice(["drop", "swap", "insert"])
+        if edit == "drop" and chars:
+            del chars[i]
+        elif edit == "swap" and chars:
+            chars[i] = rng.choice("abcdefghijklmnopqrstuvwxyz .")
+        else:
+            chars.insert(i, rng.choice("abcdefghijklmnopqrstuvwxyz ."))
+    return "".join(chars)
+
+
+def test_speaker_index_matches_linear_scan():
+    rng = random.Random(7)
+    with open("global_speaker.json", "r", encoding="utf-8") as file:
+        known = list(json.load(file).values())
+
+    registry = {}
+    index = SpeakerIndex(registry)
+    for i in range(400):
+        base = rng.choice(known)
+        person = {"name": perturb(base["name"], rng), "company": perturb(base["company"], rng)}
+        expected = linear_match(registry, person)
+        assert index.match(person) is expected
+        if expected is None:
+            index.add(str(i), person)
+
+    # People added to the registry directly are picked up too
+    registry["extra"] = {"name": "Jane Q. Analyst", "company": "Example Research LLC"}
+    assert index.match({"name": "Jane Q Analyst", "company": "Example Research LLC"}) is registry["extra"]
@@ -0,0 +1,44 @@
+import json
+import pytest
+from speaker_registry import SpeakerRegistry
+
+
+def analyst(name):
+    return {"name": name, "company": "Example Research LLC", "group": "ANALYSTS", "origin position": "Example Research LLC"}
+
+
+def test_speaker_registry_shares_ids_between_processes(tmp_path):
+    seed = {"1": {"company": "Example Corp", "position": "CEO", "name": "Jane Doe", "id": "1",
+                  "group": "EXECUTIVES", "origin position": "CEO"}}
+    json_path = tmp_path / "global_speaker.json"
+    json_path.write_text(json.dumps(seed))
+    # Two connections to the same database, like two parser processes
+    first = SpeakerRegistry(str(tmp_path / "speakers.db"), str(json_path))
+    second = SpeakerRegistry(str(tmp_path / "speakers.db"), str(json_path))
+
+    with first.transaction():
+        assert first.add(analyst("John Roe")) == "2"
+    with second.transaction():
+        # The speaker added by the other connection is loaded before a new id is taken
+        assert [person["name"] for person in second.people.values()] == ["Jane Doe", "John Roe"]
+        assert second.add(analyst("Mary Major")) == "3"
+        second.set_origin_position(second.people["1"], "Chairman & CEO")
+
+    before = first.people["1"]["origin position"]
+    with pytest.raises(RuntimeError):
+        with first.transaction():
+            first.add(analyst("Rolled Back"))
+            first.set_origin_position(first.people["1"], "Rolled Back Title")
+            raise RuntimeError
+    assert list(first.people) == ["1", "2", "3"]
+    assert first.people["1"]["origin position"] == before
+    with first.transaction():
+        assert first.add(analyst("Richard Miles")) == "4"
+
+    first.export_json(str(json_path))
+    exported = json.loads(json_path.read_text())
+    assert list(exported) == ["1", "2", "3", "4"]
+    assert exported["1"] == {**seed["1"], "origin position": "Chairman & CEO"}
+    assert "position" not in exported["2"]
+    first.close()
+    second.close()
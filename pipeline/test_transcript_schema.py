@@ -0,0 +1,60 @@
+import pytest
+from xml_io import ET
+from transcript_schema import TranscriptValidationError, check, validate
+
+
+def transcript():
+    """Smallest tree the parser writes for a call: header, tables, participants, presentation and Q&A."""
+    root = ET.Element("Transcript")
+    header = ET.SubElement(root, "header")
+    for tag, text in [("company", "The Bank of New York Mellon Corporation NYSE:BK"), ("quarter", "Q1"),
+                      ("year", "2020"), ("time", "Thursday, April 16, 2020 12:00 PM GMT"), ("ticker", "BK")]:
+        ET.SubElement(header, tag).text = text
+    body = ET.SubElement(root, "body")
+    tables = ET.SubElement(body, "section", name="Financial Tables")
+    ET.SubElement(tables, "table", id="0")
+    participants = ET.SubElement(body, "section", name="Call Participants")
+    ET.SubElement(participants, "person", id="17").text = "Thomas P. Gibbons"
+    ET.SubElement(participants, "person", id="10").text = "Gerard S. Cassidy"
+    presentation = ET.SubElement(body, "section", name="Presentation")
+    turn(ET.SubElement(presentation, "statement"), "17", "Thomas P. Gibbons", "Good morning.")
+    qa = ET.SubElement(body, "section", name="Question and Answer")
+    turn(ET.SubElement(qa, "transition"), "0", "Operator", "")
+    turn(ET.SubElement(qa, "question", id="0"), "10", "Gerard S. Cassidy", "How are fees?")
+    turn(ET.SubElement(qa, "answer", id="0"), "17", "Thomas P. Gibbons", "Up.")
+    return root
+
+
+def turn(parent, speaker_id, name, text):
+    speaker = ET.SubElement(parent, "speaker", id=speaker_id)
+    speaker.text = name
+    ET.SubElement(speaker, "text").text = text
+
+
+def test_parsed_transcript_is_valid():
+    assert validate(transcript()) == []
+
+
+def test_missing_section_and_header():
+    root = transcript()
+    root.find("body").remove(root.find("./body/section[@name='Question and Answer']"))
+    root.find("header/quarter").text = "No match found"
+    assert validate(root) == ["header <quarter> is 'No match found'", "section 'Question and Answer' is missing"]
+
+
+def test_speaker_ids_must_match_participants():
+    root = transcript()
+    root.find("./body/section[@name='Presentation']/statement/speaker").set("id", "10")
+    root.find("./body/section[@name='Question and Answer']/question/speaker").set("id", "99")
+    with pytest.raises(TranscriptValidationError) as error:
+        check(root, "BK-Q1-2020")
+    assert error.value.problems == [
+        "Presentation: speaker 'Thomas P. Gibbons' has the id 10 of Gerard S. Cassidy",
+        "Question and Answer: speaker 'Gerard S. Cassidy' has id 99, which is not a call participant",
+    ]
+
+
+def test_section_without_text():
+    root = transcript()
+    root.find("./body/section[@name='Presentation']/statement/speaker/text").text = " "
+    assert validate(root) == ["Presentation: no turn has text"]
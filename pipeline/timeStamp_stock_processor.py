@@ -1,33 +1,29 @@
-import whisper
 import os
 import pandas as pd
-import torch
-from xml.etree import ElementTree as ET
 import nltk
 import warnings
 import numpy as np
 import re
 import pytz
 from datetime import datetime,timedelta
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import yfinance as yf
 import json
-nltk.download('punkt')
+from resources import ensure_nltk_data, whisper_model
+from metrics import METRICS
+from market_data import MARKET_DATA, MINUTE
+from xml_io import ET, remove_tags, write_xml
 warnings.filterwarnings("ignore")
 
 from configparser import ConfigParser
 from pathlib import Path
 import difflib
 import re
-import matplotlib.pyplot as plt
 import pandas as pd
 
 BASE_DIR =Path.cwd().parent
 print(BASE_DIR)
 CONFIG = ConfigParser()
 CONFIG.read(BASE_DIR / "config.ini")
-POLYGON_KEY = CONFIG.get("UPSTREAM", "polygon_api_key")
+POLYGON_KEY = CONFIG.get("UPSTREAM", "polygon_api_key", fallback="")
 
 
 # audio_path = "recording"
@@ -41,16 +37,28 @@ POLYGON_KEY = CONFIG.get("UPSTREAM", "polygon_api_key")
 # stock_folder = "stock"
 
 class TimeStampStockProcessor():
+    # Tags this step adds to every <text>
+    TAGS = ["timeStamp", "stock_price", "S_P500", "KBW"]
+
     def __init__(self):
-        self.model = whisper.load_model("base")
         self.xml_file = ""
         self.result = ""
         self.global_time = []
         self.global_price = []
 
+    @property
+    def model(self):
+        # Whisper is only needed when no stored speech-to-text result exists, it is loaded on first use
+        return whisper_model("base")
+
+    def warm_up(self):
+        ensure_nltk_data('punkt')
+        self.model
+
     def audio2text(self, audio_path,audio_file):
         print("whisper model processing takes about 10mins per file")
         self.result = self.model.transcribe(os.path.join(audio_path, audio_file))
+        METRICS.count("whisper_transcriptions")
         self.store_audio2text_result()
         return self.result
     
@@ -98,17 +106,20 @@ class TimeStampStockProcessor():
         return re.sub(r'\W+', ' ', text.lower()).strip()
 
     def calculate_similarity(self, text1, text2):
-        
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.metrics.pairwise import cosine_similarity
         vectorizer = TfidfVectorizer()
         tfidf = vectorizer.fit_transform([text1, text2])
         return cosine_similarity(tfidf[0:1], tfidf[1:2])[0][0]
     
     def split_text_into_sentences(self, text):
-
+        ensure_nltk_data('punkt')
         tokenizer = nltk.data.load('tokenizers/punkt/english.pickle')
         return tokenizer.tokenize(text)
     
     def find_most_similar_sentence(self, sentence, segments):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.metrics.pairwise import cosine_similarity
         vectorizer = TfidfVectorizer()
 
         max_similarity = 0
@@ -160,12 +171,12 @@ class TimeStampStockProcessor():
         # print(f"et_time: {et_time}")  
         return et_time
 
-    def load_daily_stock_data(self, ticker, date):
+    def load_daily_stock_data(self, ticker, date, end=None, fetch=True):
+        """Minute bars of the day of the call (up to the day of end), from the local market data store.
 
-        start_date = date
-        end_date = pd.to_datetime(date).date() + pd.Timedelta(days=1)
-        data = yf.download(ticker, start=start_date, end=end_date, interval='1m')
-        return data
+        fetch=False only reads the store, once get_stock_data has prefetched the day.
+        """
+        return MARKET_DATA.minute(ticker, date, end, fetch)
     
     def get_specific_data(self, specific_time, stock_data):
         specific_time = pd.to_datetime(specific_time)  # datetime obj
@@ -357,9 +368,11 @@ class TimeStampStockProcessor():
     def get_stock_data(self, stock_folder, ticker, time):
         if not os.path.exists(stock_folder):
             os.makedirs(stock_folder)
-        stock_data = self.load_daily_stock_data(ticker, self.convert_gmt_to_et(time))
-        SP500_data = self.load_daily_stock_data("^GSPC",self.convert_gmt_to_et(time))
-        BKX_data = self.load_daily_stock_data("^BKX",self.convert_gmt_to_et(time))
+        # The three tickers come with one request when the store does not have the day yet
+        MARKET_DATA.prefetch([ticker, "^GSPC", "^BKX"], [self.convert_gmt_to_et(time)], interval=MINUTE)
+        stock_data = self.load_daily_stock_data(ticker, self.convert_gmt_to_et(time), fetch=False)
+        SP500_data = self.load_daily_stock_data("^GSPC", self.convert_gmt_to_et(time), fetch=False)
+        BKX_data = self.load_daily_stock_data("^BKX", self.convert_gmt_to_et(time), fetch=False)
         stock_data.to_csv(os.path.join(stock_folder, self.xml_file.replace("xml","csv")))
         SP500_data.to_csv(os.path.join(stock_folder, self.xml_file.replace(".xml","-SP500.csv")))
         BKX_data.to_csv(os.path.join(stock_folder, self.xml_file.replace(".xml","-KBW.csv")))
@@ -402,6 +415,7 @@ class TimeStampStockProcessor():
         Args:
             stock_data (DataFrame): DataFrame containing the stock data with datetime index.
         """
+        import matplotlib.pyplot as plt
         # Check if data is empty
         if stock_data.empty:
             print("No data available to plot.")
@@ -437,6 +451,7 @@ class TimeStampStockProcessor():
 
 
     def plot_stock_prices(self,df):
+        import matplotlib.pyplot as plt
         plt.figure(figsize=(10, 5))
         plt.plot(df['Time'], df['Price'], marker='o', linestyle='-', color='b')
         plt.title('Stock Prices Over Time')
@@ -449,8 +464,16 @@ class TimeStampStockProcessor():
     
     
 
-    def process_file(self, audio_path,audio_file, stock_folder, xml_path, xml_file, has_stock_data):
+    def process_file(self, audio_path,audio_file, stock_folder, xml_path, xml_file, has_stock_data, save_path=None, plot=True):
+        """
+        Args:
+            save_path: where to write the XML with time stamps and stock prices, defaults to xml_file
+            plot: show the stock price plots, turned off by the ingestion daemon
+        """
         self.xml_file = xml_file
+        # The daemon reuses one processor for many calls, prices are collected per call
+        self.global_time = []
+        self.global_price = []
         try:
             self.load_audio2text_result()
         except FileNotFoundError:
@@ -465,14 +488,18 @@ class TimeStampStockProcessor():
 
         else:
             stock_data, SP500_data, BKX_data = self.get_stock_data(stock_folder, ticker, time)
+        remove_tags(root, self.TAGS)
         root = self.add_presentation_stockprice_to_xml(root,time,stock_data, SP500_data, BKX_data, self.result)
         root = self.add_QA_stockprice_to_xml(root, time, stock_data, SP500_data, BKX_data, self.result)
-        tree.write(xml_file, encoding='utf-8', xml_declaration=True)
+        save_path = save_path if save_path else xml_file
+        write_xml(root, save_path)
         print(f"Processed {xml_file}")
-        self.plot_stock_data(stock_data)
-        
-        df = self.create_and_sort_dataframe()
-        self.plot_stock_prices(df)
+        if plot:
+            self.plot_stock_data(stock_data)
+
+            df = self.create_and_sort_dataframe()
+            self.plot_stock_prices(df)
+        return save_path
 
 
 if __name__ == "__main__":
@@ -1,14 +1,15 @@
-import docx
 import os
-import xml.etree.ElementTree as ET
 import re
 import argparse
-import aspose.words as aw
-import yfinance as yf
-from datetime import datetime,timedelta
+from xml_io import ET, indent, write_xml
+from document_reader import read_document
+from financial_tables import FinancialTableStore, table_rows
+from header_price_processor import HeaderPriceProcessor
+from speaker_index import SpeakerIndex
+from speaker_registry import SpeakerRegistry
+from speaker_turns import iter_turns
+from transcript_schema import TranscriptValidationError
 from fuzzywuzzy import fuzz
-import json
-import io
 
 ENDING = ["conclude", "thank you for participating", "no further question",
           "that concludes our call", "that's all the time we have",
@@ -22,51 +23,32 @@ ENDING = ["conclude", "thank you for participating", "no further question",
 
 
 
-def load_or_initialize_global_speaker(file_path):
-    if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            global_speaker = json.load(file)
-    else:
-        global_speaker = {}
-    return global_speaker
-
-GLOBAL_SPEAKER = load_or_initialize_global_speaker("global_speaker.json")
-
 class TranscriptParser:
-    def __init__(self):
-        self.global_speaker = GLOBAL_SPEAKER
+    # Bump when a code change alters the XML this parser writes, so cached results are rebuilt
+    STAGE_VERSION = "5"
+
+    def __init__(self, speaker_registry=None, price_processor=None, table_store=None):
+        # Known speakers are shared with the other parser processes through the registry database
+        self.speaker_registry = speaker_registry if speaker_registry else SpeakerRegistry()
+        # Collects the (ticker, day) of the parsed calls, their header prices are filled afterwards
+        self.price_processor = price_processor if price_processor else HeaderPriceProcessor()
+        # Typed values of the financial tables of every call, for queries over the corpus
+        self.table_store = table_store if table_store else FinancialTableStore()
+        self.global_speaker = self.speaker_registry.people
+        self.speaker_index = SpeakerIndex(self.global_speaker, ratio=self.compare_entities)
+
+    def stage_version(self):
+        return self.STAGE_VERSION
         
     
     @staticmethod
     def compare_entities(name1, name2):
         return fuzz.ratio(name1, name2)
     
-    @staticmethod
-    def analyze_stock_performance(open_price, close_price, high_price, low_price):
-        if close_price > open_price:
-            return "increased"
-        elif close_price < open_price:
-            return "decreased"
-        else:
-            if high_price > open_price or high_price > close_price:
-                return "increased"
-            elif low_price < open_price or low_price < close_price:
-                return "decreased"
-            else:
-                return "neutral"
-
     def deal_ambigity(self, person_info):
-        exist = False
-        
-        for p in GLOBAL_SPEAKER:
-            node = GLOBAL_SPEAKER[p]
-            similarity_score = self.compare_entities(node["name"], person_info["name"]) * self.compare_entities(node["company"], person_info["company"]) / 10000
-            if similarity_score > 0.65:
-                exist = True
-                #print(node["name"],node["company"], person_info["name"], person_info["company"], similarity_score)
-                return exist, node
-            #print(node["name"],node["company"], person_info["name"], person_info["company"], similarity_score)
-        return exist, None
+        # First known person whose name ratio * company ratio / 10000 is above 0.65, see SpeakerIndex
+        node = self.speaker_index.match(person_info)
+        return node is not None, node
 
     # def debug_deal_ambigity(self, person_info):
     #     exist = False
@@ -88,39 +70,32 @@ class TranscriptParser:
         return list(zip(*filtered))
 
     @staticmethod
-    def rtfToDocx(rtf_path, filename):
-        doc = aw.Document(os.path.join(rtf_path, filename))
-        doc.save(filename.replace(".rtf", ".docx"))
-        doc = docx.Document(filename.replace(".rtf", ".docx"))
-        return doc
-    
+    def read_transcript(rtf_path, filename):
+        # Read in memory, nothing is converted or written next to the transcript
+        return read_document(os.path.join(rtf_path, filename))
+
     @staticmethod
-    def get_stock_info(ticker_symbol, time):
-        open_price,close_price, high_price, low_price = None, None, None, None
-
-        try:
-            ticker = yf.Ticker(ticker_symbol)
-
-            date_str = time
-            date_format = "%A, %B %d, %Y %I:%M %p %Z"
-            datetime_obj = datetime.strptime(date_str, date_format)
-
-            formatted_date = datetime_obj.strftime("%Y-%m-%d")
-            datetime_obj_plus_one = datetime_obj + timedelta(days=1)
-            # print(formatted_date)
-            data = ticker.history(start=formatted_date, end=datetime_obj_plus_one)
-
-            if not data.empty:
-                open_price =  data['Open'].iloc[0]
-                close_price = data['Close'].iloc[0]
-                high_price = data['High'].iloc[0] 
-                low_price = data['Low'].iloc[0]
-            else:
-                print("No data available for the specified date.")
-        except Exception as e:
-            print("An error occurred:", str(e))
+    def header_paragraphs(doc):
+        """Index the header paragraphs from the company line, the first paragraph with text.
+
+        The company is followed by the title, the call time, the estimates heading, and after the
+        estimates table by the currency and the consensus note.
+        """
+        start = next((i for i, paragraph in enumerate(doc.paragraphs) if paragraph.text.strip()), 0)
+        return {start: "company", start + 1: "title", start + 2: "time", start + 4: "currency", start + 5: "note"}
+    
+    def read_header(self, file_dir, filename):
+        """Ticker and call time from the header paragraphs of a transcript.
 
-        return open_price,close_price, high_price, low_price
+        The whole document is read, only the header paragraphs are looked at.
+
+        Returns:
+            (ticker, time): e.g. ("BK", "Thursday, April 16, 2020 12:00 PM GMT")
+        """
+        doc = self.read_transcript(file_dir, filename)
+        fields = {field: doc.paragraphs[i].text for i, field in self.header_paragraphs(doc).items()
+                  if i < len(doc.paragraphs)}
+        return fields["company"].split(":")[1].strip(), fields["time"]
 
     def build_first_table(self, data):
         data = [list(dict.fromkeys(row)) for row in data]
@@ -168,8 +143,13 @@ class TranscriptParser:
         return root
 
     def build_third_table(self, data,company):
-        id = len(GLOBAL_SPEAKER) + 1
-        root = ET.Element("Call Participants")
+        # The registry stays locked until every participant is resolved, so a parser running
+        # in parallel cannot add the same new speaker or take the same id
+        with self.speaker_registry.transaction():
+            return self.build_participants(data, company)
+
+    def build_participants(self, data, company):
+        root = ET.Element("section")
         speaker_list = {}
             
         current_group = ''
@@ -202,11 +182,11 @@ class TranscriptParser:
                         origin_position = position
 
                     if edge_case:
-                        person_element = ET.SubElement(root, "person", company = position, group=current_group, id = str(id))
+                        person_element = ET.SubElement(root, "person", company = position, group=current_group)
                         person_info["company"] = "unknown"
     
                     elif current_group == "EXECUTIVES":
-                        person_element = ET.SubElement(root, "person", company = company, position=position, group=current_group, id = str(id))
+                        person_element = ET.SubElement(root, "person", company = company, position=position, group=current_group)
                         person_info["company"] = company
                         person_info["position"] = position
 
@@ -215,7 +195,7 @@ class TranscriptParser:
                         position = position.replace("Research Division", "").strip()
                         if position[-1] == ",":
                             position = position[:-1].strip()
-                        person_element = ET.SubElement(root, "person", company = position, group=current_group, id = str(id))
+                        person_element = ET.SubElement(root, "person", company = position, group=current_group)
                         person_info["company"] = position
 
                         
@@ -223,72 +203,34 @@ class TranscriptParser:
                     person_element.text = name
                     person_info["name"] = name
             
-                    person_info["id"] = str(id)
                     person_info["group"] = current_group
                                 
                     person_info["origin position"] = origin_position
                     exist, node = self.deal_ambigity(person_info)
                         
                     if exist:
-                        node["origin position"] = origin_position
+                        self.speaker_registry.set_origin_position(node, origin_position)
                         speaker_list[name] = node
-                        person_element.set("id", node["id"]) 
                     else:
-                            
+                        # Takes the next free id of the registry
+                        self.speaker_registry.add(person_info)
+                        node = person_info
                         speaker_list[name] = person_info
-                        GLOBAL_SPEAKER[id] = person_info
-                    id=len(GLOBAL_SPEAKER) +1
+                    person_element.set("id", node["id"])
         return root, speaker_list
 
     def process_presentation(self, dialog,speaker_list, name):
-        paragraph = dialog.split('\n')
-
         conversation = ET.Element("section", attrib={"name": name})
-        i = 0 
-        while i < len(paragraph):
-            speaker_name = re.sub(r'\s+', ' ', paragraph[i].strip())
-            if speaker_name  in speaker_list:
-                id = speaker_list[speaker_name]["id"]
-                title = paragraph[i+1].strip()
-                
-                if title != speaker_list[speaker_name]["origin position"]:
-                    origin_position = speaker_list[speaker_name]["origin position"]
-                    parts = title.split(origin_position)
-                    other_part = parts[1] if len(parts) > 1 else ""
-                    
-                    text = other_part.strip() + "\n" if other_part!="" else ""
-                else:
-                    text = ""
-                
-                statement = ET.SubElement(conversation, "statement")
-                speaker_element = ET.SubElement(statement, "speaker", id=id, position=speaker_list[speaker_name]["origin position"])
-                speaker_element.text = re.sub(r'\s+', ' ', paragraph[i].strip()) 
-                para = ET.SubElement(speaker_element, "text")
-                i += 2
-                while i < len(paragraph) and re.sub(r'\s+', ' ', paragraph[i].strip()) not in speaker_list and paragraph[i].strip()!= "Operator":
-                    if len(paragraph[i].strip()) != 0:
-                        text += paragraph[i] + "\n"
-                    i += 1
-                
-                para.text = text.strip()
-                
-            elif "Operator" in paragraph[i]:
-                id = "0"
-                position = "Operator"
-                statement = ET.SubElement(conversation, "statement")
-                speaker_element = ET.SubElement(statement, "speaker", id=id, position=position)
+        for speaker, title, text in iter_turns(dialog, speaker_list):
+            statement = ET.SubElement(conversation, "statement")
+            if speaker is None:
+                speaker_element = ET.SubElement(statement, "speaker", id="0", position="Operator")
                 speaker_element.text = "Operator"
-                text = ""
-                para = ET.SubElement(speaker_element, "text")
-                i += 1
-                while i < len(paragraph) and re.sub(r'\s+', ' ', paragraph[i].strip()) not in speaker_list:
-                    if len(paragraph[i].strip()) != 0:
-                        text += paragraph[i] + "\n"
-                    i += 1
-                para.text = text.strip()
-                
             else:
-                i += 1
+                speaker_element = ET.SubElement(statement, "speaker", id=speaker_list[speaker]["id"], position=speaker_list[speaker]["origin position"])
+                speaker_element.text = speaker
+            para = ET.SubElement(speaker_element, "text")
+            para.text = text
         return conversation
 
 
@@ -296,26 +238,13 @@ class TranscriptParser:
         question_id = -1
         followup_id = -1
         end = False
-        paragraph = dialog.split('\n')
         cur_question = None
         conversation = ET.Element("section", attrib={"name": name})
-        i = 0 
         hasSub = False
         last_question_element = None
         last_question_answered = True
-        while i < len(paragraph):
-            speaker_name = re.sub(r'\s+', ' ', paragraph[i].strip())
-            if speaker_name in speaker_list:
-                id = speaker_list[speaker_name]["id"]
-                title = paragraph[i+1].strip()
-                if title != speaker_list[speaker_name]["origin position"]:
-                    origin_position = speaker_list[speaker_name]["origin position"]
-                    parts = title.split(origin_position)
-                    other_part = parts[1] if len(parts) > 1 else ""
-                    
-                    text = other_part.strip() + "\n" if other_part!="" else ""
-                else:
-                    text = ""
+        for speaker, title, text in iter_turns(dialog, speaker_list, operator_line_text=True):
+            if speaker is not None:
                 if end:
                     context = ET.SubElement(conversation, "ending", id = str(question_id))
                     
@@ -326,10 +255,10 @@ class TranscriptParser:
                         last_question_element.tag = "other"
                     followup_id = -1
                     context = ET.SubElement(conversation, "question", id = str(question_id))
-                    cur_question = paragraph[i].strip()
+                    cur_question = speaker
                     last_question_element = context
                     last_question_answered = False
-                elif paragraph[i].strip() == cur_question :
+                elif speaker == cur_question :
                     if last_question_element is not None and not last_question_answered:
                         if last_question_element.tag =="question":
                             question_id-=1
@@ -342,86 +271,46 @@ class TranscriptParser:
                     hasSub = True
                     last_question_element = context
                     last_question_answered = False
-                elif hasSub and paragraph[i].strip()!= cur_question:
+                elif hasSub and speaker != cur_question:
                     context = ET.SubElement(conversation, "followAnswer", id=str(followup_id),  question_id = str(question_id))
                     hasSub = False
                     last_question_answered = True
                 else:
                     context = ET.SubElement(conversation, "answer", id = str(question_id))
                     last_question_answered = True
-                speaker_element = ET.SubElement(context, "speaker", id=id, position=speaker_list[speaker_name]["origin position"])
-                speaker_element.text = re.sub(r'\s+', ' ', paragraph[i].strip()) 
+                speaker_element = ET.SubElement(context, "speaker", id=speaker_list[speaker]["id"], position=speaker_list[speaker]["origin position"])
+                speaker_element.text = speaker
                 
                 para = ET.SubElement(speaker_element, "text")
-                i += 2
-                while i < len(paragraph) and re.sub(r'\s+', ' ', paragraph[i].strip()) not in speaker_list and paragraph[i].strip()!= "Operator":
-                    # print(paragraph[i])
-                    # print(paragraph[i].startswith("Operator"))
-                    # print("--------------------------")
-                    if len(paragraph[i].strip()) != 0:
-                        text += paragraph[i] + "\n"
-                    i += 1
-                para.text = text.strip()
+                para.text = text
                 
-            elif "Operator" in paragraph[i]:
+            else:
                 if last_question_element is not None and not last_question_answered:
                     if last_question_element.tag =="question":
                         question_id-=1
                     last_question_element.tag = "other"
                 last_question_element = None
                 last_question_answered = False
-                id = "0"
-                position = "Operator"
                 cur_question = None
                 hasSub = False
                 question_id += 1
                 followup_id = -1
                 context =ET.SubElement(conversation, "transition") 
-                speaker_element = ET.SubElement(context, "speaker", id=id, position=position)
+                speaker_element = ET.SubElement(context, "speaker", id="0", position="Operator")
                 speaker_element.text = "Operator"
-                text = ""
                 para = ET.SubElement(speaker_element, "text")
-                paragraph[i] = paragraph[i].replace("Operator", "")
-                while i < len(paragraph) and re.sub(r'\s+', ' ', paragraph[i].strip())  not in speaker_list:
-                    if len(paragraph[i].strip()) != 0:
-                        text += paragraph[i] + "\n"
-                    i += 1
-                para.text = text.strip()
+                para.text = text
                 if para.text =="":
                     conversation.remove(context)
                 if "conclude" in para.text:
                     context.tag = "ending"
                     end = True
-                    
-                
-            else:
-                i += 1
 
         return conversation
 
     @staticmethod
-    def prettify(element, indent='    ', level=0):
-        
-        if element:  
-            if not element.text or not element.text.strip():
-                element.text = '\n' + indent * (level + 1)
-            if not element.tail or not element.tail.strip():
-                element.tail = '\n' + indent * level
-        else:
-            if level and (not element.tail or not element.tail.strip()):
-                element.tail = '\n' + indent * level
-        
-        for subelement in element:
-            TranscriptParser.prettify(subelement, indent, level + 1)
-
-
-    def build_table(self, doc):
-        company = ""
-        for i, paragraph in enumerate(doc.paragraphs):
-
-            if i ==2 :
-                company = paragraph.text
-                break
+    def doc_tables(doc):
+        """Text of the non-empty tables of a transcript: the estimates, the EPS history, the contents and the participants."""
         tables = []
         for table_index, table in enumerate(doc.tables):
                 t = []
@@ -438,14 +327,26 @@ class TranscriptParser:
                 if t== [['']] or t ==[]:
                     continue
                 tables.append(t)
-                
+        return tables
+
+    def build_table(self, doc):
+        header_fields = self.header_paragraphs(doc)
+        company = ""
+        for i, paragraph in enumerate(doc.paragraphs):
+
+            if header_fields.get(i) == "company":
+                company = paragraph.text
+                break
+        tables = self.doc_tables(doc)
+        if len(tables) < 4:
+            # The tables are told apart by their position only
+            raise TranscriptValidationError([f"expected the estimates, EPS, contents and participants tables, found {len(tables)} tables"])
         t1 = self.build_first_table(tables[0])
         t2 = self.build_second_table(tables[1])
         sec2,speaker_list = self.build_third_table(tables[3],company)
         sec1 = ET.Element("section", attrib={"name": "Financial Tables"})
         sec1.append(t1)
         sec1.append(t2)
-        sec2.tag = "section"
         sec2.set("name", "Call Participants")
         return sec1, sec2, speaker_list
 
@@ -459,18 +360,20 @@ class TranscriptParser:
         note = ""
         QA = None
         presentation = None
+        header_fields = self.header_paragraphs(doc)
         for i, paragraph in enumerate(doc.paragraphs):
+            field = header_fields.get(i)
 
-            if i ==2 :
+            if field == "company":
                 company = paragraph.text
                 
-            elif i == 3:
+            elif field == "title":
                 title = paragraph.text
-            elif i == 4:
+            elif field == "time":
                 time = paragraph.text
-            elif i == 6:
+            elif field == "currency":
                 currency= paragraph.text
-            elif i == 7:
+            elif field == "note":
                 note= paragraph.text
             
             elif paragraph.text.strip().startswith("Question and Answer"):
@@ -481,10 +384,13 @@ class TranscriptParser:
 
     
         header = ET.Element("header")
+        if ":" not in company:
+            raise TranscriptValidationError([f"company line {company!r} has no ticker"])
         ticker = company.split(":")[1].strip()
         match = re.search(r"Q\d \d{4}", title)
-        q_y = match.group(0).replace(" ", "-") if match else "No match found"
-        quarter, year = q_y.split("-")
+        if not match:
+            raise TranscriptValidationError([f"title {title!r} has no quarter"])
+        quarter, year = match.group(0).split(" ")
         ET.SubElement(header, "company").text = company
         ET.SubElement(header, "quarter").text = quarter
         ET.SubElement(header, "year").text = year
@@ -492,47 +398,57 @@ class TranscriptParser:
         ET.SubElement(header, "currency").text = currency
         ET.SubElement(header, "note").text = note
         ET.SubElement(header, "ticker").text = ticker
-        open_price,close_price, high_price, low_price = self.get_stock_info(ticker,time)
-        ET.SubElement(header, "open_price").text =  f"{open_price:.6f}"
-        ET.SubElement(header, "close_price").text = f"{close_price:.6f}"
-        ET.SubElement(header, "high_price").text =  f"{high_price:.6f}"
-        ET.SubElement(header, "low_price").text = f"{low_price:.6f}"
-        ET.SubElement(header, "stock_performance").text = self.analyze_stock_performance(open_price, close_price, high_price, low_price)
+        # The stock prices are added by the price processor once it fetched them with those of other calls
+        self.price_processor.queue(ticker, time)
 
 
         body.append(sec1)
         body.append(sec2)
-        body.append(presentation)
-        body.append(QA)
+        # A missing section is reported by the validation that follows parsing
+        for section in (presentation, QA):
+            if section is not None:
+                body.append(section)
         root = ET.Element("Transcript")
         root.append(header)
         root.append(body)
         return root, ticker, quarter, year
 
-    def process_file(self, file_dir, filename, save_dir):
-        doc = self.rtfToDocx(file_dir, filename)
+    def parse_file(self, file_dir, filename):
+        """Parse a transcript into an in-memory XML tree without writing it to disk.
+
+        The values of its financial tables are written to the table store.
+
+        Returns:
+            tree_root: root element of the transcript XML
+            out_file_name: file name the transcript is saved under, e.g. BK-Q1-2024.xml
+        """
+        doc = self.read_transcript(file_dir, filename)
         tree_root, ticker, quarter, year = self.build_xml(doc)
-        self.prettify(tree_root)
-        tree = ET.ElementTree(tree_root)
+        indent(tree_root)
         out_file_name = f"{ticker}-{quarter}-{year}"
-        tree.write(os.path.join(save_dir, out_file_name + ".xml"), encoding="utf-8", xml_declaration=True)
-        os.remove(filename.replace(".rtf", ".docx"))
+        tables = self.doc_tables(doc)
+        self.table_store.write(out_file_name, ticker, quarter, year, table_rows(tables[0], tables[1]))
+        return tree_root, out_file_name + ".xml"
 
-        json_path = os.path.join("global_speaker.json")
-        with io.open(json_path, "w", encoding='utf-8') as json_file:
-            json.dump(self.global_speaker, json_file, indent=4)
+    def process_file(self, file_dir, filename, save_dir):
+        tree_root, out_file_name = self.parse_file(file_dir, filename)
+        self.price_processor.process_root(tree_root, os.path.splitext(out_file_name)[0])
+        write_xml(tree_root, os.path.join(save_dir, out_file_name))
 
-        return out_file_name + ".xml"
+        return out_file_name
 
     def process_folder(self, file_dir, save_dir):
+        out_file_names = []
         for root, dirs, files in os.walk(os.path.abspath(file_dir)):
             for filename in files:
                 if filename.endswith(".rtf"):
-                    self.process_file(root, filename, save_dir)
+                    tree_root, out_file_name = self.parse_file(root, filename)
+                    write_xml(tree_root, os.path.join(save_dir, out_file_name))
+                    out_file_names.append(out_file_name)
 
-        json_path = os.path.join("global_speaker.json")
-        with io.open(json_path, "w", encoding='utf-8') as json_file:
-            json.dump(self.global_speaker, json_file, indent=4)
+        # Every transcript is saved without waiting for prices, those of all calls then come together
+        for out_file_name in out_file_names:
+            self.price_processor.process_file(os.path.join(save_dir, out_file_name))
 
 # def main():
 #     parser = argparse.ArgumentParser(description='Parse rtf file and convert to XML.')
@@ -0,0 +1,115 @@
+import re
+
+OPERATOR_ID = "0"
+
+# What a parsed transcript must hold before any model or network work is done for it
+SCHEMA = {
+    # Header tags that must have text, with the pattern the text must match
+    "header": {
+        "company": r".+",
+        "quarter": r"Q[1-4]",
+        "year": r"\d{4}",
+        "time": r".+",
+        "ticker": r"\S+",
+    },
+    # Sections of the body, with the elements each must have at least one of
+    "sections": {
+        "Financial Tables": ["table"],
+        "Call Participants": ["person"],
+        "Presentation": ["statement"],
+        "Question and Answer": ["question", "answer"],
+    },
+    # Sections whose turns are spoken by the call participants and must have text
+    "dialog": ["Presentation", "Question and Answer"],
+}
+
+
+class TranscriptValidationError(ValueError):
+    """A transcript does not have the structure the enrichment stages expect.
+
+    Attributes:
+        problems: every mismatch found, one sentence each
+    """
+
+    def __init__(self, problems, name="transcript"):
+        self.problems = list(problems)
+        super().__init__(f"{name} does not match the transcript schema: " + "; ".join(self.problems))
+
+
+def participants(section):
+    """Names of the call participants by speaker id; the registry can match two listed names to one speaker."""
+    speakers = {}
+    for person in section.iter("person"):
+        speakers.setdefault(person.get("id"), set()).add(" ".join((person.text or "").split()))
+    return speakers
+
+
+def check_header(header, problems):
+    for tag, pattern in SCHEMA["header"].items():
+        element = header.find(tag)
+        text = element.text.strip() if element is not None and element.text else ""
+        if not re.fullmatch(pattern, text):
+            problems.append(f"header <{tag}> is {text!r}" if text else f"header <{tag}> is missing or empty")
+
+
+def check_dialog(name, section, speakers, problems):
+    has_text = False
+    for speaker in section.iter("speaker"):
+        speaker_id = speaker.get("id")
+        speaker_name = " ".join((speaker.text or "").split())
+        if speaker_id is None:
+            problems.append(f"{name}: speaker {speaker_name!r} has no id")
+        elif speaker_id != OPERATOR_ID and speaker_id not in speakers:
+            problems.append(f"{name}: speaker {speaker_name!r} has id {speaker_id}, which is not a call participant")
+        elif speaker_id != OPERATOR_ID and speaker_name not in speakers[speaker_id]:
+            problems.append(f"{name}: speaker {speaker_name!r} has the id {speaker_id} of {', '.join(sorted(speakers[speaker_id]))}")
+        text = speaker.find("text")
+        has_text = has_text or (text is not None and bool((text.text or "").strip()))
+    if not has_text:
+        problems.append(f"{name}: no turn has text")
+
+
+def validate(root):
+    """Check a parsed transcript against SCHEMA.
+
+    Checks the header tags, that every section is there once with its elements, that every speaker
+    of the Presentation and the Q&A is a call participant listed under the same id, and that both
+    have text.
+
+    Args:
+        root: root element of the parsed transcript XML
+
+    Returns:
+        problems: every mismatch found, empty if the transcript is valid
+    """
+    problems = []
+    header = root.find("header")
+    if header is None:
+        problems.append("<header> is missing")
+    else:
+        check_header(header, problems)
+
+    sections = {}
+    for section in root.findall("./body/section"):
+        name = section.get("name")
+        if name in sections:
+            problems.append(f"section {name!r} appears more than once")
+        sections[name] = section
+    for name, children in SCHEMA["sections"].items():
+        if name not in sections:
+            problems.append(f"section {name!r} is missing")
+        elif not any(sections[name].find(child) is not None for child in children):
+            problems.append(f"section {name!r} has no <{'> or <'.join(children)}>")
+
+    speakers = participants(sections["Call Participants"]) if "Call Participants" in sections else {}
+    for name in SCHEMA["dialog"]:
+        if name in sections:
+            check_dialog(name, sections[name], speakers, problems)
+    return problems
+
+
+def check(root, name="transcript"):
+    """Raise TranscriptValidationError listing every problem validate() finds."""
+    problems = validate(root)
+    if problems:
+        raise TranscriptValidationError(problems, name)
@@ -1,6 +1,6 @@
 from neo4j_processor import Neo4jProcessor
-from file_processor import FileProcessor
-from timeStamp_stock_processor import TimeStampStockProcessor
+from stage_cache import STAGES
+from metrics import METRICS
 import argparse
 import os
 from configparser import ConfigParser
@@ -29,6 +29,12 @@ def neo4j_import_folder(folder_path):
     print(f"Completed importing all files in {folder_path} to Neo4j {URI}.")
     neo4j_processor.close()
 
+def neo4j_import_archive(archive_path):
+    neo4j_processor = Neo4jProcessor(URI, AUTH)
+    count = neo4j_processor.process_archive(archive_path)
+    print(f"Completed importing {count} files from {archive_path} to Neo4j {URI}.")
+    neo4j_processor.close()
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description="Process files for sentiment and emotion analysis and import to Neo4j.")
@@ -42,30 +48,60 @@ if __name__ == "__main__":
     parser.add_argument("--stock-dir", type=str, required=False, help="Directory to save or read stock information.")
     parser.add_argument("--has-stock-data", action="store_true", help="Flag to indicate if we already have minute level stock data")
     parser.add_argument("--clean_db", action="store_true", help="add the flag to clean the current database")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes used when processing a whole folder.")
+    parser.add_argument("--rebuild", action="append", choices=STAGES + ["all"], help="Recompute a stage even if its cached result is up to date. Can be repeated.")
+    parser.add_argument("--no-cache", action="store_true", help="Run every stage without reading or writing the stage cache.")
+    parser.add_argument("--serial-stages", action="store_true", help="Run the stages of a transcript one at a time instead of overlapping independent ones.")
+    parser.add_argument("--watch", action="store_true", help="Keep running and process every transcript dropped into --file-dir, keeping the models loaded between files.")
+    parser.add_argument("--metrics-dir", type=str, required=False, help="Directory to write per-stage metrics to (metrics.jsonl and metrics.prom).")
+    parser.add_argument("--quarantine-dir", type=str, required=False, help="Directory for transcripts that fail validation. Defaults to <save-dir>/quarantine.")
+    parser.add_argument("--archive", type=str, default="xml.rar", help="RAR, zip or tar archive of XML files read by --generate-from-rar without unpacking it.")
+    parser.add_argument("--poll-interval", type=float, default=5.0, help="Seconds between two scans of the drop folder in --watch mode.")
     args = parser.parse_args()
 
     #process_file(self, audio_path,audio_file, stock_folder, xml_path, xml_file, has_stock_data):
     #"recording", "The Bank of New York Mellon Corporation (NYSE_BK) Jul-12-2024 - Audio.mp3", "stock", "xml", "BK-Q1-2024.xml", False
-    processor = FileProcessor(file_dir=args.file_dir, save_dir=args.save_dir, filename=args.filename)
-    if args.generate_from_rar:
-        print(args.generate_from_rar)
-        neo4j_import_folder(args.save_dir)
+    if args.watch:
+        from ingestion_daemon import IngestionDaemon
+        daemon = IngestionDaemon(args.file_dir, args.save_dir, URI, AUTH, add_stock=args.add_stock,
+                                 audio_dir=args.audio_dir, stock_dir=args.stock_dir if args.stock_dir else "stock",
+                                 poll_interval=args.poll_interval, use_cache=not args.no_cache,
+                                 parallel_stages=not args.serial_stages, metrics_dir=args.metrics_dir)
+        daemon.run()
+    elif args.generate_from_rar:
+        # An already unpacked folder is still imported as before
+        if args.save_dir and os.path.isdir(args.save_dir):
+            neo4j_import_folder(args.save_dir)
+        else:
+            neo4j_import_archive(args.archive)
     else:
+        # The stage processors pull in torch, transformers and NLTK; import them only when transcripts are processed
+        from file_processor import FileProcessor
+        processor = FileProcessor(file_dir=args.file_dir, save_dir=args.save_dir, filename=args.filename,
+                                  workers=1 if args.filename else args.workers,
+                                  use_cache=not args.no_cache, rebuild=args.rebuild,
+                                  parallel_stages=not args.serial_stages, metrics_dir=args.metrics_dir,
+                                  quarantine_dir=args.quarantine_dir)
         if args.filename:
             print(f"processing single file: {args.filename}")
             file_name = args.filename
             file_name = processor.process_single_file(args.save_dir)
 
             if args.add_stock:
+                from timeStamp_stock_processor import TimeStampStockProcessor
                 print(f"Generate time stamp for file: {file_name}")
                 stock_processor = TimeStampStockProcessor()
-                stock_processor.process_file(args.audio_dir, args.audio_file,  args.stock_dir, args.save_dir, file_name, args.has_stock_data)
+                with METRICS.stage("stock", file_name):
+                    stock_processor.process_file(args.audio_dir, args.audio_file,  args.stock_dir, args.save_dir, file_name, args.has_stock_data)
             print(f"neo 4j processing {file_name} on {AUTH}")
             neo4j_import_single_file( file_name)
 
         else:
             processor.process_all_files()
             neo4j_import_folder(args.save_dir)
+    if not args.watch:
+        METRICS.export(args.metrics_dir)
+        METRICS.report()
 
 '''
 
@@ -81,10 +117,16 @@ python upstream_pipeline.py --file-dir "transcripts/BK" ^
 
 processor.process_file("recording", "The Bank of New York Mellon Corporation (NYSE_BK) Jul-12-2024 - Audio.mp3", "stock", "xml", "BK-Q1-2024.xml", True)
 python upstream_pipeline.py --file-dir "xml" --generate-from-rar
+python upstream_pipeline.py --generate-from-rar --archive "xml.rar"
 
 python upstream_pipeline.py --file-dir "transcripts/BK" --save-dir "xml" --filename "The Bank of New York Mellon Corporation, Q2 2024 Earnings Call, Jul 12, 2024.rtf"
 python upstream_pipeline.py --file-dir "transcripts" --save-dir "xml"
+python upstream_pipeline.py --file-dir "transcripts" --save-dir "xml" --workers 4
+python upstream_pipeline.py --file-dir "transcripts" --save-dir "xml" --metrics-dir "metrics"
+python upstream_pipeline.py --file-dir "transcripts" --save-dir "xml" --rebuild sentiment --rebuild summary
 python upstream_pipeline.py --file-dir "xml" --save-dir "xml" --filename "xml\STT-Q1-2024_timestamp.xml"
+python upstream_pipeline.py --file-dir "incoming" --save-dir "xml" --watch
+python upstream_pipeline.py --file-dir "incoming" --save-dir "xml" --watch --add-stock --stock-dir "stock"
 
 
 clean the data base:
@@ -0,0 +1,106 @@
+import os
+import tempfile
+
+# lxml parses, pretty prints and serializes in C; the standard library is the fallback
+try:
+    from lxml import etree as ET
+    LXML = True
+except ImportError:
+    from xml.etree import ElementTree as ET
+    LXML = False
+
+INDENT = "    "
+
+
+def atomic_write(path, data):
+    """Write bytes to a file so that it holds either its old or its new content, never a partial one.
+
+    The data is written to a temporary file in the same folder, flushed to disk and renamed over
+    the target, so a crash or a kill in the middle of a write leaves the previous file intact.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=os.path.splitext(path)[1], dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def to_bytes(root):
+    """Serialize a transcript tree the way it is saved to disk, with the XML declaration."""
+    return ET.tostring(root, encoding="utf-8", xml_declaration=True)
+
+
+def indent(root, space=INDENT):
+    """Pretty print a transcript tree in place, one element per line.
+
+    Whitespace is only added around elements with children, so the text of leaf elements such
+    as <text> is left as it is.
+    """
+    ET.indent(root, space=space)
+    return root
+
+
+def release(element):
+    """Free an element read with iterparse once it has been used.
+
+    Clears its content and, with lxml, also removes the siblings read before it, so reading a
+    transcript only holds the element being processed.
+    """
+    element.clear()
+    if LXML:
+        parent = element.getparent()
+        while element.getprevious() is not None:
+            del parent[0]
+
+
+def iter_sections(source):
+    """Stream the <header> and the body <section> elements of a transcript.
+
+    The file is read with iterparse instead of being parsed into a full tree. Every element is
+    yielded once it is complete and released when the caller asks for the next one, so only one
+    section is held at a time, the largest being the Q&A. Do not keep references to the elements.
+
+    Args:
+        source: path or binary file object of a transcript XML
+
+    Yields:
+        element: the <header>, then every <section> of the <body>, in document order
+    """
+    # lxml can leave out the other elements itself
+    events = ET.iterparse(source, tag=("header", "section")) if LXML else ET.iterparse(source)
+    for _, element in events:
+        if element.tag == "header" or element.tag == "section":
+            yield element
+            release(element)
+
+
+def write_xml(root, path):
+    """Atomically write a transcript tree to path.
+
+    Returns:
+        data: the bytes written
+    """
+    data = to_bytes(root)
+    atomic_write(path, data)
+    return data
+
+
+def remove_tags(root, tags, path=".//text"):
+    """Remove the child elements with the given tags from every element matching path.
+
+    Stages call this before adding their tags, so running a stage again on a file it already
+    tagged replaces its tags instead of appending a second copy.
+    """
+    tags = set(tags)
+    for parent in root.findall(path):
+        for child in list(parent):
+            if child.tag in tags:
+                parent.remove(child)
+    return root